@@ -1,13 +1,33 @@
 import streamlit as st
 from services.query_handler import QueryHandler
+from services.conversation_memory import ConversationMemory
+from services.cache_warmer import CacheWarmer
+from data.storage.corpus_watcher import CorpusWatcher
+from utils.helper import EXAMPLE_QUESTIONS, generate_example_questions
+from utils.tracing import start_trace, span, recent_traces, metrics
+from utils.logging_config import setup_logging
 import os
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
+setup_logging()
+
+
+@st.cache_resource
+def load_query_handler():
+    """Create the query handler once per process, so its index and response cache survive reruns"""
+    handler = QueryHandler()
+    listeners = [handler.invalidate_caches]
+    if os.getenv("CACHE_WARMING", "1") == "1":
+        warmer = CacheWarmer(handler)
+        warmer.start()
+        listeners.append(warmer.wake)
+    # Pick up re-scraped documents and new index versions without a restart
+    if os.getenv("CORPUS_WATCH", "1") == "1" and hasattr(handler.document_store, "reload"):
+        CorpusWatcher(handler.document_store, listeners=listeners).start()
+    return handler
 
-# Initialize the query handler
-query_handler = QueryHandler()
 
 # Set up Streamlit page config
 st.set_page_config(
@@ -26,6 +46,10 @@ This support agent can answer how-to questions about Customer Data Platforms (CD
 - Zeotap
 """)
 
+# Initialize the query handler once the page header is shown (only the first session waits for the index)
+with st.spinner("Loading the documentation index..."):
+    query_handler = load_query_handler()
+
 # Sidebar for CDP selection
 st.sidebar.title("Settings")
 cdp_options = ["All CDPs", "Segment", "mParticle", "Lytics", "Zeotap"]
@@ -34,12 +58,14 @@ selected_cdp = st.sidebar.selectbox("Focus on specific CDP:", cdp_options)
 # Query type selection
 query_type = st.sidebar.radio(
     "Query Type:",
-    ["How-to Question", "Cross-CDP Comparison", "Advanced Configuration"]
+    ["Auto-detect", "How-to Question", "Cross-CDP Comparison", "Advanced Configuration"]
 )
 
 # Information about query types
 with st.sidebar.expander("Query Type Information"):
     st.markdown("""
+    **Auto-detect**: Pick the query type from the question's wording.
+    
     **How-to Question**: Basic instructions for using CDP features.
     
     **Cross-CDP Comparison**: Compare functionality between different CDPs.
@@ -47,55 +73,50 @@ with st.sidebar.expander("Query Type Information"):
     **Advanced Configuration**: Complex setup and integration questions.
     """)
 
-# Example questions based on query type
-example_questions = {
-    "How-to Question": [
-        "How do I set up a new source in Segment?",
-        "How can I create a user profile in mParticle?",
-        "How do I build an audience segment in Lytics?",
-        "How can I integrate my data with Zeotap?"
-    ],
-    "Cross-CDP Comparison": [
-        "How does Segment's audience creation process compare to Lytics'?",
-        "What are the differences between mParticle and Zeotap data collection?",
-        "Compare user identification methods across all CDPs",
-        "Which CDP has better data export capabilities?"
-    ],
-    "Advanced Configuration": [
-        "How to implement server-side tracking in Segment?",
-        "Advanced custom attribute mapping in mParticle?",
-        "Setting up real-time personalization with Lytics?",
-        "Configure multi-channel identity resolution in Zeotap?"
-    ]
-}
-
-# Display example questions
+# Example questions based on query type (answered ahead of time by the cache warmer)
+if selected_cdp != "All CDPs":
+    example_questions = generate_example_questions(selected_cdp)
+else:
+    example_questions = EXAMPLE_QUESTIONS
+
+# Display example questions (Auto-detect shows the how-to examples)
 st.sidebar.markdown("### Example Questions")
-for q in example_questions[query_type]:
+example_type = query_type if query_type in example_questions else "How-to Question"
+for q in example_questions[example_type]:
     if st.sidebar.button(q, key=q):
         st.session_state.user_query = q
+        st.session_state.example_type = example_type
 
-# Initialize chat history if it doesn't exist
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+# Initialize conversation memory if it doesn't exist
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory()
+    st.session_state.history_pages = 1
+memory = st.session_state.memory
 
-# Display chat history
-for message in st.session_state.chat_history:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Display only the most recent pages of the chat history
+HISTORY_PAGE_SIZE = 20
+if memory.num_pages(HISTORY_PAGE_SIZE) > st.session_state.history_pages:
+    if st.button("Show earlier messages"):
+        st.session_state.history_pages += 1
+for page in reversed(range(min(st.session_state.history_pages, memory.num_pages(HISTORY_PAGE_SIZE)))):
+    for message in memory.page(page, HISTORY_PAGE_SIZE):
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
 # User input
 if "user_query" not in st.session_state:
     st.session_state.user_query = ""
 
 user_query = st.chat_input("Ask a question about CDP platforms...")
+is_example = False
 if not user_query and st.session_state.user_query:
     user_query = st.session_state.user_query
     st.session_state.user_query = ""
+    is_example = True
 
 if user_query:
     # Add user message to chat history
-    st.session_state.chat_history.append({"role": "user", "content": user_query})
+    memory.add_message("user", user_query)
     
     # Display user message
     with st.chat_message("user"):
@@ -104,15 +125,45 @@ if user_query:
     # Get response from query handler
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
-            response = query_handler.handle_query(
-                user_query, 
-                selected_cdp if selected_cdp != "All CDPs" else None,
-                query_type
-            )
-            st.markdown(response)
+            with start_trace("chat", query=user_query) as trace:
+                response = query_handler.handle_query(
+                    user_query, 
+                    selected_cdp if selected_cdp != "All CDPs" else None,
+                    # Example questions are warmed under their listed type, which routing may not pick
+                    st.session_state.example_type if is_example else
+                    (query_type if query_type != "Auto-detect" else None),
+                    # Example questions are self-contained, so they are answered (from the warm cache) without history
+                    history=None if is_example else memory.history()
+                )
+                with span("render"):
+                    st.markdown(response)
+            # Traces are process-wide, so each session remembers which one is its own
+            st.session_state.last_trace_id = trace.trace_id
     
-    # Add assistant response to chat history
-    st.session_state.chat_history.append({"role": "assistant", "content": response})
+    # Add assistant response to chat history and remember the turn for follow-ups
+    memory.add_message("assistant", response)
+    memory.add_turn(user_query, response)
+
+if st.sidebar.button("Clear conversation"):
+    memory.clear()
+    st.session_state.history_pages = 1
+    st.rerun()
+
+# Optional debug panel with per-stage timings of the last query and process metrics
+if st.sidebar.checkbox("Show debug panel", value=os.getenv("CDP_DEBUG_PANEL") == "1"):
+    with st.sidebar.expander("Debug", expanded=True):
+        trace_id = st.session_state.get("last_trace_id")
+        last_trace = next((t for t in recent_traces() if t.trace_id == trace_id), None)
+        if last_trace is not None:
+            st.markdown(f"**Last query:** {last_trace.duration * 1000:.0f}ms total")
+            st.table([
+                {"stage": s["name"], "start (ms)": round(s["offset_ms"], 1), "duration (ms)": round(s["duration_ms"], 1)}
+                for s in last_trace.spans
+            ])
+            st.json(last_trace.attributes)
+        else:
+            st.markdown("No recent traced query in this session.")
+        st.code(metrics.export_prometheus(), language="text")
 
 # Footer
 st.markdown("---")
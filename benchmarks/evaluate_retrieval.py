@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+from benchmarks.retrieval_benchmark import get_git_commit, percentiles
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+GOLDEN_QUERIES_FILE = os.path.join(os.path.dirname(__file__), "golden_queries.json")
+
+
+def load_golden_queries(path=GOLDEN_QUERIES_FILE):
+    """
+    Load the golden query set
+
+    Args:
+        path (str): JSON file of ``{"question", "cdp", "expected_urls"}`` entries
+
+    Returns:
+        list: List of golden query dictionaries
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_mock_corpus(data_dir):
+    """
+    Write the scrapers' mock documents as a corpus the golden set refers to
+
+    Args:
+        data_dir (str): Directory to write ``<cdp>_docs.json`` files to
+    """
+    from data.processors.segment_scraper import SegmentScraper
+    from data.processors.mparticle_scraper import MParticleScraper
+
+    os.makedirs(data_dir, exist_ok=True)
+    for cdp, documents in (("segment", SegmentScraper.get_mock_data()),
+                           ("mparticle", MParticleScraper.get_mock_data())):
+        with open(os.path.join(data_dir, f"{cdp}_docs.json"), "w", encoding="utf-8") as f:
+            json.dump(documents, f)
+
+
+def score_query(retrieved_urls, expected_urls, k):
+    """
+    Compute recall@k and reciprocal rank for one query
+
+    Args:
+        retrieved_urls (list): Ranked URLs returned by retrieval
+        expected_urls (list): URLs that should be retrieved
+        k (int): Cut-off rank
+
+    Returns:
+        tuple: (recall@k, reciprocal rank)
+    """
+    expected = set(expected_urls)
+    hits = len(expected.intersection(retrieved_urls[:k]))
+    recall = hits / len(expected) if expected else 0.0
+
+    reciprocal_rank = 0.0
+    for rank, url in enumerate(retrieved_urls, 1):
+        if url in expected:
+            reciprocal_rank = 1.0 / rank
+            break
+    return recall, reciprocal_rank
+
+
+def evaluate(handler, golden_queries, strategies, k=5, repeat=3):
+    """
+    Run every strategy over the golden set
+
+    Args:
+        handler (QueryHandler): Handler whose retrieval strategies are evaluated
+        golden_queries (list): Golden query dictionaries
+        strategies (list): Strategy names to evaluate
+        k (int): Number of documents retrieved per query
+        repeat (int): Times each query is timed; the fastest run is kept
+
+    Returns:
+        dict: Summary and per-query results for each strategy
+    """
+    report = {}
+    for strategy in strategies:
+        per_query = []
+        latencies = []
+        for golden in golden_queries:
+            best = None
+            documents = []
+            for _ in range(max(1, repeat)):
+                start = time.perf_counter()
+                documents = handler._find_relevant_documents(golden["question"], golden["cdp"], limit=k,
+                                                             strategy=strategy)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            latencies.append(best)
+
+            retrieved_urls = [doc.get("url", "") for doc in documents]
+            recall, reciprocal_rank = score_query(retrieved_urls, golden["expected_urls"], k)
+            per_query.append({
+                "question": golden["question"],
+                "cdp": golden["cdp"],
+                "recall": recall,
+                "reciprocal_rank": reciprocal_rank,
+                "latency_ms": best * 1000,
+                "retrieved_urls": retrieved_urls,
+            })
+
+        count = max(len(per_query), 1)
+        report[strategy] = {
+            f"recall@{k}": sum(q["recall"] for q in per_query) / count,
+            "mrr": sum(q["reciprocal_rank"] for q in per_query) / count,
+            "latency": percentiles(latencies),
+            "queries": per_query,
+        }
+    return report
+
+
+def format_report(report, k):
+    """Render the strategy summary as a plain-text table"""
+    lines = [f"{'strategy':<16}{f'recall@{k}':>10}{'MRR':>8}{'p50 ms':>10}{'p95 ms':>10}"]
+    for strategy, result in report.items():
+        latency = result["latency"]
+        lines.append(f"{strategy:<16}{result[f'recall@{k}']:>10.3f}{result['mrr']:>8.3f}"
+                     f"{latency.get('p50_ms', 0):>10.3f}{latency.get('p95_ms', 0):>10.3f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from data.storage.document_store import create_document_store
+    from services.query_handler import QueryHandler
+    from services.gemini_service import GeminiService
+    from services.llm_backend import FakeLLMBackend
+
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency on the golden query set")
+    parser.add_argument("--golden", type=str, default=GOLDEN_QUERIES_FILE, help="Golden query JSON file")
+    parser.add_argument("--corpus-dir", type=str,
+                        help="Directory of <cdp>_docs.json files (defaults to the scrapers' mock documents)")
+    parser.add_argument("--strategies", type=str, nargs="+",
+                        help="Strategies to evaluate (defaults to all registered strategies)")
+    parser.add_argument("--backend", type=str, default="memory", choices=["memory", "sqlite"],
+                        help="Document store backend")
+    parser.add_argument("-k", type=int, default=3, help="Number of documents retrieved per query")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query")
+    parser.add_argument("--output", type=str, help="Write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    golden_queries = load_golden_queries(args.golden)
+    strategies = args.strategies or list(QueryHandler.RETRIEVAL_STRATEGIES)
+
+    data_dir = args.corpus_dir
+    if not data_dir:
+        data_dir = tempfile.mkdtemp(prefix="cdp_eval_")
+        write_mock_corpus(data_dir)
+    try:
+        store = create_document_store(args.backend, data_dir=data_dir)
+        # Without the retrieval cache, so repeated runs time the search instead of cache hits
+        gemini_service = GeminiService(backend=FakeLLMBackend(latency_ms=0))
+        handler = QueryHandler(gemini_service=gemini_service, document_store=store, retrieval_cache_size=0)
+        report = evaluate(handler, golden_queries, strategies, k=args.k, repeat=args.repeat)
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(format_report(report, args.k))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"commit": get_git_commit(), "backend": args.backend, "k": args.k, "strategies": report},
+                      f, indent=2)
+        logger.info(f"Saved evaluation report to {args.output}")
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
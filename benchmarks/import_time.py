@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import subprocess
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points and the modules they start from
+DEFAULT_MODULES = [
+    "data.storage.document_store",
+    "services.query_handler",
+    "services.cache_warmer",
+    "data.storage.corpus_watcher",
+    "services.http_api",
+    "data.processors.segment_scraper",
+    "data.storage.build_index",
+]
+
+# Third-party packages worth calling out when an import pulls them in
+HEAVY_PACKAGES = ("google", "grpc", "streamlit", "bs4", "requests", "aiohttp", "zstandard", "numpy", "pandas",
+                  "faiss", "chromadb", "langchain")
+
+# Packages a module must not load at import time (checked with --check)
+FORBIDDEN_IMPORTS = {
+    "data.storage.document_store": ("google", "streamlit", "bs4", "requests", "aiohttp", "zstandard"),
+    "services.query_handler": ("google", "streamlit", "bs4", "requests", "aiohttp"),
+    "data.processors.segment_scraper": ("google", "streamlit", "bs4", "requests"),
+}
+
+
+def parse_importtime(stderr):
+    """
+    Parse the output of ``python -X importtime``
+
+    Args:
+        stderr (str): The interpreter's stderr
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds, depth) in the order the imports finished
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return entries
+
+
+def measure_import(module, repeat=3, python=None):
+    """
+    Import a module in fresh interpreters and break down the time by imported module
+
+    Args:
+        module (str): Dotted module name
+        repeat (int): Interpreters to run; the fastest run is reported
+        python (str, optional): Interpreter to run; defaults to this one
+
+    Returns:
+        dict: Wall time, import time, the slowest imports and the heavy packages loaded,
+            or an error if the import failed
+    """
+    best = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = subprocess.run([python or sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=REPO_ROOT, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            return {"module": module, "error": result.stderr.strip().splitlines()[-1]}
+        entries = parse_importtime(result.stderr)
+        total = next((cumulative for name, _, cumulative, depth in reversed(entries)
+                      if name == module and depth == 0), sum(e[1] for e in entries))
+        if best is None or total < best["import_ms"] * 1000:
+            best = {"module": module, "wall_ms": wall * 1000, "import_ms": total / 1000, "entries": entries}
+
+    entries = best.pop("entries")
+    heavy = {}
+    for name, _, cumulative, _ in entries:
+        package = name.split(".")[0]
+        # The package's own line comes last and includes its submodules
+        if package in HEAVY_PACKAGES and name == package:
+            heavy[package] = cumulative / 1000
+    best["modules_loaded"] = len(entries)
+    best["slowest"] = [{"module": name, "self_ms": self_us / 1000, "cumulative_ms": cumulative / 1000}
+                       for name, self_us, cumulative, _ in sorted(entries, key=lambda e: -e[1])[:10]]
+    best["heavy_packages"] = heavy
+    return best
+
+
+def main(argv=None):
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Report import time of the app's modules (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="Modules to import")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh interpreters per module (fastest is kept)")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if a module loads a package listed in FORBIDDEN_IMPORTS")
+    parser.add_argument("--output", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    report = []
+    violations = []
+    for module in args.modules:
+        result = measure_import(module, repeat=args.repeat)
+        report.append(result)
+        if "error" in result:
+            logger.warning(f"{module}: import failed ({result['error']})")
+            continue
+
+        heavy = ", ".join(f"{name} {ms:.0f}ms" for name, ms in result["heavy_packages"].items()) or "none"
+        logger.info(f"{module}: {result['import_ms']:.1f}ms import, {result['wall_ms']:.0f}ms with interpreter "
+                    f"startup, {result['modules_loaded']} modules; heavy packages: {heavy}")
+        for entry in result["slowest"][:5]:
+            logger.info(f"    {entry['self_ms']:8.1f}ms self {entry['cumulative_ms']:8.1f}ms cumulative  "
+                        f"{entry['module']}")
+        for package in FORBIDDEN_IMPORTS.get(module, ()):
+            if package in result["heavy_packages"]:
+                violations.append(f"{module} imports {package}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved import time report to {args.output}")
+
+    for violation in violations:
+        logger.error(f"Eager import: {violation}")
+    if args.check and violations:
+        sys.exit(1)
+    return report
+
+
+if __name__ == "__main__":
+    main()
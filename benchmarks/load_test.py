@@ -0,0 +1,382 @@
+import os
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from benchmarks.retrieval_benchmark import get_git_commit, get_rss_mb, percentiles
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "load_queries.jsonl")
+
+# QueryHandler request outcomes counted in cdp_requests_total
+QUERY_STATUSES = ("ok", "cached", "degraded", "error")
+
+
+def load_queries(path):
+    """
+    Read a query mix
+
+    Args:
+        path (str): JSONL file with one ``{"query": ..., "cdp": ..., "query_type": ...}`` object
+            (or bare query string) per line
+
+    Returns:
+        list: Payloads with the keys query, cdp and query_type
+    """
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"query": item}
+            queries.append({"query": item["query"], "cdp": item.get("cdp"), "query_type": item.get("query_type")})
+    if not queries:
+        raise ValueError(f"No queries in {path}")
+    return queries
+
+
+def read_rss_mb(pid=None):
+    """
+    Return the resident set size of a process in MB
+
+    Args:
+        pid (int, optional): Process to measure (Linux only); defaults to this process
+
+    Returns:
+        float or None: RSS, or None if the process cannot be read
+    """
+    if pid is None:
+        return get_rss_mb()
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+class LocalTarget:
+    """Send queries to a QueryHandler in this process"""
+
+    def __init__(self, query_handler, stream=False):
+        self.query_handler = query_handler
+        self.stream = stream
+
+    def send(self, payload):
+        """
+        Answer one query
+
+        Returns:
+            tuple: (outcome, seconds to the first chunk or None); request errors surface as QueryHandler statuses
+        """
+        start = time.perf_counter()
+        if not self.stream:
+            self.query_handler.handle_query(payload["query"], payload["cdp"], payload["query_type"])
+            return "ok", None
+        first_chunk = None
+        for _ in self.query_handler.stream_query(payload["query"], payload["cdp"], payload["query_type"]):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - start
+        return "ok", first_chunk
+
+
+class HttpTarget:
+    """Send queries to the HTTP API (``services.http_api``)"""
+
+    def __init__(self, url, stream=False, timeout=60.0):
+        self.url = url.rstrip("/") + ("/v1/query/stream" if stream else "/v1/query")
+        self.stream = stream
+        self.timeout = timeout
+
+    def send(self, payload):
+        """
+        Answer one query over HTTP
+
+        Returns:
+            tuple: (outcome, seconds to the first byte or None); the outcome is "ok", "http_<status>"
+                or the name of the connection error
+        """
+        body = json.dumps({name: value for name, value in payload.items() if value is not None}).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read(1)
+                first_byte = time.perf_counter() - start
+                response.read()
+        except urllib.error.HTTPError as e:
+            return f"http_{e.code}", None
+        except (urllib.error.URLError, OSError) as e:
+            return type(getattr(e, "reason", e)).__name__, None
+        return "ok", first_byte if self.stream else None
+
+
+class LoadGenerator:
+    """
+    Replay a query mix against a target and collect latencies
+
+    With ``rps`` set the load is open-loop: queries are sent on a fixed
+    schedule whether or not earlier ones finished, and latency is measured
+    from the scheduled send time, so time spent waiting for a free worker
+    counts (no coordinated omission). Otherwise ``concurrency`` workers
+    each send the next query as soon as their previous one finished.
+    """
+
+    def __init__(self, target, queries, rps=None, concurrency=8, duration=30.0, requests=None, shuffle=False,
+                 seed=0, server_pid=None):
+        """
+        Initialize the generator
+
+        Args:
+            target (LocalTarget or HttpTarget): Where queries are sent
+            queries (list): Payloads from ``load_queries``, replayed in order and repeated as needed
+            rps (float, optional): Target request rate; closed-loop if omitted
+            concurrency (int): Closed-loop workers, or the most requests in flight at the target rate
+            duration (float): Seconds to run (ignored if ``requests`` is set)
+            requests (int, optional): Number of requests to send
+            shuffle (bool): Replay the mix in a seeded random order
+            seed (int): Seed of the shuffle
+            server_pid (int, optional): Process whose memory is sampled; defaults to this process
+        """
+        self.target = target
+        self.queries = list(queries)
+        if shuffle:
+            random.Random(seed).shuffle(self.queries)
+        self.rps = rps
+        self.concurrency = max(1, concurrency)
+        self.duration = duration
+        self.requests = requests
+        self.server_pid = server_pid
+        self.latencies = []
+        self.first_chunks = []
+        self.outcomes = {}
+        self.peak_rss_mb = 0.0
+        self._sent = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def _next_query(self, deadline):
+        """The next payload to send, or None once the run is over"""
+        with self._lock:
+            if self.requests is not None and self._sent >= self.requests:
+                return None
+            if self.requests is None and time.perf_counter() >= deadline:
+                return None
+            payload = self.queries[self._sent % len(self.queries)]
+            self._sent += 1
+            return payload
+
+    def _send(self, payload, scheduled):
+        sent = time.perf_counter()
+        try:
+            outcome, first_chunk = self.target.send(payload)
+        except Exception as e:
+            logger.error(f"Error sending query: {str(e)}")
+            outcome, first_chunk = type(e).__name__, None
+        latency = time.perf_counter() - scheduled
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+            if outcome == "ok":
+                self.latencies.append(latency)
+                if first_chunk is not None:
+                    self.first_chunks.append(sent - scheduled + first_chunk)
+
+    def _closed_loop(self, deadline):
+        def worker():
+            while True:
+                payload = self._next_query(deadline)
+                if payload is None:
+                    return
+                self._send(payload, time.perf_counter())
+
+        threads = [threading.Thread(target=worker, name=f"load-{n}", daemon=True) for n in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _open_loop(self, start, deadline):
+        interval = 1.0 / self.rps
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="load") as executor:
+            n = 0
+            while True:
+                scheduled = start + n * interval
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                payload = self._next_query(deadline)
+                if payload is None:
+                    break
+                executor.submit(self._send, payload, scheduled)
+                n += 1
+
+    def _sample_memory(self):
+        while not self._done.wait(0.5):
+            rss = read_rss_mb(self.server_pid)
+            if rss is not None:
+                self.peak_rss_mb = max(self.peak_rss_mb, rss)
+
+    def run(self):
+        """
+        Run the load test
+
+        Returns:
+            dict: Throughput, latency percentiles, outcome counts and memory
+        """
+        rss_start = read_rss_mb(self.server_pid)
+        self.peak_rss_mb = rss_start or 0.0
+        sampler = threading.Thread(target=self._sample_memory, name="load-memory", daemon=True)
+        sampler.start()
+
+        start = time.perf_counter()
+        deadline = start + self.duration
+        if self.rps:
+            self._open_loop(start, deadline)
+        else:
+            self._closed_loop(deadline)
+        elapsed = time.perf_counter() - start
+        self._done.set()
+        sampler.join()
+
+        total = sum(self.outcomes.values())
+        ok = self.outcomes.get("ok", 0)
+        return {
+            "requests": total,
+            "elapsed_s": elapsed,
+            "throughput_rps": ok / elapsed if elapsed else 0.0,
+            "error_rate": (total - ok) / total if total else 0.0,
+            "outcomes": dict(self.outcomes),
+            "latency": percentiles(self.latencies),
+            "first_chunk": percentiles(self.first_chunks) if self.first_chunks else None,
+            "rss_start_mb": rss_start,
+            "rss_peak_mb": self.peak_rss_mb,
+            "rss_end_mb": read_rss_mb(self.server_pid),
+        }
+
+
+def build_local_handler(args):
+    """Build a QueryHandler with the chosen LLM backend for in-process runs"""
+    from data.storage.document_store import create_document_store
+    from services.admission_control import AdmissionController
+    from services.gemini_service import GeminiService
+    from services.llm_backend import create_backend
+    from services.query_handler import QueryHandler
+
+    options = {}
+    if args.backend == "fake":
+        options = dict(latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate,
+                       output_tokens=args.output_tokens, seed=args.seed)
+    admission = AdmissionController(requests_per_minute=0, tokens_per_minute=0) if args.no_rate_limit else None
+    gemini_service = GeminiService(admission=admission, backend=create_backend(args.backend, **options))
+    document_store = create_document_store(data_dir=args.data_dir) if args.data_dir else None
+    return QueryHandler(gemini_service=gemini_service, document_store=document_store)
+
+
+def main(argv=None):
+    load_dotenv()
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Replay a query mix against QueryHandler or the HTTP API")
+    parser.add_argument("--queries", type=str, default=DEFAULT_QUERIES, help="JSONL query mix")
+    parser.add_argument("--url", type=str, help="HTTP API base URL (e.g. http://127.0.0.1:8080); "
+                                                "in-process QueryHandler if omitted")
+    parser.add_argument("--rps", type=float, help="Open-loop target request rate (closed-loop if omitted)")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Closed-loop workers, or the most requests in flight with --rps")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, help="Requests to send instead of running for --duration")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming path and record time to first chunk")
+    parser.add_argument("--shuffle", action="store_true", help="Replay the mix in a seeded random order")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the shuffle and the fake LLM")
+    parser.add_argument("--server-pid", type=int, help="HTTP server process to sample memory from (Linux)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="HTTP request timeout in seconds")
+    parser.add_argument("--backend", type=str, default="fake", choices=["fake", "gemini"],
+                        help="LLM backend for in-process runs")
+    parser.add_argument("--latency-ms", type=float, help="Fake LLM median latency")
+    parser.add_argument("--latency-sigma", type=float, help="Fake LLM log-normal latency shape")
+    parser.add_argument("--error-rate", type=float, help="Fraction of fake LLM calls that fail")
+    parser.add_argument("--output-tokens", type=int, help="Fake LLM completion tokens per answer")
+    parser.add_argument("--no-rate-limit", action="store_true",
+                        help="Disable the LLM rate limits for in-process runs (the circuit breaker stays on)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the response cache for in-process runs so every query reaches the LLM")
+    parser.add_argument("--data-dir", type=str, help="Corpus directory for in-process runs")
+    parser.add_argument("--output", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    from utils.tracing import REQUESTS, TOKENS_IN, TOKENS_OUT
+
+    if args.url:
+        target = HttpTarget(args.url, stream=args.stream, timeout=args.timeout)
+    else:
+        if args.no_cache:
+            os.environ["RESPONSE_CACHE_SIZE"] = "0"
+        target = LocalTarget(build_local_handler(args), stream=args.stream)
+
+    queries = load_queries(args.queries)
+    before = {status: REQUESTS.value(status=status) for status in QUERY_STATUSES}
+    tokens_before = TOKENS_IN.value(), TOKENS_OUT.value()
+    logger.info(f"Sending {args.requests or f'{args.duration:g}s of'} queries from {len(queries)}-query mix to "
+                f"{args.url or 'in-process QueryHandler'} "
+                f"({f'{args.rps:g} rps' if args.rps else f'{args.concurrency} concurrent'})")
+
+    generator = LoadGenerator(target, queries, rps=args.rps, concurrency=args.concurrency, duration=args.duration,
+                              requests=args.requests, shuffle=args.shuffle, seed=args.seed,
+                              server_pid=args.server_pid)
+    result = generator.run()
+    if not args.url:
+        # handle_query answers errors with an apology instead of raising, so take the outcomes from its metrics
+        result["query_statuses"] = {status: REQUESTS.value(status=status) - before[status]
+                                    for status in QUERY_STATUSES}
+        result["tokens_in"] = TOKENS_IN.value() - tokens_before[0]
+        result["tokens_out"] = TOKENS_OUT.value() - tokens_before[1]
+        failed = result["query_statuses"]["degraded"] + result["query_statuses"]["error"]
+        result["error_rate"] = failed / result["requests"] if result["requests"] else 0.0
+
+    latency = result["latency"]
+    logger.info(f"{result['requests']} requests in {result['elapsed_s']:.1f}s: "
+                f"{result['throughput_rps']:.1f} rps, {result['error_rate']:.1%} errors, "
+                f"p50 {latency.get('p50_ms', 0):.0f}ms, p95 {latency.get('p95_ms', 0):.0f}ms, "
+                f"p99 {latency.get('p99_ms', 0):.0f}ms, peak RSS {result['rss_peak_mb']:.0f}MB")
+    if result["first_chunk"]:
+        logger.info(f"Time to first chunk: p50 {result['first_chunk']['p50_ms']:.0f}ms, "
+                    f"p95 {result['first_chunk']['p95_ms']:.0f}ms")
+    if result.get("query_statuses"):
+        logger.info(f"Query outcomes: {result['query_statuses']}")
+
+    report = {
+        "meta": {
+            "commit": get_git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "target": args.url or "in-process",
+            "mode": f"open-loop {args.rps:g} rps" if args.rps else f"closed-loop {args.concurrency} workers",
+            "queries": args.queries,
+            "stream": args.stream,
+        },
+        "result": result,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Saved load test report to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import subprocess
+from urllib.parse import urlparse
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+CDPS = {
+    "segment": "Segment",
+    "mparticle": "mParticle",
+    "lytics": "Lytics",
+    "zeotap": "Zeotap",
+}
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def get_templates():
+    """
+    Collect document templates from the scrapers' mock data
+
+    Returns:
+        list: List of template document dictionaries
+    """
+    from data.processors.segment_scraper import SegmentScraper
+    from data.processors.mparticle_scraper import MParticleScraper
+
+    return SegmentScraper.get_mock_data() + MParticleScraper.get_mock_data()
+
+
+def generate_corpus(data_dir, size, seed=42):
+    """
+    Write a synthetic CDP-doc corpus as ``<cdp>_docs.json`` files
+
+    Documents are spread evenly across the four CDPs. Each one is a mock
+    template re-branded for its CDP, with a unique URL/title and a few
+    words of vocabulary noise so documents are not identical.
+
+    Args:
+        data_dir (str): Directory to write the corpus to
+        size (int): Total number of documents
+        seed (int): Random seed for reproducible corpora
+
+    Returns:
+        dict: Number of documents written per CDP
+    """
+    rng = random.Random(seed)
+    templates = get_templates()
+    vocabulary = sorted({word for t in templates for word in t["content"].split() if word.isalpha()})
+
+    os.makedirs(data_dir, exist_ok=True)
+    counts = {}
+    for index, (cdp, name) in enumerate(CDPS.items()):
+        count = size // len(CDPS) + (1 if index < size % len(CDPS) else 0)
+        counts[cdp] = count
+
+        # Stream the JSON array so 1M-document corpora don't need to fit in memory twice
+        file_path = os.path.join(data_dir, f"{cdp}_docs.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("[")
+            for n in range(count):
+                template = templates[n % len(templates)]
+                noise = " ".join(rng.choice(vocabulary) for _ in range(20))
+                content = template["content"]
+                for source in ("Segment", "mParticle"):
+                    content = content.replace(source, name)
+                document = {
+                    "title": f"{template['title'].replace(template['source'], name)} ({n})",
+                    "url": f"https://docs.{cdp}.example{urlparse(template['url']).path}{n}",
+                    "content": f"{content}\n{noise}",
+                    "source": name,
+                }
+                if n:
+                    f.write(",")
+                json.dump(document, f)
+            f.write("]")
+    return counts
+
+
+def get_rss_mb():
+    """Return the current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KB on Linux and bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples):
+    """
+    Summarize latency samples
+
+    Args:
+        samples (list): Latencies in seconds
+
+    Returns:
+        dict: Count, mean and p50/p95/p99/max in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": rank(50),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def get_benchmark_queries():
+    """
+    Build the query mix from the generated example questions
+
+    Returns:
+        list: ``(question, cdp)`` pairs, including all-CDP questions
+    """
+    from utils.helper import generate_example_questions
+
+    queries = []
+    for cdp in [None] + list(CDPS):
+        examples = generate_example_questions(CDPS.get(cdp))
+        for questions in examples.values():
+            queries.extend((question, cdp) for question in questions)
+    return queries
+
+
+def run_size(data_dir, size, repeat, backend="memory"):
+    """
+    Benchmark one corpus size (runs in a fresh process for clean memory numbers)
+
+    Args:
+        data_dir (str): Directory holding the generated corpus
+        size (int): Number of documents in the corpus
+        repeat (int): Times to repeat the query mix
+        backend (str): Document store backend ("memory" or "sqlite")
+
+    Returns:
+        dict: Benchmark results for this corpus size
+    """
+    from data.storage.document_store import create_document_store
+    from services.query_handler import QueryHandler
+    from services.gemini_service import GeminiService
+    from services.llm_backend import FakeLLMBackend
+
+    # Runs in a fresh interpreter, which has not configured logging yet
+    setup_logging()
+    logging.getLogger("data.storage.document_store").setLevel(logging.WARNING)
+    logging.getLogger("data.storage.sqlite_store").setLevel(logging.WARNING)
+
+    rss_before = get_rss_mb()
+    start = time.perf_counter()
+    store = create_document_store(backend, data_dir=data_dir)
+    load_time = time.perf_counter() - start
+    rss_after = get_rss_mb()
+
+    # Without the retrieval cache, so repeated runs time the search instead of cache hits
+    # The offline backend needs no API key; only retrieval is timed, so it never answers
+    gemini_service = GeminiService(backend=FakeLLMBackend(latency_ms=0))
+    handler = QueryHandler(gemini_service=gemini_service, document_store=store, retrieval_cache_size=0)
+    queries = get_benchmark_queries()
+
+    search_samples = []
+    find_samples = []
+    context_samples = []
+    for _ in range(repeat):
+        for question, cdp in queries:
+            for keyword in handler.text_processor.extract_keywords(question):
+                start = time.perf_counter()
+                store.search_documents(keyword, cdp)
+                search_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            documents = handler._find_relevant_documents(question, cdp)
+            find_samples.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            handler._create_context(documents, question)
+            context_samples.append(time.perf_counter() - start)
+
+    return {
+        "corpus_size": size,
+        "backend": backend,
+        "load_time_s": load_time,
+        "rss_mb": rss_after,
+        "rss_delta_mb": rss_after - rss_before,
+        "bytes_per_document": (rss_after - rss_before) * 1024 * 1024 / max(size, 1),
+        "search_documents": percentiles(search_samples),
+        "find_relevant_documents": percentiles(find_samples),
+        "create_context": percentiles(context_samples),
+    }
+
+
+def get_git_commit():
+    """Return the current git commit hash, if available"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline):
+    """
+    Log the relative change of key metrics against a baseline result file
+
+    Args:
+        current (dict): Results of this run
+        baseline (dict): Results of a previous run
+    """
+    previous = {r["corpus_size"]: r for r in baseline.get("results", [])}
+    metrics = [
+        ("load_time_s", None),
+        ("rss_delta_mb", None),
+        ("search_documents", "p95_ms"),
+        ("find_relevant_documents", "p95_ms"),
+        ("create_context", "p95_ms"),
+    ]
+    for result in current["results"]:
+        old = previous.get(result["corpus_size"])
+        if not old:
+            continue
+        for metric, field in metrics:
+            new_value = result[metric][field] if field else result[metric]
+            old_value = old[metric][field] if field else old[metric]
+            if old_value:
+                change = (new_value - old_value) / old_value * 100
+                name = f"{metric}.{field}" if field else metric
+                logger.info(f"[{result['corpus_size']} docs] {name}: {old_value:.3f} -> {new_value:.3f} ({change:+.1f}%)")
+
+
+def main(argv=None):
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark document retrieval over synthetic CDP corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Corpus sizes to benchmark (e.g. 1000 10000 100000 1000000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Times to repeat the query mix per size")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for corpus generation")
+    parser.add_argument("--backend", type=str, default="memory", choices=["memory", "sqlite"],
+                        help="Document store backend")
+    parser.add_argument("--output", type=str, default="bench_output.json", help="Output JSON file name")
+    parser.add_argument("--baseline", type=str, help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "commit": get_git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": [],
+    }
+
+    # Each size runs in a fresh interpreter so memory numbers are not polluted by earlier runs
+    context = multiprocessing.get_context("spawn")
+    for size in args.sizes:
+        data_dir = tempfile.mkdtemp(prefix=f"cdp_bench_{size}_")
+        try:
+            logger.info(f"Generating corpus of {size} documents")
+            generate_corpus(data_dir, size, seed=args.seed)
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_size, data_dir, size, args.repeat, args.backend).result()
+            report["results"].append(result)
+            logger.info(f"[{size} docs] load {result['load_time_s']:.2f}s, "
+                        f"rss +{result['rss_delta_mb']:.1f}MB, "
+                        f"search p95 {result['search_documents']['p95_ms']:.2f}ms, "
+                        f"find_relevant_documents p95 {result['find_relevant_documents']['p95_ms']:.2f}ms")
+        finally:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Saved benchmark results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
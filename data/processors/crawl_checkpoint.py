@@ -0,0 +1,157 @@
+import os
+import json
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlCheckpoint:
+    """
+    Persist crawl progress so an interrupted scrape can be resumed.
+
+    The checkpoint is two files:
+    - ``<path>``: JSON with the frontier (pending ``[url, depth]`` entries),
+      the visited set and the emitted-document cursor
+    - ``<path>.docs.jsonl``: documents emitted so far, one per line
+
+    Documents are appended to the JSONL file before the state file is
+    atomically replaced, so the cursor never points past durable documents.
+    Lines beyond the cursor (written just before a crash) are discarded on load.
+    """
+
+    def __init__(self, path, interval=50):
+        """
+        Initialize the checkpoint
+
+        Args:
+            path (str): Path of the checkpoint state file
+            interval (int): Number of visited pages between automatic saves
+        """
+        self.path = path
+        self.documents_path = f"{path}.docs.jsonl"
+        self.interval = max(1, interval)
+        self.frontier = deque()
+        self.visited = set()
+        self.cursor = 0
+        self._pages_since_save = 0
+
+    def exists(self):
+        """Check whether a checkpoint has been written"""
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Load the last checkpoint
+
+        Returns:
+            list: Documents emitted up to the checkpoint cursor
+        """
+        with open(self.path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+
+        self.frontier = deque(tuple(entry) for entry in state.get("frontier", []))
+        self.visited = set(state.get("visited", []))
+        self.cursor = state.get("cursor", 0)
+        self._pages_since_save = 0
+
+        documents = []
+        if os.path.exists(self.documents_path):
+            with open(self.documents_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if len(documents) >= self.cursor:
+                        break
+                    documents.append(json.loads(line))
+
+        if len(documents) < self.cursor:
+            logger.warning(f"Checkpoint expected {self.cursor} documents but found {len(documents)}")
+            self.cursor = len(documents)
+
+        # Drop documents written after the last saved state
+        self._rewrite_documents(documents)
+
+        logger.info(f"Resuming crawl from {self.path}: {len(self.frontier)} pending, "
+                    f"{len(self.visited)} visited, {self.cursor} documents")
+        return documents
+
+    def next_url(self):
+        """Return the next ``(url, depth)`` entry to crawl, or None when done"""
+        while self.frontier:
+            url, depth = self.frontier.popleft()
+            if url not in self.visited:
+                return url, depth
+        return None
+
+    def enqueue(self, urls, depth, front=False):
+        """
+        Add URLs to the frontier
+
+        Args:
+            urls (list): URLs to add
+            depth (int): Crawl depth of the URLs (0 for sections)
+            front (bool): Crawl these URLs before the rest of the frontier
+        """
+        entries = [(url, depth) for url in urls if url not in self.visited]
+        if front:
+            self.frontier.extendleft(reversed(entries))
+        else:
+            self.frontier.extend(entries)
+
+    def mark_visited(self, url, documents):
+        """
+        Record a completed page and save periodically
+
+        Args:
+            url (str): URL that was fully processed
+            documents (list): All documents emitted so far
+        """
+        self.visited.add(url)
+        self._pages_since_save += 1
+        if self._pages_since_save >= self.interval:
+            self.save(documents)
+
+    def save(self, documents):
+        """
+        Write the checkpoint to disk
+
+        Args:
+            documents (list): All documents emitted so far
+        """
+        try:
+            if len(documents) > self.cursor:
+                with open(self.documents_path, "a", encoding="utf-8") as f:
+                    for document in documents[self.cursor:]:
+                        f.write(json.dumps(document, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.cursor = len(documents)
+
+            state = {
+                "frontier": [list(entry) for entry in self.frontier],
+                "visited": sorted(self.visited),
+                "cursor": self.cursor,
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self._pages_since_save = 0
+            logger.info(f"Checkpoint saved: {len(self.visited)} visited, {self.cursor} documents")
+        except OSError as e:
+            logger.error(f"Error saving checkpoint {self.path}: {str(e)}")
+
+    def clear(self):
+        """Remove checkpoint files after a completed crawl"""
+        for path in (self.path, self.documents_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _rewrite_documents(self, documents):
+        """Rewrite the document log so it holds exactly the given documents"""
+        tmp_path = f"{self.documents_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for document in documents:
+                f.write(json.dumps(document, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.documents_path)
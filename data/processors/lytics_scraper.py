@@ -1,44 +1,79 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import time
+import json
 import logging
+import argparse
+import sys
+from data.processors.crawl_checkpoint import CrawlCheckpoint
+from utils.profiling import profiled
+from utils.logging_config import setup_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 class LyticsScraper:
-    def __init__(self):
+    def __init__(self, checkpoint_path="lytics_crawl_checkpoint.json", checkpoint_interval=50):
         self.base_url = "https://docs.lytics.com/"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         self.documents = []
+        self.checkpoint = CrawlCheckpoint(checkpoint_path, checkpoint_interval)
 
-    def scrape(self):
-        """Main method to scrape Lytics documentation"""
+    def scrape(self, resume=False):
+        """
+        Main method to scrape Lytics documentation
+
+        Args:
+            resume (bool): Continue from the last checkpoint instead of the base URL
+
+        Returns:
+            list: List of document dictionaries
+        """
         logger.info("Starting Lytics documentation scraping")
 
+        entry = None
         try:
-            main_page = self._get_page(self.base_url)
-            if not main_page:
-                return []
+            if resume and self.checkpoint.exists():
+                self.documents = self.checkpoint.load()
+            else:
+                self.checkpoint.clear()
+
+                main_page = self._get_page(self.base_url)
+                if not main_page:
+                    return []
 
-            section_links = self._extract_section_links(main_page)
+                section_links = self._extract_section_links(main_page)
+                self.checkpoint.enqueue(section_links, depth=0)
 
-            for section_url in section_links:
+            entry = self.checkpoint.next_url()
+            while entry:
+                emitted = len(self.documents)
+                section_url, _ = entry
                 self._process_section(section_url)
+                self.checkpoint.mark_visited(section_url, self.documents)
                 time.sleep(1)
+                entry = self.checkpoint.next_url()
 
+            self.checkpoint.clear()
             logger.info(f"Completed scraping Lytics documentation. Total documents: {len(self.documents)}")
             return self.documents
         except Exception as e:
             logger.error(f"Error scraping Lytics documentation: {str(e)}")
+            if entry and entry[0] not in self.checkpoint.visited:
+                # next_url() already took the failed page off the frontier; put it back and drop what it
+                # emitted, so a resumed crawl processes it again
+                del self.documents[emitted:]
+                self.checkpoint.enqueue([entry[0]], entry[1], front=True)
+            self.checkpoint.save(self.documents)
             return []
 
     def _get_page(self, url):
         """Get page content with error handling"""
+        # Imported on first fetch, so --help and argument errors return without loading requests and bs4
+        import requests
+        from bs4 import BeautifulSoup
+
         try:
             response = requests.get(url, headers=self.headers)
             response.raise_for_status()
@@ -59,6 +94,7 @@ class LyticsScraper:
                     links.append(full_url)
         return links
 
+    @profiled
     def _process_section(self, section_url):
         """Process a documentation section and its pages"""
         soup = self._get_page(section_url)
@@ -77,6 +113,22 @@ class LyticsScraper:
 
 
 if __name__ == "__main__":
-    scraper = LyticsScraper()
-    docs = scraper.scrape()
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Scrape Lytics documentation")
+    parser.add_argument("--output", type=str, default="lytics_docs.json", help="Output JSON file name")
+    parser.add_argument("--checkpoint", type=str, default="lytics_crawl_checkpoint.json",
+                        help="Checkpoint file used to resume an interrupted crawl")
+    parser.add_argument("--checkpoint-interval", type=int, default=50,
+                        help="Number of pages between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Resume from the last checkpoint")
+    args = parser.parse_args()
+
+    scraper = LyticsScraper(checkpoint_path=args.checkpoint, checkpoint_interval=args.checkpoint_interval)
+    docs = scraper.scrape(resume=args.resume)
+    if not docs:
+        # scrape() returns no documents when the crawl aborts; keep the previous output for --resume to complete
+        logger.error(f"Crawl did not complete; left {args.output} unchanged. Rerun with --resume to continue.")
+        sys.exit(1)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
     logger.info(f"Scraped {len(docs)} documents.")
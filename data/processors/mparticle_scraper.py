@@ -1,49 +1,88 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import time
+import json
 import logging
+import argparse
+import sys
+from data.processors.crawl_checkpoint import CrawlCheckpoint
+from utils.profiling import profiled
+from utils.logging_config import setup_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 class MParticleScraper:
-    def __init__(self):
+    def __init__(self, checkpoint_path="mparticle_crawl_checkpoint.json", checkpoint_interval=50):
         self.base_url = "https://docs.mparticle.com/"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         self.documents = []
+        self.checkpoint = CrawlCheckpoint(checkpoint_path, checkpoint_interval)
 
-    def scrape(self):
-        """Main method to scrape mParticle documentation"""
-        logger.info("Starting mParticle documentation scraping")
+    def scrape(self, resume=False):
+        """
+        Main method to scrape mParticle documentation
 
-        try:
-            # Start with the main documentation page
-            main_page = self._get_page(self.base_url)
-            if not main_page:
-                return []
+        Args:
+            resume (bool): Continue from the last checkpoint instead of the base URL
 
-            # Extract links to main sections
-            section_links = self._extract_section_links(main_page)
+        Returns:
+            list: List of document dictionaries
+        """
+        logger.info("Starting mParticle documentation scraping")
 
-            # Process each section
-            for section_url in section_links:
-                self._process_section(section_url)
-                # Be respectful with rate limiting
-                time.sleep(1)
+        entry = None
+        try:
+            if resume and self.checkpoint.exists():
+                self.documents = self.checkpoint.load()
+            else:
+                self.checkpoint.clear()
+
+                # Start with the main documentation page
+                main_page = self._get_page(self.base_url)
+                if not main_page:
+                    return []
+
+                # Extract links to main sections
+                section_links = self._extract_section_links(main_page)
+                self.checkpoint.enqueue(section_links, depth=0)
+
+            # Process each section; sub-pages are queued ahead of the remaining sections
+            entry = self.checkpoint.next_url()
+            while entry:
+                emitted = len(self.documents)
+                url, depth = entry
+                if depth == 0:
+                    self._process_section(url)
+                    # Be respectful with rate limiting
+                    time.sleep(1)
+                else:
+                    self._process_page(url)
+                    time.sleep(0.5)  # Polite delay
+                self.checkpoint.mark_visited(url, self.documents)
+                entry = self.checkpoint.next_url()
 
+            self.checkpoint.clear()
             logger.info(f"Completed scraping mParticle documentation. Total documents: {len(self.documents)}")
             return self.documents
 
         except Exception as e:
             logger.error(f"Error scraping mParticle documentation: {str(e)}")
+            if entry and entry[0] not in self.checkpoint.visited:
+                # next_url() already took the failed page off the frontier; put it back and drop what it
+                # emitted, so a resumed crawl processes it again
+                del self.documents[emitted:]
+                self.checkpoint.enqueue([entry[0]], entry[1], front=True)
+            self.checkpoint.save(self.documents)
             return []
 
     def _get_page(self, url):
         """Get page content with error handling"""
+        # Imported on first fetch, so get_mock_data() (used by the benchmarks) works without requests and bs4
+        import requests
+        from bs4 import BeautifulSoup
+
         try:
             response = requests.get(url, headers=self.headers)
             response.raise_for_status()
@@ -68,6 +107,7 @@ class MParticleScraper:
                     links.append(full_url)
         return links
 
+    @profiled
     def _process_section(self, section_url):
         """Process a documentation section and its pages"""
         soup = self._get_page(section_url)
@@ -77,13 +117,15 @@ class MParticleScraper:
         # Extract content from current page
         self._extract_page_content(section_url, soup)
 
-        # Find and process sub-pages
+        # Queue sub-pages so they are crawled (and checkpointed) individually
         sub_page_links = self._extract_sub_page_links(soup, section_url)
-        for sub_url in sub_page_links:
-            sub_soup = self._get_page(sub_url)
-            if sub_soup:
-                self._extract_page_content(sub_url, sub_soup)
-                time.sleep(0.5)  # Polite delay
+        self.checkpoint.enqueue(sub_page_links, depth=1, front=True)
+
+    def _process_page(self, url):
+        """Process a single documentation sub-page"""
+        soup = self._get_page(url)
+        if soup:
+            self._extract_page_content(url, soup)
 
     def _extract_sub_page_links(self, soup, parent_url):
         """Extract links to sub-pages from a section page"""
@@ -309,4 +351,26 @@ class MParticleScraper:
                 """,
                 "source": "mParticle",
             }
-        ]
\ No newline at end of file
+        ]
+
+
+if __name__ == "__main__":
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Scrape mParticle documentation")
+    parser.add_argument("--output", type=str, default="mparticle_docs.json", help="Output JSON file name")
+    parser.add_argument("--checkpoint", type=str, default="mparticle_crawl_checkpoint.json",
+                        help="Checkpoint file used to resume an interrupted crawl")
+    parser.add_argument("--checkpoint-interval", type=int, default=50,
+                        help="Number of pages between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Resume from the last checkpoint")
+    args = parser.parse_args()
+
+    scraper = MParticleScraper(checkpoint_path=args.checkpoint, checkpoint_interval=args.checkpoint_interval)
+    docs = scraper.scrape(resume=args.resume)
+    if not docs:
+        # scrape() returns no documents when the crawl aborts; keep the previous output for --resume to complete
+        logger.error(f"Crawl did not complete; left {args.output} unchanged. Rerun with --resume to continue.")
+        sys.exit(1)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(docs, f, ensure_ascii=False)
+    logger.info(f"Scraped {len(docs)} documents.")
@@ -1,7 +1,6 @@
 import re
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -62,6 +61,57 @@ class TextProcessor:
         # Return top keywords
         return [word for word, count in sorted_words[:max_keywords]]
 
+    def extract_keyphrases(self, text, max_phrases=5, max_words=3):
+        """
+        Extract multi-word keyphrases such as "identity resolution" from text
+
+        Quoted text is kept as a phrase; otherwise the n-grams (two to
+        ``max_words`` words) of runs of content words are used, longest first.
+
+        Args:
+            text (str): Input text
+            max_phrases (int): Maximum keyphrases to extract
+            max_words (int): Maximum words per n-gram
+
+        Returns:
+            list: List of keyphrases
+        """
+        text = text.lower()
+        phrases = [" ".join(re.findall(r'\w+', quoted)) for quoted in re.findall(r'"([^"]*)"', text)]
+        phrases = [phrase for phrase in phrases if " " in phrase]
+
+        # Question and stop words end a run of content words
+        stop_words = {"a", "an", "the", "and", "or", "but", "is", "are", "was", "were",
+                      "be", "been", "being", "in", "on", "at", "to", "for", "with", "by", "about",
+                      "how", "what", "which", "when", "where", "why", "who", "do", "does", "can",
+                      "could", "should", "would", "will", "i", "my", "we", "our", "you", "your",
+                      "it", "its", "this", "that", "of", "from", "into", "vs", "versus"}
+
+        runs = []
+        for chunk in re.split(r'[^\w\s-]', text):
+            run = []
+            for word in re.findall(r'\w+', chunk):
+                if word in stop_words:
+                    if run:
+                        runs.append(run)
+                    run = []
+                else:
+                    run.append(word)
+            if run:
+                runs.append(run)
+
+        ngrams = []
+        for run in runs:
+            for size in range(min(max_words, len(run)), 1, -1):
+                for start in range(len(run) - size + 1):
+                    ngrams.append((size, " ".join(run[start:start + size])))
+        ngrams.sort(key=lambda x: x[0], reverse=True)
+
+        for size, phrase in ngrams:
+            if phrase not in phrases:
+                phrases.append(phrase)
+        return phrases[:max_phrases]
+
     def summarize_text(self, text, max_sentences=3):
         """
         Create a simple summary of text by extracting key sentences
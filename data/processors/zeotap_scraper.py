@@ -1,49 +1,87 @@
-import requests
-from bs4 import BeautifulSoup
 import os
 import time
 import logging
 import json
 import argparse
+import sys
+from data.processors.crawl_checkpoint import CrawlCheckpoint
+from utils.profiling import profiled
+from utils.logging_config import setup_logging
 
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
 
 class ZeotapScraper:
-    def __init__(self, output_file="zeotap_docs.json"):
+    def __init__(self, output_file="zeotap_docs.json", checkpoint_path="zeotap_crawl_checkpoint.json",
+                 checkpoint_interval=50):
         self.base_url = "https://docs.zeotap.com/"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
         }
         self.documents = []
         self.output_file = output_file
+        self.checkpoint = CrawlCheckpoint(checkpoint_path, checkpoint_interval)
 
-    def scrape(self):
-        """Main method to scrape Zeotap documentation."""
-        logger.info("Starting Zeotap documentation scraping.")
+    def scrape(self, resume=False):
+        """
+        Main method to scrape Zeotap documentation.
 
-        try:
-            main_page = self._get_page(self.base_url)
-            if not main_page:
-                return []
+        Args:
+            resume (bool): Continue from the last checkpoint instead of the base URL.
 
-            section_links = self._extract_section_links(main_page)
+        Returns:
+            list: List of document dictionaries.
+        """
+        logger.info("Starting Zeotap documentation scraping.")
 
-            for section_url in section_links:
-                self._process_section(section_url)
-                time.sleep(1)  # Polite delay
+        entry = None
+        try:
+            if resume and self.checkpoint.exists():
+                self.documents = self.checkpoint.load()
+            else:
+                self.checkpoint.clear()
+
+                main_page = self._get_page(self.base_url)
+                if not main_page:
+                    return []
+
+                section_links = self._extract_section_links(main_page)
+                self.checkpoint.enqueue(section_links, depth=0)
+
+            entry = self.checkpoint.next_url()
+            while entry:
+                emitted = len(self.documents)
+                url, depth = entry
+                if depth == 0:
+                    self._process_section(url)
+                    time.sleep(1)  # Polite delay
+                else:
+                    self._process_page(url)
+                    time.sleep(0.5)
+                self.checkpoint.mark_visited(url, self.documents)
+                entry = self.checkpoint.next_url()
 
             self._save_to_json()
+            self.checkpoint.clear()
             logger.info(f"Completed scraping Zeotap documentation. Total documents: {len(self.documents)}")
             return self.documents
 
         except Exception as e:
             logger.error(f"Error scraping Zeotap documentation: {str(e)}")
+            if entry and entry[0] not in self.checkpoint.visited:
+                # next_url() already took the failed page off the frontier; put it back and drop what it
+                # emitted, so a resumed crawl processes it again
+                del self.documents[emitted:]
+                self.checkpoint.enqueue([entry[0]], entry[1], front=True)
+            self.checkpoint.save(self.documents)
             return []
 
     def _get_page(self, url):
         """Fetch page content with error handling."""
+        # Imported on first fetch; parsing the command line and resuming from a checkpoint need neither
+        import requests
+        from bs4 import BeautifulSoup
+
         try:
             response = requests.get(url, headers=self.headers)
             response.raise_for_status()
@@ -64,6 +102,7 @@ class ZeotapScraper:
                     links.append(full_url)
         return links
 
+    @profiled
     def _process_section(self, section_url):
         """Process a documentation section and its pages."""
         soup = self._get_page(section_url)
@@ -73,11 +112,13 @@ class ZeotapScraper:
         self._extract_page_content(section_url, soup)
 
         sub_page_links = self._extract_sub_page_links(soup, section_url)
-        for sub_url in sub_page_links:
-            sub_soup = self._get_page(sub_url)
-            if sub_soup:
-                self._extract_page_content(sub_url, sub_soup)
-                time.sleep(0.5)
+        self.checkpoint.enqueue(sub_page_links, depth=1, front=True)
+
+    def _process_page(self, url):
+        """Process a single documentation sub-page."""
+        soup = self._get_page(url)
+        if soup:
+            self._extract_page_content(url, soup)
 
     def _extract_sub_page_links(self, soup, parent_url):
         """Extract links to sub-pages from a section page."""
@@ -129,16 +170,27 @@ class ZeotapScraper:
         """Save extracted documents to a JSON file."""
         try:
             with open(self.output_file, "w", encoding="utf-8") as f:
-                json.dump(self.documents, f, ensure_ascii=False, indent=4)
+                json.dump(self.documents, f, ensure_ascii=False)
             logger.info(f"Saved extracted data to {self.output_file}")
         except Exception as e:
             logger.error(f"Error saving data to {self.output_file}: {str(e)}")
 
 
 if __name__ == "__main__":
+    setup_logging()
     parser = argparse.ArgumentParser(description="Scrape Zeotap documentation")
     parser.add_argument("--output", type=str, default="zeotap_docs.json", help="Output JSON file name")
+    parser.add_argument("--checkpoint", type=str, default="zeotap_crawl_checkpoint.json",
+                        help="Checkpoint file used to resume an interrupted crawl")
+    parser.add_argument("--checkpoint-interval", type=int, default=50,
+                        help="Number of pages between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="Resume from the last checkpoint")
     args = parser.parse_args()
 
-    scraper = ZeotapScraper(output_file=args.output)
-    scraper.scrape()
+    scraper = ZeotapScraper(output_file=args.output, checkpoint_path=args.checkpoint,
+                            checkpoint_interval=args.checkpoint_interval)
+    docs = scraper.scrape(resume=args.resume)
+    if not docs:
+        # scrape() returns no documents when the crawl aborts; keep the previous output for --resume to complete
+        logger.error(f"Crawl did not complete; left {args.output} unchanged. Rerun with --resume to continue.")
+        sys.exit(1)
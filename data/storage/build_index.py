@@ -0,0 +1,379 @@
+import os
+import json
+import pickle
+import shutil
+import hashlib
+import logging
+import argparse
+import zstandard
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from data.storage.document_store import CDPS, DocumentRecord
+from data.storage.inverted_index import InvertedIndex, tokenize, punctuated_words
+from data.storage.content_store import train_dictionary, write_content_store, open_content_store, StoredContent
+from data.processors.text_processor import TextProcessor
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 3
+INDEX_DIR_NAME = "index"
+CURRENT_FILE = "CURRENT"
+DICTIONARY_FILE = "content.dict"
+
+# Content longer than this is summarized ahead of time (QueryHandler summarizes it for the prompt)
+SUMMARY_MIN_LENGTH = 1000
+
+# Documents whose signatures differ in at most this many bits are near-duplicates
+DUPLICATE_DISTANCE = 3
+
+
+def index_root(data_dir):
+    """Directory holding the published index versions of a data directory"""
+    return os.path.join(data_dir, INDEX_DIR_NAME)
+
+
+def current_index_dir(data_dir):
+    """
+    Find the currently published index version
+
+    Args:
+        data_dir (str): Document data directory
+
+    Returns:
+        str or None: Path of the current index version, or None if none was published
+    """
+    root = index_root(data_dir)
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(root, name)
+    return path if name and os.path.isdir(path) else None
+
+
+def read_manifest(index_dir):
+    """Read the manifest of an index version"""
+    with open(os.path.join(index_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_shard(index_dir, cdp):
+    """
+    Load the serving part of one CDP shard
+
+    Document content stays in the shard's compressed content store and is
+    decompressed per document when a record's content is read.
+
+    Args:
+        index_dir (str): Index version directory
+        cdp (str): CDP name
+
+    Returns:
+        tuple: (list of DocumentRecord, InvertedIndex)
+    """
+    with open(os.path.join(index_dir, f"{cdp}.index.pkl"), "rb") as f:
+        shard = pickle.load(f)
+    records = shard["records"]
+
+    store = open_content_store(os.path.join(index_dir, f"{cdp}.content"), os.path.join(index_dir, DICTIONARY_FILE))
+    if store is not None:
+        for position, record in enumerate(records):
+            if store.offsets[position] != store.offsets[position + 1]:
+                record.attach_content(StoredContent(store, position))
+    return records, shard["index"]
+
+
+def source_stamp(path):
+    """Size and modification time of a source file, used to detect a stale index"""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def content_hash(document):
+    """Stable hash of a document's fields"""
+    return hashlib.sha1(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def simhash(tokens):
+    """
+    64-bit SimHash of a token sequence
+
+    Documents with mostly the same words get signatures that differ in few
+    bits, so near-duplicates can be found by Hamming distance.
+
+    Args:
+        tokens (list): Document tokens
+
+    Returns:
+        int: Signature
+    """
+    weights = [0] * 64
+    for token in set(tokens):
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def compute_artifacts(document):
+    """
+    Compute the derived data of one document (runs in a worker process)
+
+    Args:
+        document (dict): Source document
+
+    Returns:
+        dict: Title and content tokens and punctuated words, summary (or None) and dedup signature
+    """
+    title = document.get("title") or ""
+    title_tokens = tokenize(title)
+    content = document.get("content") or ""
+    content_tokens = tokenize(content)
+    summary = None
+    if len(content) > SUMMARY_MIN_LENGTH:
+        summary = TextProcessor().summarize_text(content)
+    return {
+        "title_tokens": title_tokens,
+        "content_tokens": content_tokens,
+        "title_words": punctuated_words(title),
+        "content_words": punctuated_words(content),
+        "summary": summary,
+        "signature": simhash(title_tokens + content_tokens),
+    }
+
+
+def find_duplicates(signatures, max_distance=DUPLICATE_DISTANCE):
+    """
+    Find near-duplicate documents by signature
+
+    Signatures are split into max_distance + 1 bands; two signatures within
+    max_distance bits of each other agree on at least one band, so only
+    documents sharing a band are compared.
+
+    Args:
+        signatures (list): SimHash signatures in document order
+        max_distance (int): Largest Hamming distance counted as a duplicate
+
+    Returns:
+        set: Positions of documents that duplicate an earlier document
+    """
+    bands = max_distance + 1
+    width = 64 // bands
+    mask = (1 << width) - 1
+    buckets = [{} for _ in range(bands)]
+    duplicates = set()
+    for position, signature in enumerate(signatures):
+        keys = [signature >> (band * width) & mask for band in range(bands)]
+        candidates = set()
+        for band, key in enumerate(keys):
+            candidates.update(buckets[band].get(key, ()))
+        if any(bin(signature ^ signatures[other]).count("1") <= max_distance for other in candidates):
+            duplicates.add(position)
+            continue
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(position)
+    return duplicates
+
+
+def write_shard(path, cdp, documents, artifacts, dropped=(), dictionary=None):
+    """
+    Assemble and write one CDP shard (runs in a worker process)
+
+    Records are pickled without their content, which goes to the shard's
+    content store as one dictionary-compressed zstd frame per document.
+
+    Args:
+        path (str): Index version directory being built
+        cdp (str): CDP name
+        documents (list): Source documents in shard order
+        artifacts (list): Their ``compute_artifacts`` results with a "hash" entry added
+        dropped (set): Positions of documents left out of the shard (their artifacts are kept for reuse)
+        dictionary (bytes, optional): zstd dictionary for the content store
+
+    Returns:
+        tuple: (cdp, number of documents in the shard, compressed content bytes)
+    """
+    records = []
+    texts = []
+    index = InvertedIndex()
+    for position, (document, artifact) in enumerate(zip(documents, artifacts)):
+        if position in dropped:
+            continue
+        content = document.get("content")
+        if isinstance(content, str) and content:
+            texts.append(content)
+            document = {**document, "content": None}
+        else:
+            texts.append(None)
+        record = DocumentRecord(None, cdp, document, compress=False)
+        record.summary = artifact["summary"]
+        records.append(record)
+        index.add_tokens(artifact["title_tokens"], artifact["content_tokens"], artifact["title_words"],
+                         artifact["content_words"])
+    index.freeze()
+    content_bytes = write_content_store(os.path.join(path, f"{cdp}.content"), texts, dictionary)
+
+    with open(os.path.join(path, f"{cdp}.index.pkl"), "wb") as f:
+        pickle.dump({"records": records, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Only the builder reads the artifacts back, so they are stored compressed
+    with open(os.path.join(path, f"{cdp}.artifacts.pkl.zst"), "wb") as f:
+        with zstandard.ZstdCompressor(level=3).stream_writer(f) as writer:
+            pickle.dump(artifacts, writer, protocol=pickle.HIGHEST_PROTOCOL)
+    return cdp, len(records), content_bytes
+
+
+def load_previous_artifacts(index_dir):
+    """Per-document artifacts of a published index version, by content hash (none if its format differs)"""
+    previous = {}
+    if index_dir is None or read_manifest(index_dir).get("format") != INDEX_FORMAT:
+        return previous
+    for cdp in CDPS:
+        path = os.path.join(index_dir, f"{cdp}.artifacts.pkl.zst")
+        if os.path.exists(path):
+            with open(path, "rb") as f, zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                for artifact in pickle.load(reader):
+                    previous[artifact["hash"]] = artifact
+    return previous
+
+
+def build_index(data_dir="data/documents", workers=None, dedup=False, keep=3, retrain_dictionary=False):
+    """
+    Build and publish a new index version from the ``<cdp>_docs.json`` files
+
+    Documents whose content hash matches one in the current version reuse
+    its artifacts; the rest are computed in a process pool, and the CDP
+    shards are then assembled in parallel. The version is written to a
+    temporary directory, renamed into place and made current by atomically
+    replacing the CURRENT pointer, so readers only ever see complete versions.
+
+    Args:
+        data_dir (str): Document data directory
+        workers (int, optional): Worker processes; defaults to the CPU count
+        dedup (bool): Drop documents that near-duplicate an earlier document of the same CDP
+        keep (int): Published versions to keep (older ones are deleted)
+        retrain_dictionary (bool): Train a new compression dictionary even if the current version has one
+
+    Returns:
+        dict: Manifest of the published version
+    """
+    root = index_root(data_dir)
+    os.makedirs(root, exist_ok=True)
+    previous_dir = current_index_dir(data_dir)
+    previous = load_previous_artifacts(previous_dir)
+    version = read_manifest(previous_dir)["version"] + 1 if previous_dir else 1
+
+    corpus = {}
+    sources = {}
+    for cdp in CDPS:
+        file_path = os.path.join(data_dir, f"{cdp}_docs.json")
+        if os.path.exists(file_path):
+            with open(file_path, "r") as f:
+                corpus[cdp] = json.load(f)
+            sources[cdp] = source_stamp(file_path)
+        else:
+            corpus[cdp] = []
+
+    hashes = {cdp: [content_hash(document) for document in documents] for cdp, documents in corpus.items()}
+    missing = {}
+    for cdp, documents in corpus.items():
+        for document, digest in zip(documents, hashes[cdp]):
+            if digest not in previous and digest not in missing:
+                missing[digest] = document
+
+    build_dir = os.path.join(root, f".build-{version:04d}-{os.getpid()}")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+    try:
+        # Keep the dictionary stable across incremental builds; train one for a first or forced build
+        dictionary = None
+        previous_dictionary = os.path.join(previous_dir, DICTIONARY_FILE) if previous_dir else None
+        if previous_dictionary and os.path.exists(previous_dictionary) and not retrain_dictionary:
+            with open(previous_dictionary, "rb") as f:
+                dictionary = f.read()
+        else:
+            dictionary = train_dictionary([document.get("content") or "" for documents in corpus.values()
+                                           for document in documents])
+        if dictionary:
+            with open(os.path.join(build_dir, DICTIONARY_FILE), "wb") as f:
+                f.write(dictionary)
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            computed = dict(zip(missing, executor.map(compute_artifacts, missing.values(), chunksize=16)))
+            reused = sum(len(digests) for digests in hashes.values()) - len(computed)
+            logger.info(f"Computed artifacts for {len(computed)} documents, reused {reused}")
+
+            duplicates = {}
+            futures = []
+            for cdp, documents in corpus.items():
+                artifacts = []
+                for digest in hashes[cdp]:
+                    artifact = dict(previous.get(digest) or computed[digest])
+                    artifact["hash"] = digest
+                    artifacts.append(artifact)
+                dropped = set()
+                if dedup:
+                    dropped = find_duplicates([artifact["signature"] for artifact in artifacts])
+                    duplicates[cdp] = len(dropped)
+                futures.append(executor.submit(write_shard, build_dir, cdp, documents, artifacts, dropped,
+                                               dictionary))
+            shards = [future.result() for future in futures]
+            counts = {cdp: count for cdp, count, _ in shards}
+            content_bytes = {cdp: size for cdp, _, size in shards}
+
+        manifest = {
+            "format": INDEX_FORMAT,
+            "version": version,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "documents": counts,
+            "sources": sources,
+            "computed": len(computed),
+            "content_bytes": content_bytes,
+            "dictionary_bytes": len(dictionary or b""),
+            "duplicates_dropped": duplicates,
+        }
+        with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        name = f"v{version:04d}"
+        os.rename(build_dir, os.path.join(root, name))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    pointer = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Published index {name} with {sum(counts.values())} documents")
+
+    _remove_old_versions(root, keep)
+    return manifest
+
+
+def _remove_old_versions(root, keep):
+    """Delete all but the newest ``keep`` published versions"""
+    versions = sorted(name for name in os.listdir(root) if name.startswith("v") and name[1:].isdigit())
+    for name in versions[:-max(1, keep)]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def main(argv=None):
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Build the search index offline and publish it for serving")
+    parser.add_argument("--data-dir", type=str, default="data/documents", help="Directory with <cdp>_docs.json files")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count)")
+    parser.add_argument("--dedup", action="store_true", help="Drop near-duplicate documents within a CDP")
+    parser.add_argument("--keep", type=int, default=3, help="Published index versions to keep")
+    parser.add_argument("--retrain-dictionary", action="store_true",
+                        help="Train a new content compression dictionary instead of reusing the current one")
+    args = parser.parse_args(argv)
+    return build_index(args.data_dir, workers=args.workers, dedup=args.dedup, keep=args.keep,
+                       retrain_dictionary=args.retrain_dictionary)
+
+
+if __name__ == "__main__":
+    main()
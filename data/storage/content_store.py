@@ -0,0 +1,154 @@
+import os
+import mmap
+import logging
+import threading
+from array import array
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL = 12
+
+# Dictionary size; zstd's default of ~110KB suits collections of short, similar documents
+DICTIONARY_SIZE = 112640
+
+# Documents sampled for dictionary training
+MAX_TRAINING_SAMPLES = 20000
+
+
+def train_dictionary(texts, dict_size=DICTIONARY_SIZE):
+    """
+    Train a zstd dictionary over document texts
+
+    Args:
+        texts (list): Sample texts
+        dict_size (int): Target dictionary size in bytes
+
+    Returns:
+        bytes or None: Dictionary, or None if the samples are too few to train one
+    """
+    samples = [text.encode("utf-8") for text in texts[:MAX_TRAINING_SAMPLES] if text]
+    # Training needs the samples to be much larger than the dictionary
+    dict_size = min(dict_size, sum(map(len, samples)) // 10)
+    if len(samples) < 8 or dict_size < 1024:
+        return None
+    try:
+        return zstandard.train_dictionary(dict_size, samples).as_bytes()
+    except zstandard.ZstdError as e:
+        logger.warning(f"Could not train a compression dictionary: {str(e)}")
+        return None
+
+
+def write_content_store(path, texts, dictionary=None, level=COMPRESSION_LEVEL):
+    """
+    Write texts as one zstd frame each, plus an offset table
+
+    Args:
+        path (str): Path prefix; writes ``<path>.zst`` and ``<path>.idx``
+        texts (list): Texts in document order (None for documents without content)
+        dictionary (bytes, optional): Dictionary from ``train_dictionary``
+        level (int): Compression level
+
+    Returns:
+        int: Compressed size in bytes
+    """
+    dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+    compressor = zstandard.ZstdCompressor(level=level, dict_data=dict_data, write_content_size=True)
+    offsets = array("Q", [0])
+    with open(f"{path}.zst", "wb") as f:
+        for text in texts:
+            if text:
+                f.write(compressor.compress(text.encode("utf-8")))
+                offsets.append(f.tell())
+            else:
+                offsets.append(offsets[-1])
+    with open(f"{path}.idx", "wb") as f:
+        offsets.tofile(f)
+    return offsets[-1]
+
+
+class ContentStore:
+    """
+    Read-only store of zstd-compressed document texts with random access
+
+    The frames file is memory-mapped and the offset table is loaded, so
+    reading one document touches only its own frame; nothing else is
+    decompressed. Decompressors are per thread, as zstandard's are not
+    safe to share between threads.
+    """
+
+    def __init__(self, path, dictionary=None):
+        """
+        Open a store written by ``write_content_store``
+
+        Args:
+            path (str): Path prefix of the ``.zst`` and ``.idx`` files
+            dictionary (bytes, optional): Dictionary the store was compressed with
+        """
+        self.path = path
+        self._dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        self.offsets = array("Q")
+        with open(f"{path}.idx", "rb") as f:
+            self.offsets.frombytes(f.read())
+        with open(f"{path}.zst", "rb") as f:
+            # mmap cannot map an empty file
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.offsets[-1] else b""
+        self._local = threading.local()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decompressor(self):
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._dict_data)
+        return decompressor
+
+    def get(self, position):
+        """
+        Decompress one document's text
+
+        Args:
+            position (int): Document position in the store
+
+        Returns:
+            str or None: The text, or None if the document has no content
+        """
+        start, end = self.offsets[position], self.offsets[position + 1]
+        if start == end:
+            return None
+        return self._decompressor().decompress(self._data[start:end]).decode("utf-8")
+
+
+class StoredContent:
+    """Reference to a document's text in a ContentStore, read on access"""
+
+    __slots__ = ("store", "position")
+
+    def __init__(self, store, position):
+        self.store = store
+        self.position = position
+
+    def read(self):
+        """Decompress the referenced text"""
+        return self.store.get(self.position)
+
+
+def open_content_store(path, dictionary_path=None):
+    """
+    Open a content store if it exists
+
+    Args:
+        path (str): Path prefix of the store files
+        dictionary_path (str, optional): File holding the compression dictionary
+
+    Returns:
+        ContentStore or None: The store, or None if it was not written
+    """
+    if not os.path.exists(f"{path}.idx"):
+        return None
+    dictionary = None
+    if dictionary_path and os.path.exists(dictionary_path):
+        with open(dictionary_path, "rb") as f:
+            dictionary = f.read()
+    return ContentStore(path, dictionary)
@@ -0,0 +1,100 @@
+import os
+import logging
+import threading
+from data.storage.document_store import source_stamps
+from data.storage.build_index import index_root, CURRENT_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class CorpusWatcher:
+    """
+    Reload the document store in the background when the corpus changes on disk
+
+    Polls the prebuilt index pointer (``index/CURRENT``) and the
+    ``<cdp>_docs.json`` files. When a new index version is published, or the
+    JSON files change while no prebuilt index is in use, the store loads the
+    new corpus next to the current one and switches to it; queries keep
+    running meanwhile. Listeners are called with the new store version, e.g.
+    to drop cache entries of the old corpus.
+    """
+
+    def __init__(self, document_store, interval=None, listeners=None):
+        """
+        Initialize the watcher
+
+        Args:
+            document_store (DocumentStore): Store to reload
+            interval (float, optional): Seconds between checks; defaults to CORPUS_WATCH_INTERVAL_SECONDS or 5
+            listeners (list, optional): Callables invoked with the new store version after a reload
+        """
+        if interval is None:
+            interval = float(os.getenv("CORPUS_WATCH_INTERVAL_SECONDS", 5))
+        self.document_store = document_store
+        self.interval = interval
+        self.listeners = list(listeners or [])
+        self._stop = threading.Event()
+        self._thread = None
+        self._state = self._read_state()
+
+    def _read_state(self):
+        """Fingerprint of the files the corpus is loaded from"""
+        data_dir = self.document_store.data_dir
+        try:
+            with open(os.path.join(index_root(data_dir), CURRENT_FILE), "r", encoding="utf-8") as f:
+                current = f.read().strip()
+        except FileNotFoundError:
+            current = None
+        return current, source_stamps(data_dir)
+
+    def check(self):
+        """
+        Reload the store if its files changed since the last check
+
+        A prebuilt index, once published and loaded, is the source of truth:
+        changes to the JSON files alone only take effect after ``build_index``
+        publishes them. While the store indexes the JSON files itself (no index
+        published, or one of another format), their changes are reloaded.
+        JSON files the store already serves (written by its own
+        ``save_documents``) are not loaded again; listeners are only notified.
+
+        Returns:
+            bool: True if the store's corpus changed
+        """
+        state = self._read_state()
+        current, sources = state
+        prebuilt = current is not None and getattr(self.document_store, "index_version", None) is not None
+        changed = current != self._state[0] or (not prebuilt and sources != self._state[1])
+        if not changed:
+            return False
+
+        if current == self._state[0] and sources == getattr(self.document_store, "sources", None):
+            version = self.document_store.version
+        else:
+            # A failed reload (e.g. a file caught mid-write) keeps the current corpus and is retried
+            version = self.document_store.reload()
+        self._state = state
+        for listener in self.listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                logger.error(f"Error notifying corpus reload listener: {str(e)}")
+        return True
+
+    def start(self):
+        """Start watching in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="corpus-watcher", daemon=True)
+            self._thread.start()
+            logger.info(f"Watching {self.document_store.data_dir} for corpus changes every {self.interval:g}s")
+
+    def stop(self):
+        """Stop the watching thread"""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error reloading the corpus: {str(e)}")
@@ -1,11 +1,207 @@
 import os
+import sys
+import copy
 import json
+import zlib
+import heapq
+import bisect
 import logging
+import itertools
+import threading
 from pathlib import Path
+from collections.abc import Mapping
+from data.storage.inverted_index import InvertedIndex, parse_query
+from data.storage.sharded_search import ShardedSearchExecutor
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CDPS = ["segment", "mparticle", "lytics", "zeotap"]
+
+
+class DocumentRecord(Mapping):
+    """
+    Compact, read-only document with a dict-like interface
+
+    Fields live in ``__slots__`` instead of a per-document dict, ``source``
+    and ``cdp`` are interned, and every document has an integer ``doc_id``.
+    Search runs on the index, so content is only read for retrieved
+    documents; long content is therefore kept zlib-compressed and
+    decompressed on access. Missing fields are simply absent, so
+    ``doc.get("title", default)`` works as it did with plain dictionaries.
+    ``summary`` holds a precomputed summary of long content when the record
+    comes from a prebuilt index (see ``data.storage.build_index``); such
+    records read their content from the index's zstd content store instead
+    of holding it.
+    """
+
+    __slots__ = ("doc_id", "cdp", "title", "url", "_content", "source", "extra", "summary")
+
+    FIELDS = ("title", "url", "content", "source")
+
+    # Content shorter than this is not worth compressing
+    COMPRESS_MIN_LENGTH = 512
+
+    def __init__(self, doc_id, cdp, document, compress=True):
+        """
+        Initialize the record
+
+        Args:
+            doc_id (int or None): Integer document ID; None until a CorpusSnapshot numbers the record
+            cdp (str): CDP the document belongs to
+            document (dict): Source document dictionary
+            compress (bool): Compress long content (skip for short-lived records)
+        """
+        self.doc_id = doc_id
+        self.cdp = sys.intern(cdp)
+        self.title = document.get("title")
+        self.url = document.get("url")
+        content = document.get("content")
+        if compress and isinstance(content, str) and len(content) >= self.COMPRESS_MIN_LENGTH:
+            content = zlib.compress(content.encode("utf-8"), 1)
+        self._content = content
+        source = document.get("source")
+        self.source = sys.intern(source) if isinstance(source, str) else source
+        extra = {key: value for key, value in document.items() if key not in self.FIELDS}
+        self.extra = extra or None
+        self.summary = None
+
+    @property
+    def content(self):
+        """Document content as a string"""
+        content = self._content
+        if isinstance(content, bytes):
+            return zlib.decompress(content).decode("utf-8")
+        if content is None or isinstance(content, str):
+            return content
+        return content.read()
+
+    def attach_content(self, stored):
+        """
+        Read the content from a content store on access instead of holding it
+
+        Args:
+            stored (StoredContent): Reference to the document's text in a ContentStore
+        """
+        self._content = stored
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            # Check the raw content, so iterating does not decompress it
+            if (self._content if key == "content" else getattr(self, key)) is not None:
+                yield key
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"DocumentRecord(doc_id={self.doc_id}, cdp={self.cdp!r}, url={self.url!r})"
+
+    def to_dict(self):
+        """Return the document as a plain dictionary"""
+        return dict(self)
+
+    def renumbered(self, doc_id):
+        """Return a copy of the record with another doc ID (the content is shared, not copied)"""
+        record = copy.copy(self)
+        record.doc_id = doc_id
+        return record
+
+
+def create_document_store(backend=None, data_dir="data/documents"):
+    """
+    Create the configured document store
+
+    Args:
+        backend (str, optional): "memory" or "sqlite"; defaults to DOCUMENT_STORE_BACKEND or "memory"
+        data_dir (str): Directory to store documents
+
+    Returns:
+        DocumentStore or SQLiteDocumentStore: Store with the same public methods
+    """
+    backend = (backend or os.getenv("DOCUMENT_STORE_BACKEND", "memory")).lower()
+    if backend == "sqlite":
+        from data.storage.sqlite_store import SQLiteDocumentStore
+        return SQLiteDocumentStore(data_dir=data_dir)
+    if backend != "memory":
+        raise ValueError(f"Unknown document store backend: {backend}")
+    return DocumentStore(data_dir=data_dir)
+
+
+def source_stamps(data_dir):
+    """
+    Fingerprint the ``<cdp>_docs.json`` files of a data directory
+
+    Args:
+        data_dir (str): Document data directory
+
+    Returns:
+        dict: (size, modification time in ns) by CDP, for the files that exist
+    """
+    stamps = {}
+    for cdp in CDPS:
+        try:
+            stat = os.stat(os.path.join(data_dir, f"{cdp}_docs.json"))
+        except FileNotFoundError:
+            continue
+        stamps[cdp] = (stat.st_size, stat.st_mtime_ns)
+    return stamps
+
+
+class CorpusSnapshot:
+    """
+    Immutable view of the corpus at one version
+
+    Holds the records and indexes of every CDP partition plus the doc ID
+    offsets of the partitions. The store replaces its snapshot as a whole
+    when the corpus changes, so a query that started on a snapshot finishes
+    on it while new queries see the new one.
+    """
+
+    def __init__(self, documents, indexes, version, index_version=None, sources=None):
+        """
+        Initialize the snapshot and number its documents across CDPs in partition order
+
+        New records are numbered in place. Records of a partition shared with
+        an older snapshot keep their IDs there: if the partition moved, this
+        snapshot gets renumbered copies.
+
+        Args:
+            documents (dict): DocumentRecord lists by CDP
+            indexes (dict): InvertedIndex by CDP
+            version (int): Store version of this corpus
+            index_version (int, optional): Version of the prebuilt index it was loaded from
+            sources (dict, optional): ``source_stamps`` of the JSON files it was indexed from
+        """
+        self.documents = documents
+        self.indexes = indexes
+        self.version = version
+        self.index_version = index_version
+        self.sources = sources
+        self.offsets = []
+        doc_id = 0
+        for cdp in documents:
+            self.offsets.append((doc_id, cdp))
+            records = documents[cdp]
+            first = records[0].doc_id if records else None
+            if first is None:
+                for position, record in enumerate(records):
+                    record.doc_id = doc_id + position
+            elif first != doc_id:
+                documents[cdp] = [record.renumbered(doc_id + position) for position, record in enumerate(records)]
+            doc_id += len(records)
+        self.offset_starts = [offset for offset, _ in self.offsets]
+
 
 class DocumentStore:
     def __init__(self, data_dir="data/documents"):
@@ -17,22 +213,140 @@ class DocumentStore:
         """
         self.data_dir = data_dir
         os.makedirs(self.data_dir, exist_ok=True)
-        self.documents = {}
-        self._load_documents()
+        # Incremented whenever the corpus changes
+        self._versions = itertools.count(1)
+        self._reload_lock = threading.Lock()
+        self.search_executor = ShardedSearchExecutor()
+        self._snapshot = self._load_snapshot(strict=False)
+
+    @property
+    def documents(self):
+        """DocumentRecord lists by CDP of the current snapshot"""
+        return self._snapshot.documents
+
+    @property
+    def indexes(self):
+        """InvertedIndex by CDP of the current snapshot"""
+        return self._snapshot.indexes
+
+    @property
+    def version(self):
+        """Version of the current corpus; changes whenever the corpus changes"""
+        return self._snapshot.version
+
+    @property
+    def index_version(self):
+        """Version of the prebuilt index that was loaded, if any"""
+        return self._snapshot.index_version
+
+    @property
+    def sources(self):
+        """``source_stamps`` of the JSON files the current corpus was indexed from (None for a prebuilt index)"""
+        return self._snapshot.sources
 
-    def _load_documents(self):
-        """Load documents from the data directory"""
+    def _load_snapshot(self, strict=True):
+        """
+        Load the prebuilt index if one was published, otherwise index the documents of the data directory
+
+        Args:
+            strict (bool): Raise on load errors instead of serving whatever could be loaded
+
+        Returns:
+            CorpusSnapshot: The loaded corpus
+        """
+        snapshot = self._load_prebuilt_index(strict)
+        if snapshot is not None:
+            return snapshot
+
+        logger.warning("No usable prebuilt index found; indexing documents in process "
+                       "(run `python -m data.storage.build_index` to avoid this)")
+        documents = {cdp: [] for cdp in CDPS}
+        indexes = {cdp: InvertedIndex() for cdp in CDPS}
+        # Taken before reading, so a file changed meanwhile is seen as changed
+        sources = source_stamps(self.data_dir)
         try:
-            for cdp in ["segment", "mparticle", "lytics", "zeotap"]:
+            for cdp in CDPS:
                 file_path = os.path.join(self.data_dir, f"{cdp}_docs.json")
                 if os.path.exists(file_path):
                     with open(file_path, "r") as f:
-                        self.documents[cdp] = json.load(f)
-                    logger.info(f"Loaded {len(self.documents[cdp])} documents for {cdp}")
-                else:
-                    self.documents[cdp] = []
+                        documents[cdp], indexes[cdp] = self._index_documents(cdp, json.load(f))
+                    logger.info(f"Loaded {len(documents[cdp])} documents for {cdp}")
         except Exception as e:
             logger.error(f"Error loading documents: {str(e)}")
+            if strict:
+                raise
+        return CorpusSnapshot(documents, indexes, next(self._versions), sources=sources)
+
+    def _load_prebuilt_index(self, strict=True):
+        """
+        Load the current version published by ``data.storage.build_index``
+
+        Args:
+            strict (bool): Raise if the published index cannot be loaded
+
+        Returns:
+            CorpusSnapshot or None: The loaded corpus, or None if no prebuilt index could be loaded
+        """
+        from data.storage.build_index import INDEX_FORMAT, current_index_dir, read_manifest, load_shard, source_stamp
+
+        index_dir = current_index_dir(self.data_dir)
+        if index_dir is None:
+            return None
+        documents = {cdp: [] for cdp in CDPS}
+        indexes = {cdp: InvertedIndex() for cdp in CDPS}
+        try:
+            manifest = read_manifest(index_dir)
+            if manifest.get("format") != INDEX_FORMAT:
+                # Shards of another layout cannot be unpickled reliably, whatever `strict` says
+                logger.warning(f"Prebuilt index {index_dir} has format {manifest.get('format')}, this version "
+                               f"reads format {INDEX_FORMAT}; run `python -m data.storage.build_index` to rebuild it")
+                return None
+            for cdp in CDPS:
+                if cdp in manifest["documents"]:
+                    documents[cdp], indexes[cdp] = load_shard(index_dir, cdp)
+        except Exception as e:
+            logger.error(f"Error loading prebuilt index {index_dir}: {str(e)}")
+            if strict:
+                raise
+            return None
+
+        index_version = manifest["version"]
+        for cdp in CDPS:
+            file_path = os.path.join(self.data_dir, f"{cdp}_docs.json")
+            if os.path.exists(file_path) and source_stamp(file_path) != manifest["sources"].get(cdp):
+                logger.warning(f"{cdp}_docs.json changed after index version {index_version} was built; "
+                               f"run `python -m data.storage.build_index` to pick up the changes")
+        logger.info(f"Loaded prebuilt index version {index_version} "
+                    f"({sum(len(docs) for docs in documents.values())} documents)")
+        return CorpusSnapshot(documents, indexes, next(self._versions), index_version)
+
+    @staticmethod
+    def _index_documents(cdp, documents):
+        """Convert a CDP's documents to compact records and build their index"""
+        records = [DocumentRecord(None, cdp, document) for document in documents]
+        return records, InvertedIndex.build(records)
+
+    def _swap(self, snapshot):
+        """Publish a new snapshot; queries already running keep the one they started with"""
+        self.search_executor.prepare(snapshot.indexes, snapshot.version,
+                                     sum(len(docs) for docs in snapshot.documents.values()))
+        self._snapshot = snapshot
+
+    def reload(self):
+        """
+        Load the corpus again from the data directory and switch to it
+
+        The new corpus is loaded next to the current one, which keeps serving
+        until the switch; the switch itself is a single reference assignment.
+
+        Returns:
+            int: The new store version
+        """
+        with self._reload_lock:
+            snapshot = self._load_snapshot()
+            self._swap(snapshot)
+        logger.info(f"Switched to store version {snapshot.version}")
+        return snapshot.version
 
     def save_documents(self, cdp, documents):
         """
@@ -43,10 +357,21 @@ class DocumentStore:
             documents (list): List of document dictionaries
         """
         try:
-            self.documents[cdp] = documents
-            file_path = os.path.join(self.data_dir, f"{cdp}_docs.json")
-            with open(file_path, "w") as f:
-                json.dump(documents, f)
+            cdp = cdp.lower()
+            documents = [dict(document) for document in documents]
+            with self._reload_lock:
+                current = self._snapshot
+                records, index = self._index_documents(cdp, documents)
+                file_path = os.path.join(self.data_dir, f"{cdp}_docs.json")
+                with open(file_path, "w") as f:
+                    json.dump(documents, f)
+                # The new snapshot reflects the file just written, so the corpus watcher does not reload it
+                sources = None
+                if current.sources is not None:
+                    sources = {**current.sources, cdp: source_stamps(self.data_dir).get(cdp)}
+                # Copy on write: the other partitions are shared with the current snapshot
+                self._swap(CorpusSnapshot({**current.documents, cdp: records}, {**current.indexes, cdp: index},
+                                          next(self._versions), current.index_version, sources))
             logger.info(f"Saved {len(documents)} documents for {cdp}")
         except Exception as e:
             logger.error(f"Error saving documents: {str(e)}")
@@ -59,46 +384,116 @@ class DocumentStore:
             cdp (str, optional): CDP name
 
         Returns:
-            list: List of document dictionaries
+            list: List of dict-like document records
         """
+        documents = self._snapshot.documents
         if cdp:
-            return self.documents.get(cdp, [])
+            return documents.get(cdp.lower(), [])
         else:
             # Combine all documents
             all_docs = []
-            for docs in self.documents.values():
+            for docs in documents.values():
                 all_docs.extend(docs)
             return all_docs
 
+    def get_document(self, doc_id):
+        """
+        Get a document by its integer ID
+
+        Args:
+            doc_id (int): Document ID
+
+        Returns:
+            DocumentRecord or None: The document, if the ID exists
+        """
+        snapshot = self._snapshot
+        index = bisect.bisect_right(snapshot.offset_starts, doc_id) - 1
+        if index < 0:
+            return None
+        offset, cdp = snapshot.offsets[index]
+        docs = snapshot.documents[cdp]
+        return docs[doc_id - offset] if doc_id - offset < len(docs) else None
+
     def search_documents(self, query, cdp=None, limit=10):
         """
-        Search documents for a query (simple keyword search)
+        Search documents for a query (keyword, phrase and proximity search)
+
+        A document scores 3 if the query occurs in its title and 1 more if it
+        occurs in its content (case-insensitive substring match, so "segment"
+        matches "Segments" but "segment?" only matches the text "segment?").
+        Text in double quotes must occur as a phrase instead, and documents
+        whose content holds all tokens close together rank higher.
 
         Args:
             query (str): Search query
-            cdp (str, optional): CDP name to limit search
+            cdp (str or list, optional): CDP name(s) to limit search
             limit (int, optional): Maximum results to return
 
         Returns:
-            list: List of matching document dictionaries
+            list: List of matching dict-like document records
         """
-        query = query.lower()
-        results = []
+        tokens, phrases = parse_query(query)
+        if not tokens:
+            return []
 
-        docs = self.get_documents(cdp)
+        # The whole search runs on one snapshot, even if the corpus is switched meanwhile
+        snapshot = self._snapshot
+        if isinstance(cdp, str):
+            cdp = [cdp]
+        cdps = [name.lower() for name in cdp] if cdp else list(snapshot.documents)
+        cdps = [name for name in cdps if name in snapshot.indexes]
+        shards = {name: (offset, len(snapshot.documents[name])) for offset, name in snapshot.offsets}
 
-        for doc in docs:
-            score = 0
-            # Check title
-            if query in doc.get("title", "").lower():
-                score += 3
-            # Check content
-            if query in doc.get("content", "").lower():
-                score += 1
+        text = query.lower()
+        if not phrases and [text] != tokens:
+            # Punctuation or several words: the query has to occur verbatim, which needs the document text
+            hits = self._search_verbatim(snapshot, text, tokens, cdps, shards, limit)
+            return [snapshot.documents[name][position] for _, _, name, position in hits]
+
+        # Scatter over the CDP shards and merge their top results (ties keep partition order)
+        hits = self.search_executor.search(snapshot.indexes, shards, snapshot.version, tokens, cdps, limit,
+                                          phrases)
+        return [snapshot.documents[name][position] for _, _, name, position in hits]
+
+    def _search_verbatim(self, snapshot, text, tokens, cdps, shards, limit):
+        """
+        Search for a query that is not a single word, such as "segment's" or "server-side"
+
+        The index answers queries without whitespace from its punctuated
+        words. For other queries it narrows the search to documents with every
+        word token in the field, and the lowercase query is then looked up in
+        their text. In a partition where a token occurs in no term, the query
+        has a typo and the (typo-correcting) token search is used instead.
+
+        Returns:
+            list: Top results as ``(-score, doc_id, cdp, position)``, best first
+        """
+        results = []
+        for name in cdps:
+            index = snapshot.indexes[name]
+            offset = shards[name][0]
+            if not all(index.known(token) for token in tokens):
+                hits = index.top_k(tokens, limit)
+            else:
+                hits = index.search_verbatim(text, limit)
+            if hits is not None:
+                results.extend((-score, offset + position, name, position) for score, position in hits)
+                continue
 
-            if score > 0:
-                results.append((score, doc))
+            documents = snapshot.documents[name]
+            title = index.match(tokens, index.title_postings)
+            content = index.match(tokens, index.content_postings)
+            for position in title | content:
+                record = documents[position]
+                score = 0
+                if position in title and text in (record.get("title") or "").lower():
+                    score += 3
+                if position in content and text in (record.get("content") or "").lower():
+                    score += 1
+                if score:
+                    results.append((-score, offset + position, name, position))
+        return heapq.nsmallest(limit, results)
 
-        # Sort by score and return top results
-        results.sort(reverse=True, key=lambda x: x[0])
-        return [doc for score, doc in results[:limit]]
\ No newline at end of file
+    def close(self):
+        """Release the search worker pool"""
+        self.search_executor.close()
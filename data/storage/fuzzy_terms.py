@@ -0,0 +1,125 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def max_edit_distance(token):
+    """Edits allowed when correcting a token: none for short tokens, one up to 7 characters, two beyond"""
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transpositions)
+
+    Args:
+        a (str): First string
+        b (str): Second string
+        max_distance (int): Stop early once the distance must exceed this
+
+    Returns:
+        int: The distance, or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(term, max_distance):
+    """All strings obtained by deleting up to ``max_distance`` characters from ``term``"""
+    deletes = {term}
+    frontier = {term}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier if len(word) > 1 for i in range(len(word))}
+        deletes |= frontier
+    return deletes
+
+
+class SymmetricDeleteIndex:
+    """
+    Typo-tolerant lookup of vocabulary terms (SymSpell-style symmetric deletes)
+
+    Every term is indexed under the strings obtained by deleting up to
+    ``max_distance`` characters from its first ``prefix_length`` characters.
+    A misspelled token generates its own deletes the same way; terms sharing
+    a delete are the only candidates, and they are verified with the edit
+    distance. A lookup therefore costs a few dozen dictionary probes instead
+    of a distance computation against every term.
+    """
+
+    def __init__(self, terms, max_distance=2, prefix_length=7):
+        """
+        Build the index
+
+        Args:
+            terms (list): Vocabulary; term IDs are list positions
+            max_distance (int): Largest edit distance supported
+            prefix_length (int): Characters of each term the deletes are generated from
+        """
+        self.terms = terms
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.deletes = {}
+        for term_id, term in enumerate(terms):
+            if len(term) < 4 or not term.isalpha():
+                continue
+            for delete in _deletes(term[:prefix_length], max_distance):
+                term_ids = self.deletes.get(delete)
+                if term_ids is None:
+                    self.deletes[delete] = term_id
+                elif isinstance(term_ids, int):
+                    self.deletes[delete] = [term_ids, term_id]
+                else:
+                    term_ids.append(term_id)
+
+    def lookup(self, token, max_distance=None):
+        """
+        Find the closest vocabulary terms to a token
+
+        Args:
+            token (str): Lowercase token
+            max_distance (int, optional): Edit limit; defaults to ``max_edit_distance(token)``
+
+        Returns:
+            list: IDs of the terms at the smallest distance found (empty if none is within the limit)
+        """
+        if max_distance is None:
+            max_distance = max_edit_distance(token)
+        max_distance = min(max_distance, self.max_distance)
+        if max_distance <= 0:
+            return []
+
+        candidates = set()
+        for delete in _deletes(token[:self.prefix_length], max_distance):
+            term_ids = self.deletes.get(delete)
+            if term_ids is None:
+                continue
+            if isinstance(term_ids, int):
+                candidates.add(term_ids)
+            else:
+                candidates.update(term_ids)
+
+        best = []
+        best_distance = max_distance
+        for term_id in candidates:
+            distance = edit_distance(token, self.terms[term_id], best_distance)
+            if distance < best_distance and best:
+                best = []
+            if distance <= best_distance:
+                best_distance = distance
+                best.append(term_id)
+        return sorted(best)
@@ -0,0 +1,566 @@
+import os
+import re
+import heapq
+import bisect
+import logging
+from array import array
+from data.storage.fuzzy_terms import SymmetricDeleteIndex
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+PHRASE_PATTERN = re.compile(r'"([^"]*)"')
+
+
+def tokenize(text):
+    """
+    Split text into lowercase word tokens
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        list: List of tokens
+    """
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def punctuated_words(text):
+    """
+    Find the whitespace-separated words that are not plain word tokens
+
+    A query such as "segment's" or "server-side" matches text that contains
+    it verbatim, which always lies within one of these words.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        list: Distinct lowercase words such as "segment's", "server-side" or "data."
+    """
+    if not text:
+        return []
+    # isalnum() is the fast path of the regex check (\w is alphanumerics plus "_")
+    return list(dict.fromkeys(word for word in text.lower().split()
+                              if not word.isalnum() and not TOKEN_PATTERN.fullmatch(word)))
+
+
+def parse_query(query):
+    """
+    Split a search query into tokens and quoted phrases
+
+    One-letter fragments such as the "s" in "segment's" match almost every
+    term, so they are dropped unless the query has nothing else.
+
+    Args:
+        query (str): Search query; text in double quotes is a phrase
+
+    Returns:
+        tuple: (all query tokens, list of phrases as token tuples)
+    """
+    phrases = []
+    for text in PHRASE_PATTERN.findall(query or ""):
+        phrase = tuple(tokenize(text))
+        if phrase and phrase not in phrases:
+            phrases.append(phrase)
+
+    tokens = tokenize(query)
+    tokens = [token for token in tokens if len(token) > 1] or tokens
+    return tokens, phrases
+
+
+class InvertedIndex:
+    """
+    Positional term-ID postings for the title and content of one document shard
+
+    Terms are assigned integer IDs; each field keeps a sorted, exact-size
+    ``array`` of local document positions per term, plus the token offsets of
+    the term within each of those documents. Query tokens match every vocabulary
+    term that contains them, which keeps the substring semantics of the
+    original keyword search without touching document text at query time.
+    Words with punctuation are indexed whole as well, so queries that must
+    occur verbatim (such as "segment's") are answered from the index too.
+    A token contained in no term is treated as a typo and matches the terms
+    of the closest vocabulary words instead. Phrases and proximity are
+    checked on the token offsets.
+    """
+
+    # Maximum number of memoized token expansions
+    MAX_EXPANSIONS = 10000
+
+    # Correct misspelled tokens (at most 1 edit up to 7 characters, 2 beyond) against the vocabulary
+    FUZZY_MATCHING = os.getenv("FUZZY_MATCHING", "1") == "1"
+
+    # Score added for a phrase found in the title / the content
+    PHRASE_TITLE_BOOST = 3
+    PHRASE_CONTENT_BOOST = 1
+
+    # Multi-token queries whose tokens all occur in a content window of at most
+    # len(tokens) + PROXIMITY_SLACK tokens get up to PROXIMITY_BOOST extra
+    PROXIMITY_SLACK = 8
+    PROXIMITY_BOOST = 2
+
+    def __init__(self):
+        """Initialize an empty index"""
+        self.vocabulary = {}
+        self.terms = []
+        self.title_postings = {}
+        self.content_postings = {}
+        # Per term: (offset starts, token offsets); the offsets of the i-th
+        # document in the postings are offsets[starts[i]:starts[i + 1]]
+        self.title_positions = {}
+        self.content_positions = {}
+        # Document positions by punctuated word (see ``punctuated_words``)
+        self.title_words = {}
+        self.content_words = {}
+        self.num_documents = 0
+        self._vocab_blob = ""
+        self._vocab_offsets = []
+        self._word_blob = ""
+        self._word_offsets = []
+        self._words = []
+        self._expansions = {}
+        self._fuzzy = None
+
+    @classmethod
+    def build(cls, documents):
+        """
+        Build an index over documents
+
+        Args:
+            documents (list): Documents in local position order
+
+        Returns:
+            InvertedIndex: Frozen index
+        """
+        index = cls()
+        for document in documents:
+            index.add(document.get("title", ""), document.get("content", ""))
+        index.freeze()
+        return index
+
+    def add(self, title, content):
+        """
+        Add the next document to the index
+
+        Args:
+            title (str): Document title
+            content (str): Document content
+
+        Returns:
+            int: Local position of the document
+        """
+        return self.add_tokens(tokenize(title), tokenize(content), punctuated_words(title),
+                               punctuated_words(content))
+
+    def add_tokens(self, title_tokens, content_tokens, title_words=(), content_words=()):
+        """
+        Add the next document to the index from its already tokenized fields
+
+        Args:
+            title_tokens (list): Lowercase title tokens (see ``tokenize``)
+            content_tokens (list): Lowercase content tokens
+            title_words (list, optional): Distinct punctuated title words (see ``punctuated_words``)
+            content_words (list, optional): Distinct punctuated content words
+
+        Returns:
+            int: Local position of the document
+        """
+        position = self.num_documents
+        self.num_documents += 1
+        for field_words, words in ((self.title_words, title_words), (self.content_words, content_words)):
+            for word in words:
+                postings = field_words.get(word)
+                if postings is None:
+                    field_words[word] = postings = array("I")
+                postings.append(position)
+        for field_postings, field_positions, tokens in ((self.title_postings, self.title_positions, title_tokens),
+                                                        (self.content_postings, self.content_positions,
+                                                         content_tokens)):
+            term_offsets = {}
+            for offset, term in enumerate(tokens):
+                offsets = term_offsets.get(term)
+                if offsets is None:
+                    term_offsets[term] = offsets = []
+                offsets.append(offset)
+            for term, offsets in term_offsets.items():
+                term_id = self._term_id(term)
+                postings = field_postings.get(term_id)
+                if postings is None:
+                    field_postings[term_id] = postings = array("I")
+                    field_positions[term_id] = (array("I", [0]), array("I"))
+                postings.append(position)
+                starts, data = field_positions[term_id]
+                data.extend(offsets)
+                starts.append(len(data))
+        return position
+
+    def _term_id(self, term):
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            term_id = self.vocabulary[term] = len(self.terms)
+            self.terms.append(term)
+        return term_id
+
+    def freeze(self):
+        """Compact postings and prepare the vocabulary for substring lookups once all documents are added"""
+        # Shards below 64k documents store positions in 2 bytes instead of 4
+        typecode = "H" if self.num_documents <= 0xFFFF else "I"
+        for field_postings in (self.title_postings, self.content_postings):
+            for term_id, postings in field_postings.items():
+                field_postings[term_id] = array(typecode, postings)
+        for field_positions in (self.title_positions, self.content_positions):
+            for term_id, (starts, data) in field_positions.items():
+                field_positions[term_id] = (array("H" if len(data) <= 0xFFFF else "I", starts),
+                                            array("H" if not data or max(data) <= 0xFFFF else "I", data))
+
+        for field_words in (self.title_words, self.content_words):
+            for word, postings in field_words.items():
+                field_words[word] = array(typecode, postings)
+
+        self._vocab_blob, self._vocab_offsets = self._blob(self.terms)
+        self._words = sorted(set(self.title_words) | set(self.content_words))
+        self._word_blob, self._word_offsets = self._blob(self._words)
+        self._expansions = {}
+        self._fuzzy = None
+
+    @staticmethod
+    def _blob(terms):
+        """Join terms for substring lookups; returns (blob, start offset of every term)"""
+        offsets = []
+        position = 0
+        for term in terms:
+            offsets.append(position)
+            position += len(term) + 1
+        return "\n".join(terms), offsets
+
+    @staticmethod
+    def _find(text, blob, offsets):
+        """Indexes of the terms in a ``_blob`` that contain a text, in order"""
+        matches = []
+        for match in re.finditer(re.escape(text), blob):
+            term_id = bisect.bisect_right(offsets, match.start()) - 1
+            if not matches or matches[-1] != term_id:
+                matches.append(term_id)
+        return matches
+
+    def _containing(self, token):
+        """IDs of the vocabulary terms containing a token, in term ID order"""
+        return self._find(token, self._vocab_blob, self._vocab_offsets)
+
+    def correct(self, token):
+        """
+        Find the vocabulary terms closest to a misspelled token
+
+        The symmetric-delete index is built on first use, so indexes that never
+        see a typo (and prebuilt index files) do not pay for it.
+
+        Args:
+            token (str): Lowercase query token
+
+        Returns:
+            list: The closest terms within the edit limit (empty if none)
+        """
+        # Indexes pickled before fuzzy matching existed lack the attribute
+        fuzzy = getattr(self, "_fuzzy", None)
+        if fuzzy is None:
+            fuzzy = self._fuzzy = SymmetricDeleteIndex(self.terms)
+        return [self.terms[term_id] for term_id in fuzzy.lookup(token)]
+
+    def expand(self, token):
+        """
+        Find the IDs of all vocabulary terms containing a token
+
+        If no term contains it, the token is corrected to the closest
+        vocabulary terms, and the terms containing those are returned.
+
+        Args:
+            token (str): Lowercase query token
+
+        Returns:
+            tuple: Matching term IDs
+        """
+        term_ids = self._expansions.get(token)
+        if term_ids is not None:
+            return term_ids
+
+        matches = self._containing(token)
+        if not matches and self.FUZZY_MATCHING:
+            corrections = self.correct(token)
+            if corrections:
+                matches = sorted({term_id for term in corrections for term_id in self._containing(term)})
+                logger.debug(f"Corrected '{token}' to {corrections}")
+        term_ids = tuple(matches)
+
+        if len(self._expansions) >= self.MAX_EXPANSIONS:
+            self._expansions.clear()
+        self._expansions[token] = term_ids
+        return term_ids
+
+    def known(self, token):
+        """True if some vocabulary term contains the token, i.e. ``expand`` did not have to correct it"""
+        term_ids = self.expand(token)
+        # Corrections are only made when no term contains the token
+        return bool(term_ids) and token in self.terms[term_ids[0]]
+
+    def match(self, tokens, field_postings, start=0, stop=None):
+        """
+        Find documents whose field contains every token
+
+        Args:
+            tokens (list): Lowercase query tokens
+            field_postings (dict): ``title_postings`` or ``content_postings``
+            start (int, optional): First local position to consider
+            stop (int, optional): Local position to stop before
+
+        Returns:
+            set: Local positions of matching documents
+        """
+        ranged = start > 0 or (stop is not None and stop < self.num_documents)
+        result = None
+        for token in tokens:
+            positions = set()
+            for term_id in self.expand(token):
+                postings = field_postings.get(term_id)
+                if not postings:
+                    continue
+                if ranged:
+                    # Postings are sorted, so a sub-shard is a contiguous slice
+                    postings = postings[bisect.bisect_left(postings, start):
+                                        bisect.bisect_left(postings, stop if stop is not None else self.num_documents)]
+                positions.update(postings)
+            result = positions if result is None else result & positions
+            if not result:
+                return set()
+        return result or set()
+
+    def search_verbatim(self, text, limit, start=0, stop=None):
+        """
+        Find the best documents for a query that must occur verbatim
+
+        A document scores 3 if its title contains the text and 1 more if its
+        content does, as with ``search`` for a single word. Only texts without
+        whitespace lie within a single word, so others cannot be answered from
+        the index.
+
+        Args:
+            text (str): Lowercase query holding non-word characters, such as "segment's"
+            limit (int): Number of results to return
+            start (int, optional): First local position to consider
+            stop (int, optional): Local position to stop before
+
+        Returns:
+            list or None: ``(score, position)`` pairs, best first (ties by position), or None if
+                the text contains whitespace or the index predates punctuated words
+        """
+        if "_word_blob" not in self.__dict__ or not text or text != "".join(text.split()):
+            return None
+        stop = self.num_documents if stop is None else stop
+        scores = {}
+        for field_words, points in ((self.title_words, 3), (self.content_words, 1)):
+            matched = set()
+            for word_id in self._find(text, self._word_blob, self._word_offsets):
+                postings = field_words.get(self._words[word_id])
+                if postings:
+                    matched.update(postings[bisect.bisect_left(postings, start):bisect.bisect_left(postings, stop)])
+            for position in matched:
+                scores[position] = scores.get(position, 0) + points
+        return heapq.nsmallest(limit, ((score, position) for position, score in scores.items()),
+                               key=lambda hit: (-hit[0], hit[1]))
+
+    def offsets(self, tokens, field_postings, field_positions, position):
+        """
+        Collect the token offsets of each query token in one document field
+
+        Args:
+            tokens (list): Lowercase query tokens
+            field_postings (dict): ``title_postings`` or ``content_postings``
+            field_positions (dict): The matching ``title_positions`` or ``content_positions``
+            position (int): Local document position
+
+        Returns:
+            list: Sorted offsets per token (empty where the token does not occur)
+        """
+        result = []
+        for token in tokens:
+            offsets = []
+            for term_id in self.expand(token):
+                postings = field_postings.get(term_id)
+                if not postings:
+                    continue
+                i = bisect.bisect_left(postings, position)
+                if i < len(postings) and postings[i] == position:
+                    starts, data = field_positions[term_id]
+                    offsets.extend(data[starts[i]:starts[i + 1]])
+            offsets.sort()
+            result.append(offsets)
+        return result
+
+    @staticmethod
+    def contains_phrase(token_offsets):
+        """
+        Check whether consecutive tokens occur at consecutive offsets
+
+        Args:
+            token_offsets (list): Offsets per phrase token, as returned by ``offsets``
+
+        Returns:
+            bool: True if the phrase occurs
+        """
+        if not token_offsets or not all(token_offsets):
+            return False
+        candidates = set(token_offsets[0])
+        for i, offsets in enumerate(token_offsets[1:], 1):
+            candidates &= {offset - i for offset in offsets}
+            if not candidates:
+                return False
+        return True
+
+    @staticmethod
+    def min_span(token_offsets):
+        """
+        Find the smallest window (in tokens) that contains every token
+
+        Args:
+            token_offsets (list): Offsets per token, as returned by ``offsets``
+
+        Returns:
+            int or None: Window length, or None if a token is missing
+        """
+        if not token_offsets or not all(token_offsets):
+            return None
+        events = sorted((offset, i) for i, offsets in enumerate(token_offsets) for offset in offsets)
+        counts = [0] * len(token_offsets)
+        covered = 0
+        best = None
+        left = 0
+        for offset, i in events:
+            if counts[i] == 0:
+                covered += 1
+            counts[i] += 1
+            while covered == len(token_offsets):
+                left_offset, left_token = events[left]
+                span = offset - left_offset + 1
+                if best is None or span < best:
+                    best = span
+                counts[left_token] -= 1
+                if counts[left_token] == 0:
+                    covered -= 1
+                left += 1
+        return best
+
+    def search(self, tokens, start=0, stop=None, phrases=()):
+        """
+        Score documents for a tokenized query
+
+        Every token must occur in the title (3 points) or the content (1 point).
+        Each phrase must occur as consecutive tokens in the title (3 more points)
+        or the content (1 more point), and documents whose content holds all
+        tokens within a short window get a proximity boost.
+
+        Args:
+            tokens (list): Lowercase query tokens
+            start (int, optional): First local position to consider
+            stop (int, optional): Local position to stop before
+            phrases (list, optional): Phrases as token tuples
+
+        Returns:
+            dict: Score by local document position
+        """
+        scores = {}
+        if not tokens:
+            return scores
+        for position in self.match(tokens, self.title_postings, start, stop):
+            scores[position] = 3
+        for position in self.match(tokens, self.content_postings, start, stop):
+            scores[position] = scores.get(position, 0) + 1
+
+        distinct = list(dict.fromkeys(tokens))
+        if not phrases and len(distinct) < 2:
+            return scores
+
+        for position in list(scores):
+            score = self._boost(position, scores[position], distinct, phrases)
+            if score is None:
+                del scores[position]
+            else:
+                scores[position] = score
+        return scores
+
+    def top_k(self, tokens, limit, start=0, stop=None, phrases=()):
+        """
+        Find the best documents for a tokenized query without scoring every match
+
+        Scores are those of ``search``. The field matches give every candidate
+        its base score; phrase and proximity boosts, which need the token
+        offsets, are bounded by their maximum. Candidates are evaluated in
+        order of that upper bound (MaxScore-style), and evaluation stops as
+        soon as no remaining candidate can beat the current k-th result.
+
+        Args:
+            tokens (list): Lowercase query tokens
+            limit (int): Number of results to return
+            start (int, optional): First local position to consider
+            stop (int, optional): Local position to stop before
+            phrases (list, optional): Phrases as token tuples
+
+        Returns:
+            list: ``(score, position)`` pairs, best first (ties by position)
+        """
+        if not tokens or limit <= 0:
+            return []
+        title = self.match(tokens, self.title_postings, start, stop)
+        content = self.match(tokens, self.content_postings, start, stop)
+        distinct = list(dict.fromkeys(tokens))
+        boosted = bool(phrases) or len(distinct) > 1
+
+        # Group candidates by upper bound: the base score plus the largest boosts they could get
+        phrase_bound = self.PHRASE_TITLE_BOOST * len(phrases)
+        proximity_bound = self.PROXIMITY_BOOST if len(distinct) > 1 else 0
+        candidates = {}
+        for position in title | content:
+            base = 3 if position in title else 0
+            bound = base + phrase_bound
+            if position in content:
+                base += 1
+                bound += 1 + proximity_bound
+            candidates.setdefault(bound, []).append((position, base))
+
+        # Min-heap of (score, -position): the root is the current k-th result
+        heap = []
+        for bound in sorted(candidates, reverse=True):
+            if len(heap) >= limit and bound < heap[0][0]:
+                break
+            for position, base in sorted(candidates[bound]):
+                if len(heap) >= limit and (bound, -position) < heap[0]:
+                    # Later candidates have a higher position or a lower bound
+                    break
+                score = self._boost(position, base, distinct, phrases) if boosted else base
+                if score is None:
+                    continue
+                if len(heap) < limit:
+                    heapq.heappush(heap, (score, -position))
+                elif (score, -position) > heap[0]:
+                    heapq.heapreplace(heap, (score, -position))
+        return [(score, -negative) for score, negative in sorted(heap, reverse=True)]
+
+    def _boost(self, position, score, distinct, phrases):
+        """
+        Add the phrase and proximity boosts to a document's base score
+
+        Returns:
+            float or None: The boosted score, or None if a phrase does not occur
+        """
+        for phrase in phrases:
+            if self.contains_phrase(self.offsets(phrase, self.title_postings, self.title_positions, position)):
+                score += self.PHRASE_TITLE_BOOST
+            elif self.contains_phrase(self.offsets(phrase, self.content_postings, self.content_positions, position)):
+                score += self.PHRASE_CONTENT_BOOST
+            else:
+                return None
+
+        if len(distinct) > 1:
+            span = self.min_span(self.offsets(distinct, self.content_postings, self.content_positions, position))
+            if span is not None and span <= len(distinct) + self.PROXIMITY_SLACK:
+                score += self.PROXIMITY_BOOST * len(distinct) / span
+        return score
@@ -0,0 +1,244 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from data.storage.document_store import CDPS, DocumentRecord
+from data.storage.inverted_index import parse_query
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    cdp TEXT NOT NULL,
+    url TEXT,
+    title TEXT,
+    content TEXT,
+    source TEXT,
+    extra TEXT,
+    UNIQUE (cdp, url)
+);
+CREATE INDEX IF NOT EXISTS documents_cdp ON documents (cdp);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    cdp UNINDEXED, title, content,
+    content='documents', content_rowid='id', tokenize='unicode61'
+);
+
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, cdp, title, content) VALUES (new.id, new.cdp, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, cdp, title, content)
+    VALUES ('delete', old.id, old.cdp, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, cdp, title, content)
+    VALUES ('delete', old.id, old.cdp, old.title, old.content);
+    INSERT INTO documents_fts (rowid, cdp, title, content) VALUES (new.id, new.cdp, new.title, new.content);
+END;
+
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# bm25() column weights for (cdp, title, content), mirroring the 3:1 title/content scoring
+BM25_WEIGHTS = (0.0, 3.0, 1.0)
+
+
+class SQLiteDocumentStore:
+    """
+    Disk-resident DocumentStore backed by SQLite FTS5
+
+    Documents live in one table with a ``cdp`` column and an external-content
+    FTS5 index kept in sync by triggers. Searches are ranked with bm25().
+    The database runs in WAL mode so readers are not blocked while
+    ``save_documents`` ingests a batch. Only the standard library is needed.
+    """
+
+    # Rows per executemany() batch when saving documents
+    BATCH_SIZE = 500
+
+    def __init__(self, data_dir="data/documents", db_path=None):
+        """
+        Initialize the document store
+
+        Args:
+            data_dir (str): Directory holding the database (and ``<cdp>_docs.json`` files to import)
+            db_path (str, optional): Database file; defaults to SQLITE_DB_PATH or ``<data_dir>/documents.db``
+        """
+        self.data_dir = data_dir
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.db_path = db_path or os.getenv("SQLITE_DB_PATH") or os.path.join(data_dir, "documents.db")
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        self._import_json_documents()
+
+    def _connection(self):
+        """Return this thread's connection (SQLite connections are not shared across threads)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _import_json_documents(self):
+        """Import ``<cdp>_docs.json`` files for CDPs that have no rows yet"""
+        connection = self._connection()
+        for cdp in CDPS:
+            file_path = os.path.join(self.data_dir, f"{cdp}_docs.json")
+            if not os.path.exists(file_path):
+                continue
+            row = connection.execute("SELECT 1 FROM documents WHERE cdp = ? LIMIT 1", (cdp,)).fetchone()
+            if row is None:
+                try:
+                    with open(file_path, "r") as f:
+                        self.save_documents(cdp, json.load(f))
+                except Exception as e:
+                    logger.error(f"Error importing documents from {file_path}: {str(e)}")
+
+    @property
+    def version(self):
+        """Corpus version, incremented by every save (also visible to other processes)"""
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row["value"] if row else 0
+
+    @staticmethod
+    def _to_record(row):
+        document = json.loads(row["extra"]) if row["extra"] else {}
+        for field in DocumentRecord.FIELDS:
+            if row[field] is not None:
+                document[field] = row[field]
+        return DocumentRecord(row["id"], row["cdp"], document, compress=False)
+
+    def save_documents(self, cdp, documents):
+        """
+        Save documents for a specific CDP
+
+        Documents are upserted by (cdp, url) in batches inside one transaction;
+        documents of the CDP that are not in the new list are removed.
+
+        Args:
+            cdp (str): CDP name
+            documents (list): List of document dictionaries
+        """
+        cdp = cdp.lower()
+        rows = []
+        for document in documents:
+            extra = {key: value for key, value in document.items() if key not in DocumentRecord.FIELDS}
+            rows.append((cdp, document.get("url"), document.get("title"), document.get("content"),
+                         document.get("source"), json.dumps(extra) if extra else None))
+
+        try:
+            with self._write_lock:
+                connection = self._connection()
+                with connection:
+                    connection.execute("CREATE TEMP TABLE IF NOT EXISTS saved_urls (url TEXT PRIMARY KEY)")
+                    connection.execute("DELETE FROM saved_urls")
+                    for start in range(0, len(rows), self.BATCH_SIZE):
+                        batch = rows[start:start + self.BATCH_SIZE]
+                        connection.executemany("""
+                            INSERT INTO documents (cdp, url, title, content, source, extra)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT (cdp, url) DO UPDATE SET
+                                title = excluded.title, content = excluded.content,
+                                source = excluded.source, extra = excluded.extra
+                            WHERE title IS NOT excluded.title OR content IS NOT excluded.content
+                                OR source IS NOT excluded.source OR extra IS NOT excluded.extra
+                        """, batch)
+                        connection.executemany("INSERT OR IGNORE INTO saved_urls (url) VALUES (?)",
+                                               [(row[1],) for row in batch if row[1] is not None])
+                    connection.execute("""
+                        DELETE FROM documents
+                        WHERE cdp = ? AND (url IS NULL OR url NOT IN (SELECT url FROM saved_urls))
+                    """, (cdp,))
+                    # Documents without a URL cannot be upserted, so they are re-inserted
+                    connection.executemany("""
+                        INSERT INTO documents (cdp, url, title, content, source, extra) VALUES (?, ?, ?, ?, ?, ?)
+                    """, [row for row in rows if row[1] is None])
+                    connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            logger.info(f"Saved {len(documents)} documents for {cdp}")
+        except Exception as e:
+            logger.error(f"Error saving documents: {str(e)}")
+
+    def get_documents(self, cdp=None):
+        """
+        Get documents for a specific CDP or all documents
+
+        Args:
+            cdp (str, optional): CDP name
+
+        Returns:
+            list: List of dict-like document records
+        """
+        connection = self._connection()
+        if cdp:
+            rows = connection.execute("SELECT * FROM documents WHERE cdp = ? ORDER BY id", (cdp.lower(),))
+        else:
+            rows = connection.execute("SELECT * FROM documents ORDER BY id")
+        return [self._to_record(row) for row in rows]
+
+    def get_document(self, doc_id):
+        """
+        Get a document by its integer ID
+
+        Args:
+            doc_id (int): Document ID
+
+        Returns:
+            DocumentRecord or None: The document, if the ID exists
+        """
+        row = self._connection().execute("SELECT * FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return self._to_record(row) if row else None
+
+    def search_documents(self, query, cdp=None, limit=10):
+        """
+        Search documents for a query with FTS5, ranked by bm25()
+
+        Every query word must appear as a prefix of a word in the title or content,
+        and text in double quotes must appear as a phrase.
+
+        Args:
+            query (str): Search query
+            cdp (str or list, optional): CDP name(s) to limit search
+            limit (int, optional): Maximum results to return
+
+        Returns:
+            list: List of matching dict-like document records
+        """
+        tokens, phrases = parse_query(query)
+        if not tokens:
+            return []
+
+        terms = [f'"{token}"*' for token in tokens] + [f'"{" ".join(phrase)}"' for phrase in phrases]
+        match = " AND ".join(terms)
+        if isinstance(cdp, str):
+            cdp = [cdp]
+        cdps = [name.lower() for name in cdp] if cdp else []
+        sql = f"""
+            SELECT d.* FROM documents_fts f JOIN documents d ON d.id = f.rowid
+            WHERE documents_fts MATCH ? {f"AND f.cdp IN ({', '.join('?' * len(cdps))})" if cdps else ""}
+            ORDER BY bm25(documents_fts, {", ".join(str(w) for w in BM25_WEIGHTS)}), d.id
+            LIMIT ?
+        """
+        params = (match, *cdps, limit)
+        try:
+            rows = self._connection().execute(sql, params).fetchall()
+        except sqlite3.OperationalError as e:
+            logger.error(f"Error searching documents: {str(e)}")
+            return []
+        return [self._to_record(row) for row in rows]
+
+    def close(self):
+        """Close this thread's database connection"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,271 @@
+import os
+import time
+import logging
+import threading
+from utils.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+# outcome: admitted, queue_full, deadline, circuit_open
+ADMISSIONS = metrics.counter("cdp_llm_admissions_total", "LLM call admission decisions", ["outcome"])
+BREAKER_TRANSITIONS = metrics.counter("cdp_llm_breaker_transitions_total", "Circuit breaker state changes", ["state"])
+
+
+class LLMUnavailableError(Exception):
+    """The LLM cannot serve a call right now (shed by admission control, circuit open, or the call failed)"""
+
+    def __init__(self, reason, message=None):
+        """
+        Initialize the error
+
+        Args:
+            reason (str): Machine-readable reason ("queue_full", "deadline", "circuit_open", "error", "unreadable")
+            message (str, optional): Human-readable detail
+        """
+        super().__init__(message or reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``; a rate of 0 disables the limit"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Initialize the bucket (full)
+
+        Args:
+            rate_per_minute (float): Refill rate
+            capacity (float, optional): Burst size; defaults to one minute of tokens
+        """
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` tokens are available (0 if they are now)"""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        """Remove tokens (call after ``wait_time`` returned 0)"""
+        if self.enabled:
+            self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount):
+        """Return unused tokens, e.g. when a call used fewer tokens than reserved"""
+        if self.enabled and amount > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. Then one probe call is let
+    through (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """
+        Initialize the breaker (closed)
+
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker
+            reset_timeout (float): Seconds the breaker stays open before a probe
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            BREAKER_TRANSITIONS.inc(state=state)
+            logger.warning(f"LLM circuit breaker {state}")
+
+    def is_open(self):
+        """True while calls are rejected without trying"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def allow(self):
+        """
+        Claim permission for one call
+
+        Returns:
+            bool: True if the call may proceed
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+
+
+class AdmissionController:
+    """
+    Admission control for LLM calls
+
+    A call needs one request from the requests-per-minute bucket and its
+    estimated tokens from the tokens-per-minute bucket. Calls that cannot
+    be admitted yet wait in a bounded queue; a call is shed at once when the
+    queue is full or when the wait it would need exceeds its deadline, and
+    while the circuit breaker is open. Shed calls raise LLMUnavailableError.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_queue=None, max_wait=None,
+                 breaker=None):
+        """
+        Initialize the controller
+
+        Args:
+            requests_per_minute (float, optional): Defaults to LLM_RPM or 60 (0 disables)
+            tokens_per_minute (float, optional): Defaults to LLM_TPM or 250000 (0 disables)
+            max_queue (int, optional): Calls allowed to wait; defaults to LLM_MAX_QUEUE or 32
+            max_wait (float, optional): Default deadline in seconds; defaults to LLM_MAX_WAIT_SECONDS or 10
+            breaker (CircuitBreaker, optional): Defaults to one configured from LLM_BREAKER_FAILURES
+                and LLM_BREAKER_RESET_SECONDS
+        """
+        if requests_per_minute is None:
+            requests_per_minute = float(os.getenv("LLM_RPM", 60))
+        if tokens_per_minute is None:
+            tokens_per_minute = float(os.getenv("LLM_TPM", 250000))
+        if max_queue is None:
+            max_queue = int(os.getenv("LLM_MAX_QUEUE", 32))
+        if max_wait is None:
+            max_wait = float(os.getenv("LLM_MAX_WAIT_SECONDS", 10))
+        if breaker is None:
+            breaker = CircuitBreaker(int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+                                     float(os.getenv("LLM_BREAKER_RESET_SECONDS", 30)))
+
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.breaker = breaker
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def _shed(self, reason, message):
+        ADMISSIONS.inc(outcome=reason)
+        raise LLMUnavailableError(reason, message)
+
+    def acquire(self, tokens, timeout=None):
+        """
+        Wait until a call using ``tokens`` tokens may start
+
+        Args:
+            tokens (int): Estimated tokens of the call (prompt plus output)
+            timeout (float, optional): Deadline in seconds; defaults to ``max_wait``
+
+        Raises:
+            LLMUnavailableError: If the call is shed
+        """
+        if self.breaker.is_open():
+            self._shed("circuit_open", "The LLM circuit breaker is open")
+
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        with self._condition:
+            if self.waiting >= self.max_queue:
+                self._shed("queue_full", f"{self.waiting} LLM calls are already waiting")
+            self.waiting += 1
+            try:
+                while True:
+                    wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                    if wait <= 0:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if wait > remaining:
+                        self._shed("deadline", f"Rate limit wait of {wait:.1f}s exceeds the deadline")
+                    self._condition.wait(wait)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            finally:
+                self.waiting -= 1
+
+        if not self.breaker.allow():
+            self.refund(tokens, requests=1)
+            self._shed("circuit_open", "The LLM circuit breaker is open")
+        ADMISSIONS.inc(outcome="admitted")
+
+    def refund(self, tokens, requests=0):
+        """
+        Return unused capacity
+
+        Args:
+            tokens (int): Tokens reserved but not used
+            requests (int): Requests reserved but not made
+        """
+        with self._condition:
+            self.tokens.refund(tokens)
+            self.requests.refund(requests)
+            self._condition.notify_all()
+
+    def has_headroom(self, reserve=0.5):
+        """
+        Check whether a low-priority call may start without crowding out interactive calls
+
+        Args:
+            reserve (float): Fraction of the request budget to leave for interactive calls
+
+        Returns:
+            bool: True if the breaker is closed, no call is waiting and more than
+                ``reserve`` of the request budget is available
+        """
+        if self.breaker.is_open():
+            return False
+        with self._condition:
+            if self.waiting:
+                return False
+            return self.requests.wait_time(self.requests.capacity * reserve + 1) == 0
+
+    def record_success(self):
+        """Report a successful LLM call to the circuit breaker"""
+        self.breaker.record_success()
+
+    def record_failure(self):
+        """Report a failed LLM call to the circuit breaker"""
+        self.breaker.record_failure()
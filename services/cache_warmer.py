@@ -0,0 +1,128 @@
+import os
+import logging
+import threading
+from utils.helper import EXAMPLE_QUESTIONS, generate_example_questions
+from utils.tracing import metrics, start_trace
+
+logger = logging.getLogger(__name__)
+
+# outcome: warmed, failed
+WARMED = metrics.counter("cdp_cache_warm_total", "Example questions answered ahead of time", ["outcome"])
+
+
+def example_questions(cdp_names):
+    """
+    List the example questions offered in the UI
+
+    Args:
+        cdp_names (iterable): CDP display names to generate CDP-specific examples for
+
+    Returns:
+        list: (query, cdp, query_type) tuples, the fixed sidebar examples first
+    """
+    questions = [(query, None, query_type)
+                 for query_type, queries in EXAMPLE_QUESTIONS.items() for query in queries]
+    for cdp in cdp_names:
+        questions.extend((query, cdp, query_type)
+                         for query_type, queries in generate_example_questions(cdp).items() for query in queries)
+    return questions
+
+
+class CacheWarmer:
+    """
+    Answer the example questions in the background so clicking one is instant
+
+    A daemon thread answers every example question that is not in the
+    response cache for the current corpus version: all of them at startup,
+    again after each corpus change (which invalidates the cached answers),
+    and any that failed or were evicted. Warming is low priority: before each
+    LLM call it waits until no interactive call is queued and the rate limit
+    has more than ``reserve`` of its request budget left.
+    """
+
+    def __init__(self, query_handler, questions=None, interval=None, reserve=None):
+        """
+        Initialize the warmer
+
+        Args:
+            query_handler (QueryHandler): Handler whose response cache is warmed
+            questions (list, optional): (query, cdp, query_type) tuples; defaults to the UI examples
+            interval (float, optional): Seconds between checks for stale answers; defaults to
+                CACHE_WARM_INTERVAL_SECONDS or 30
+            reserve (float, optional): Fraction of the LLM request budget left for interactive calls;
+                defaults to CACHE_WARM_RESERVE or 0.5
+        """
+        if interval is None:
+            interval = float(os.getenv("CACHE_WARM_INTERVAL_SECONDS", 30))
+        if reserve is None:
+            reserve = float(os.getenv("CACHE_WARM_RESERVE", 0.5))
+        self.query_handler = query_handler
+        self.questions = questions if questions is not None else example_questions(query_handler.CDP_NAMES.values())
+        self.interval = interval
+        self.reserve = reserve
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start warming in a daemon thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+            self._thread.start()
+            logger.info(f"Cache warmer started for {len(self.questions)} example questions")
+
+    def stop(self):
+        """Stop the warming thread"""
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self, version=None):
+        """Check for stale answers now instead of at the next interval (e.g. right after a corpus reload)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.warm()
+            except Exception as e:
+                logger.error(f"Error warming the response cache: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def warm(self):
+        """
+        Answer every example question whose answer is not cached for the current corpus
+
+        Returns:
+            int: Number of answers added to the cache
+        """
+        warmed = 0
+        if not self.query_handler.response_cache.max_entries:
+            # RESPONSE_CACHE_SIZE=0: answers would be recomputed on every pass and never kept
+            return warmed
+        for query, cdp, query_type in self.questions:
+            if self.query_handler.is_cached(query, cdp, query_type):
+                continue
+            if not self._wait_for_headroom():
+                break
+            with start_trace("warm_cache", query=query, cdp=cdp, query_type=query_type):
+                self.query_handler.handle_query(query, cdp, query_type)
+
+            # Degraded or failed answers are not cached; they are retried on the next pass
+            if self.query_handler.is_cached(query, cdp, query_type):
+                WARMED.inc(outcome="warmed")
+                warmed += 1
+            else:
+                WARMED.inc(outcome="failed")
+
+        if warmed:
+            logger.info(f"Warmed {warmed} example answers")
+        return warmed
+
+    def _wait_for_headroom(self):
+        """Wait until an LLM call would not compete with interactive calls; False if stopped"""
+        admission = getattr(self.query_handler.gemini_service, "admission", None)
+        while admission is not None and not admission.has_headroom(self.reserve):
+            if self._stop.wait(1.0):
+                return False
+        return not self._stop.is_set()
@@ -0,0 +1,145 @@
+import os
+import logging
+from collections import deque
+from data.processors.text_processor import TextProcessor
+from utils.tracing import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationMemory:
+    """
+    Bounded memory of a chat session
+
+    The last ``max_turns`` question/answer pairs are kept verbatim; older
+    turns are folded into a compact running summary (one extractive line
+    per turn, oldest lines dropped once it exceeds ``summary_tokens``).
+    ``history()`` renders both within a token budget, so the prompt size
+    stays flat however long the session runs. The displayed transcript is
+    capped at ``max_messages`` and read page by page.
+    """
+
+    def __init__(self, max_turns=None, max_history_tokens=None, summary_tokens=300, max_messages=500):
+        """
+        Initialize the memory
+
+        Args:
+            max_turns (int, optional): Turns kept verbatim; defaults to CHAT_MEMORY_TURNS or 4
+            max_history_tokens (int, optional): Token budget of ``history()``; defaults to CHAT_HISTORY_TOKENS or 1000
+            summary_tokens (int): Token budget of the running summary
+            max_messages (int): Messages kept for display
+        """
+        if max_turns is None:
+            max_turns = int(os.getenv("CHAT_MEMORY_TURNS", 4))
+        if max_history_tokens is None:
+            max_history_tokens = int(os.getenv("CHAT_HISTORY_TOKENS", 1000))
+        self.max_turns = max(1, max_turns)
+        self.max_history_tokens = max_history_tokens
+        self.summary_tokens = summary_tokens
+        self.turns = deque()
+        self.summary_lines = deque()
+        self.messages = deque(maxlen=max_messages)
+        self.text_processor = TextProcessor()
+
+    def add_message(self, role, content):
+        """
+        Add a message to the displayed transcript only
+
+        Args:
+            role (str): "user" or "assistant"
+            content (str): Message text
+        """
+        self.messages.append({"role": role, "content": content})
+
+    def add_turn(self, question, answer):
+        """
+        Record a completed question/answer turn
+
+        Args:
+            question (str): User question
+            answer (str): Assistant answer
+        """
+        self.turns.append((question, answer))
+        while len(self.turns) > self.max_turns:
+            self._summarize_turn(*self.turns.popleft())
+
+    def _summarize_turn(self, question, answer):
+        """Fold a turn that left the verbatim window into the running summary"""
+        gist = self.text_processor.summarize_text(self.text_processor.clean_text(answer), max_sentences=1)
+        self.summary_lines.append(f"- Q: {self._truncate(question, 40)} A: {self._truncate(gist, 60)}")
+        while len(self.summary_lines) > 1 and estimate_tokens("\n".join(self.summary_lines)) > self.summary_tokens:
+            self.summary_lines.popleft()
+
+    @staticmethod
+    def _truncate(text, max_tokens):
+        """Cut text to roughly ``max_tokens`` tokens"""
+        max_chars = max_tokens * 4
+        return text if len(text) <= max_chars else text[:max_chars - 3].rsplit(" ", 1)[0] + "..."
+
+    @property
+    def summary(self):
+        """Running summary of the turns that are no longer kept verbatim"""
+        return "\n".join(self.summary_lines)
+
+    def history(self, max_tokens=None):
+        """
+        Render the conversation so far for the prompt
+
+        The summary comes first, then as many of the most recent turns as
+        fit the budget; the newest turn is truncated if it alone does not fit.
+
+        Args:
+            max_tokens (int, optional): Token budget; defaults to ``max_history_tokens``
+
+        Returns:
+            str: Conversation history, or an empty string for a new session
+        """
+        budget = self.max_history_tokens if max_tokens is None else max_tokens
+        sections = []
+        if self.summary_lines:
+            summary = f"Summary of earlier conversation:\n{self.summary}"
+            if estimate_tokens(summary) <= budget // 2:
+                sections.append(summary)
+                budget -= estimate_tokens(summary) + 1
+
+        header = "Recent conversation:\n"
+        budget -= estimate_tokens(header)
+        recent = []
+        for question, answer in reversed(self.turns):
+            turn = f"User: {question}\nAssistant: {answer}"
+            cost = estimate_tokens(turn) + 1
+            if cost > budget:
+                if not recent and budget > 0:
+                    recent.append(self._truncate(turn, budget))
+                break
+            recent.append(turn)
+            budget -= cost
+
+        if recent:
+            sections.append(header + "\n\n".join(reversed(recent)))
+        return "\n\n".join(sections)
+
+    def page(self, page=0, page_size=20):
+        """
+        Get one page of the displayed transcript, counting back from the newest messages
+
+        Args:
+            page (int): Page number, 0 being the most recent messages
+            page_size (int): Messages per page
+
+        Returns:
+            list: Messages of the page in chronological order
+        """
+        end = len(self.messages) - page * page_size
+        start = max(0, end - page_size)
+        return [self.messages[i] for i in range(start, max(start, end))]
+
+    def num_pages(self, page_size=20):
+        """Number of transcript pages"""
+        return max(1, -(-len(self.messages) // page_size))
+
+    def clear(self):
+        """Forget the whole conversation"""
+        self.turns.clear()
+        self.summary_lines.clear()
+        self.messages.clear()
@@ -1,24 +1,30 @@
-import os
-import google.generativeai as genai
 import logging
+from utils.tracing import current_trace, estimate_tokens, TOKENS_IN, TOKENS_OUT
+from utils.single_flight import SingleFlight
+from services.admission_control import AdmissionController, LLMUnavailableError
+from services.llm_backend import create_backend
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 class GeminiService:
-    def __init__(self):
-        """Initialize the Gemini API client"""
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            logger.error("GEMINI_API_KEY environment variable not set")
-            raise ValueError("GEMINI_API_KEY environment variable not set")
+    def __init__(self, admission=None, backend=None):
+        """
+        Initialize the LLM client
 
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
-        logger.info("Gemini service initialized")
+        Args:
+            admission (AdmissionController, optional): Rate limits and circuit breaker for API calls;
+                configured from the environment if omitted
+            backend (GeminiBackend or FakeLLMBackend, optional): Backend answering the prompts;
+                selected by LLM_BACKEND (default "gemini") if omitted
+        """
+        self.backend = backend if backend is not None else create_backend()
+        # Identical prompts in flight at the same time share one API call
+        self.flights = SingleFlight("gemini")
+        self.admission = admission if admission is not None else AdmissionController()
+        logger.info(f"Gemini service initialized ({type(self.backend).__name__})")
 
-    def generate_response(self, query, context=None, max_tokens=1024):
+    def generate_response(self, query, context=None, max_tokens=1024, history=None):
         """
         Generate a response using the Gemini API
 
@@ -26,29 +32,117 @@ class GeminiService:
             query (str): The query text
             context (str, optional): Additional context to provide
             max_tokens (int, optional): Maximum output tokens
+            history (str, optional): Earlier conversation, already bounded in size
 
         Returns:
             str: The generated response
+
+        Raises:
+            LLMUnavailableError: If the call was shed, the API call failed or the response was unusable
         """
-        try:
-            # Create prompt with context if provided
-            prompt = query
-            if context:
-                prompt = f"Using the following information as context:\n\n{context}\n\n{query}"
+        # Create prompt with context and history if provided
+        prompt = self._build_prompt(query, context, history)
+        response, _ = self.flights.do((prompt, max_tokens), self._generate, prompt, max_tokens)
+        return response
 
+    def _generate(self, prompt, max_tokens):
+        """Call the API for a complete prompt"""
+        reserved = estimate_tokens(prompt) + max_tokens
+        self.admission.acquire(reserved)
+        try:
             # Generate response
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    "max_output_tokens": max_tokens,
-                    "temperature": 0.2,
-                    "top_p": 0.95,
-                    "top_k": 40
-                }
-            )
-
-            return response.text
+            response = self.backend.generate(prompt, max_tokens)
+        except Exception as e:
+            self.admission.record_failure()
+            self.admission.refund(reserved)
+            logger.error(f"Error generating response: {str(e)}")
+            raise LLMUnavailableError("error", f"Gemini request failed: {str(e)}") from e
+        self.admission.record_success()
 
+        try:
+            text = response.text
         except Exception as e:
+            # The API answered but returned no usable text (e.g. a blocked response); raised so it is never cached.
+            # Only the prompt was spent.
+            self.admission.refund(reserved - estimate_tokens(prompt))
+            logger.error(f"Error reading response: {str(e)}")
+            raise LLMUnavailableError("unreadable", f"Gemini returned no usable response: {str(e)}") from e
+
+        self.admission.refund(reserved - self._record_usage(response, prompt))
+        return text
+
+    def stream_response(self, query, context=None, max_tokens=1024, history=None):
+        """
+        Generate a response using the Gemini API, yielding text as it arrives
+
+        Args:
+            query (str): The query text
+            context (str, optional): Additional context to provide
+            max_tokens (int, optional): Maximum output tokens
+            history (str, optional): Earlier conversation, already bounded in size
+
+        Yields:
+            str: Chunks of the generated response
+
+        Raises:
+            LLMUnavailableError: If the call was shed or the API call failed
+        """
+        prompt = self._build_prompt(query, context, history)
+        yield from self.flights.stream((prompt, max_tokens), self._generate_stream, prompt, max_tokens)
+
+    def _generate_stream(self, prompt, max_tokens):
+        """Call the streaming API for a complete prompt"""
+        reserved = estimate_tokens(prompt) + max_tokens
+        self.admission.acquire(reserved)
+        produced = []
+        try:
+            response = self.backend.generate(prompt, max_tokens, stream=True)
+            for chunk in response:
+                if chunk.text:
+                    produced.append(chunk.text)
+                    yield chunk.text
+        except GeneratorExit:
+            # The consumer stopped early; only the prompt and the chunks produced so far were spent
+            self.admission.record_success()
+            self.admission.refund(reserved - estimate_tokens(prompt) - estimate_tokens("".join(produced)))
+            raise
+        except Exception as e:
+            self.admission.record_failure()
+            self.admission.refund(reserved)
             logger.error(f"Error generating response: {str(e)}")
-            return f"I'm sorry, I couldn't process your request due to an error: {str(e)}"
\ No newline at end of file
+            raise LLMUnavailableError("error", f"Gemini request failed: {str(e)}") from e
+        self.admission.record_success()
+
+        try:
+            self.admission.refund(reserved - self._record_usage(response, prompt))
+        except Exception as e:
+            logger.error(f"Error reading response usage: {str(e)}")
+            self.admission.refund(reserved - estimate_tokens(prompt) - estimate_tokens("".join(produced)))
+
+    @staticmethod
+    def _build_prompt(query, context=None, history=None):
+        """Combine the query with its context and conversation history"""
+        prompt = query
+        if context:
+            prompt = f"Using the following information as context:\n\n{context}\n\n{query}"
+        if history:
+            prompt = f"{history}\n\nAnswer the new question, using the conversation above for follow-ups.\n\n{prompt}"
+        return prompt
+
+    def _record_usage(self, response, prompt):
+        """
+        Record prompt and completion token counts, estimating them if the API doesn't report usage
+
+        Returns:
+            int: Total tokens used
+        """
+        usage = getattr(response, "usage_metadata", None)
+        tokens_in = getattr(usage, "prompt_token_count", None) or estimate_tokens(prompt)
+        tokens_out = getattr(usage, "candidates_token_count", None) or estimate_tokens(response.text)
+        TOKENS_IN.inc(tokens_in)
+        TOKENS_OUT.inc(tokens_out)
+
+        trace = current_trace()
+        if trace is not None:
+            trace.attributes.update(tokens_in=tokens_in, tokens_out=tokens_out)
+        return tokens_in + tokens_out
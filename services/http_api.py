@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from dotenv import load_dotenv
+from utils.tracing import metrics, start_trace
+from utils.logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = metrics.counter("cdp_http_requests_total", "HTTP requests served", ["route", "status"])
+HTTP_LATENCY = metrics.histogram("cdp_http_request_duration_seconds", "HTTP request latency", ["route"])
+
+# Shared server state: the warm QueryHandler once loaded, or the error that prevented it
+STATE = web.AppKey("state", dict)
+EXECUTOR = web.AppKey("executor", ThreadPoolExecutor)
+
+MAX_QUERY_LENGTH = 4000
+MAX_BATCH_SIZE = 32
+QUERY_OPTIONS = ("cdp", "query_type", "history")
+
+
+def _error(status, message):
+    """Build a JSON error response"""
+    return web.json_response({"error": message}, status=status)
+
+
+def _get_handler(request):
+    """Return the loaded QueryHandler, or raise 503 while it is still loading"""
+    handler = request.app[STATE].get("handler")
+    if handler is None:
+        raise web.HTTPServiceUnavailable(text=json.dumps({"error": "Index is still loading"}),
+                                         content_type="application/json")
+    return handler
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "Request body must be JSON"}),
+                                 content_type="application/json")
+
+
+def parse_query(payload):
+    """
+    Validate one query payload
+
+    Args:
+        payload (dict or str): ``{"query": ..., "cdp": ..., "query_type": ..., "history": ...}`` or a bare query
+
+    Returns:
+        tuple: (query, keyword arguments for QueryHandler.handle_query)
+
+    Raises:
+        ValueError: If the payload is invalid
+    """
+    if isinstance(payload, str):
+        payload = {"query": payload}
+    if not isinstance(payload, dict):
+        raise ValueError("Query must be a string or an object")
+
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f"'query' must be at most {MAX_QUERY_LENGTH} characters")
+
+    options = {}
+    for name in QUERY_OPTIONS:
+        value = payload.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"'{name}' must be a string")
+        options[name] = value or None
+    return query.strip(), options
+
+
+async def _run(app, func, *args, **kwargs):
+    """Run blocking query work in the server's thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app[EXECUTOR], functools.partial(func, *args, **kwargs))
+
+
+async def _answer(app, handler, question, options):
+    """Answer a question; returns (answer, whether it was coalesced with an identical in-flight question)"""
+    # QueryHandler coalesces identical questions itself and marks the shared ones on the trace;
+    # only the leader of a coalesced group takes a thread from the server's pool
+    with start_trace("handle_query") as trace:
+        answer = await handler.handle_query_async(question, executor=app[EXECUTOR], **options)
+    return answer, bool(trace.attributes.get("coalesced"))
+
+
+async def query(request):
+    """POST /v1/query: answer one question"""
+    handler = _get_handler(request)
+    try:
+        question, options = parse_query(await _read_json(request))
+    except ValueError as e:
+        return _error(400, str(e))
+
+    start = time.perf_counter()
+    answer, coalesced = await _answer(request.app, handler, question, options)
+    return web.json_response({
+        "query": question,
+        "answer": answer,
+        "coalesced": coalesced,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+
+
+async def batch_query(request):
+    """POST /v1/query/batch: answer up to MAX_BATCH_SIZE questions concurrently"""
+    handler = _get_handler(request)
+    payload = await _read_json(request)
+    queries = payload.get("queries") if isinstance(payload, dict) else None
+    if not isinstance(queries, list) or not queries:
+        return _error(400, "'queries' must be a non-empty list")
+    if len(queries) > MAX_BATCH_SIZE:
+        return _error(400, f"At most {MAX_BATCH_SIZE} queries per batch")
+    try:
+        parsed = [parse_query(item) for item in queries]
+    except ValueError as e:
+        return _error(400, str(e))
+
+    start = time.perf_counter()
+    answers = await asyncio.gather(*(_answer(request.app, handler, question, options)
+                                     for question, options in parsed))
+    return web.json_response({
+        "results": [{"query": question, "answer": answer, "coalesced": coalesced}
+                    for (question, _), (answer, coalesced) in zip(parsed, answers)],
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+    })
+
+
+async def stream_query(request):
+    """POST /v1/query/stream: answer one question as server-sent events"""
+    handler = _get_handler(request)
+    try:
+        question, options = parse_query(await _read_json(request))
+    except ValueError as e:
+        return _error(400, str(e))
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    await response.prepare(request)
+
+    # The generator runs start to end in one worker thread (its trace lives in that
+    # thread's context) and hands chunks to the event loop through a queue
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    cancelled = threading.Event()
+
+    def produce():
+        generator = handler.stream_query(question, **options)
+        try:
+            for chunk in generator:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        finally:
+            generator.close()
+            loop.call_soon_threadsafe(chunks.put_nowait, None)
+
+    producer = loop.run_in_executor(request.app[EXECUTOR], produce)
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is None:
+                break
+            await response.write(f"data: {json.dumps({'text': chunk})}\n\n".encode("utf-8"))
+        await response.write(b"event: done\ndata: {}\n\n")
+        await producer
+    except (ConnectionResetError, asyncio.CancelledError):
+        cancelled.set()
+        raise
+    await response.write_eof()
+    return response
+
+
+async def health(request):
+    """GET /healthz: the process is up"""
+    return web.json_response({"status": "ok"})
+
+
+async def ready(request):
+    """GET /readyz: the index is loaded and queries can be served"""
+    state = request.app[STATE]
+    handler = state.get("handler")
+    if handler is None:
+        status = "failed" if state.get("error") else "starting"
+        return web.json_response({"status": status, "error": state.get("error")}, status=503)
+
+    return web.json_response({
+        "status": "ready",
+        "store_version": handler.document_store.version,
+        "index_version": getattr(handler.document_store, "index_version", None),
+        "retrieval_strategy": handler.retrieval_strategy,
+    })
+
+
+async def prometheus_metrics(request):
+    """GET /metrics: process metrics in the Prometheus text format"""
+    return web.Response(text=metrics.export_prometheus(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    """Count requests and record their latency by route"""
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else "unmatched"
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        HTTP_REQUESTS.inc(route=route, status=str(status))
+        HTTP_LATENCY.observe(time.perf_counter() - start, route=route)
+
+
+def create_app(query_handler=None, handler_factory=None, workers=None, warm_cache=None, watch_corpus=None):
+    """
+    Create the HTTP application
+
+    The QueryHandler (and with it the document index) is built once in the
+    background and shared by all requests; /readyz reports 503 until it is loaded.
+
+    Args:
+        query_handler (QueryHandler, optional): Ready handler to serve
+        handler_factory (callable, optional): Builds the handler at startup; defaults to QueryHandler()
+        workers (int, optional): Threads running queries; defaults to API_WORKERS or 8
+        warm_cache (bool, optional): Answer the example questions in the background once loaded;
+            defaults to CACHE_WARMING (on unless "0")
+        watch_corpus (bool, optional): Reload the corpus when it changes on disk; defaults to
+            CORPUS_WATCH (on unless "0")
+
+    Returns:
+        web.Application: The application
+    """
+    if workers is None:
+        workers = int(os.getenv("API_WORKERS", 8))
+    if warm_cache is None:
+        warm_cache = os.getenv("CACHE_WARMING", "1") == "1"
+    if watch_corpus is None:
+        watch_corpus = os.getenv("CORPUS_WATCH", "1") == "1"
+
+    app = web.Application(middlewares=[metrics_middleware], client_max_size=1024 * 1024)
+    app[STATE] = {"handler": query_handler}
+    app[EXECUTOR] = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="query")
+
+    if handler_factory is None:
+        from services.query_handler import QueryHandler
+        handler_factory = QueryHandler
+
+    async def load_handler(app):
+        try:
+            handler = await _run(app, handler_factory)
+        except Exception as e:
+            logger.error(f"Error loading query handler: {str(e)}")
+            app[STATE]["error"] = str(e)
+            return
+        app[STATE]["handler"] = handler
+        logger.info("Query handler loaded; ready to serve")
+        start_background_tasks(app)
+
+    def start_background_tasks(app):
+        handler = app[STATE]["handler"]
+        listeners = [handler.invalidate_caches]
+        if warm_cache:
+            from services.cache_warmer import CacheWarmer
+            app[STATE]["warmer"] = CacheWarmer(handler)
+            app[STATE]["warmer"].start()
+            listeners.append(app[STATE]["warmer"].wake)
+        if watch_corpus and hasattr(handler.document_store, "reload"):
+            from data.storage.corpus_watcher import CorpusWatcher
+            app[STATE]["watcher"] = CorpusWatcher(handler.document_store, listeners=listeners)
+            app[STATE]["watcher"].start()
+
+    async def start_loading(app):
+        if app[STATE]["handler"] is None:
+            app[STATE]["loader"] = asyncio.create_task(load_handler(app))
+        else:
+            start_background_tasks(app)
+
+    async def shutdown(app):
+        loader = app[STATE].get("loader")
+        if loader is not None and not loader.done():
+            loader.cancel()
+        for name in ("warmer", "watcher"):
+            task = app[STATE].get(name)
+            if task is not None:
+                task.stop()
+        app[EXECUTOR].shutdown(wait=False, cancel_futures=True)
+
+    app.on_startup.append(start_loading)
+    app.on_cleanup.append(shutdown)
+
+    app.router.add_post("/v1/query", query)
+    app.router.add_post("/v1/query/batch", batch_query)
+    app.router.add_post("/v1/query/stream", stream_query)
+    app.router.add_get("/healthz", health)
+    app.router.add_get("/readyz", ready)
+    app.router.add_get("/metrics", prometheus_metrics)
+    return app
+
+
+def main(argv=None):
+    load_dotenv()
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Serve the CDP support agent over HTTP")
+    parser.add_argument("--host", type=str, default=os.getenv("API_HOST", "127.0.0.1"), help="Interface to bind")
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", 8080)), help="Port to listen on")
+    parser.add_argument("--workers", type=int, help="Threads running queries (default: API_WORKERS or 8)")
+    parser.add_argument("--fake-llm", action="store_true", default=os.getenv("LLM_BACKEND") == "fake",
+                        help="Answer with a local fake LLM (no API key needed; for load tests)")
+    parser.add_argument("--fake-llm-latency-ms", type=float, help="Median simulated fake LLM latency")
+    args = parser.parse_args(argv)
+
+    handler_factory = None
+    if args.fake_llm:
+        from services.query_handler import QueryHandler
+        from services.gemini_service import GeminiService
+        from services.llm_backend import FakeLLMBackend
+
+        def handler_factory():
+            backend = FakeLLMBackend(latency_ms=args.fake_llm_latency_ms)
+            return QueryHandler(gemini_service=GeminiService(backend=backend))
+
+    web.run_app(create_app(handler_factory=handler_factory, workers=args.workers), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import os
+import math
+import time
+import random
+import logging
+import threading
+from utils.tracing import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+GENERATION_CONFIG = {
+    "temperature": 0.2,
+    "top_p": 0.95,
+    "top_k": 40
+}
+
+
+class GeminiBackend:
+    """
+    LLM backend calling the Gemini API
+
+    Backends only turn a prompt into a response; GeminiService adds the
+    request coalescing, admission control and usage metrics around them. A
+    backend's ``generate`` returns a Gemini-style response: it has ``text``
+    and ``usage_metadata`` and, when streamed, yields chunks with ``text``.
+    """
+
+    def __init__(self, model_name="gemini-1.5-flash"):
+        """
+        Initialize the Gemini API client
+
+        The SDK is imported and configured on the first call: it takes longer
+        to import than the rest of the app, and the UI and index can be ready
+        meanwhile.
+
+        Args:
+            model_name (str): Gemini model to call
+
+        Raises:
+            ValueError: If GEMINI_API_KEY is not set
+        """
+        self.api_key = os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            logger.error("GEMINI_API_KEY environment variable not set")
+            raise ValueError("GEMINI_API_KEY environment variable not set")
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        """The Gemini model client, created on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+                    logger.info(f"Gemini client for {self.model_name} loaded")
+        return self._model
+
+    def generate(self, prompt, max_tokens, stream=False):
+        """
+        Call the API
+
+        Args:
+            prompt (str): Complete prompt
+            max_tokens (int): Maximum output tokens
+            stream (bool): Return a response that yields chunks as they arrive
+
+        Returns:
+            GenerateContentResponse: The API response
+        """
+        return self.model.generate_content(
+            prompt,
+            generation_config=dict(GENERATION_CONFIG, max_output_tokens=max_tokens),
+            stream=stream
+        )
+
+
+class FakeLLMError(Exception):
+    """Error injected by FakeLLMBackend"""
+
+
+class _Usage:
+    __slots__ = ("prompt_token_count", "candidates_token_count")
+
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _Chunk:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeResponse:
+    """Gemini-style response of FakeLLMBackend; iterating it yields the chunks at the simulated pace"""
+
+    def __init__(self, text, usage, delays):
+        self.text = text
+        self.usage_metadata = usage
+        self._delays = delays
+
+    def __iter__(self):
+        words = self.text.split(" ")
+        size = -(-len(words) // len(self._delays))
+        for index, delay in enumerate(self._delays):
+            time.sleep(delay)
+            chunk = " ".join(words[index * size:(index + 1) * size])
+            if chunk:
+                yield _Chunk(chunk if index == 0 else " " + chunk)
+
+
+class FakeLLMBackend:
+    """
+    Offline stand-in for the Gemini API for local load tests
+
+    Answers after a simulated latency drawn from a log-normal distribution
+    (``latency_sigma`` 0 gives a fixed latency), fails a fraction of calls
+    with FakeLLMError, and reports ``output_tokens`` completion tokens. The
+    answer quotes the prompt, so retrieval, prompt building and serving
+    overheads are exercised as with the real API. Random draws come from one
+    seeded generator, so a sequential run is reproducible; concurrent runs
+    draw the same distribution in a different order.
+    """
+
+    def __init__(self, latency_ms=None, latency_sigma=None, error_rate=None, output_tokens=None, chunks=8,
+                 seed=0):
+        """
+        Initialize the fake backend
+
+        Args:
+            latency_ms (float, optional): Median response time; defaults to FAKE_LLM_LATENCY_MS or 200
+            latency_sigma (float, optional): Log-normal shape of the response time (0.5 gives a p99 about
+                3x the median); defaults to FAKE_LLM_LATENCY_SIGMA or 0
+            error_rate (float, optional): Fraction of calls that fail; defaults to FAKE_LLM_ERROR_RATE or 0
+            output_tokens (int, optional): Completion tokens per answer, capped by ``max_tokens``;
+                defaults to FAKE_LLM_OUTPUT_TOKENS or 250
+            chunks (int): Number of chunks a streamed response is split into
+            seed (int): Seed of the latency and error draws
+        """
+        if latency_ms is None:
+            latency_ms = float(os.getenv("FAKE_LLM_LATENCY_MS", 200))
+        if latency_sigma is None:
+            latency_sigma = float(os.getenv("FAKE_LLM_LATENCY_SIGMA", 0))
+        if error_rate is None:
+            error_rate = float(os.getenv("FAKE_LLM_ERROR_RATE", 0))
+        if output_tokens is None:
+            output_tokens = int(os.getenv("FAKE_LLM_OUTPUT_TOKENS", 250))
+        self.latency = max(0.0, latency_ms) / 1000
+        self.latency_sigma = max(0.0, latency_sigma)
+        self.error_rate = min(1.0, max(0.0, error_rate))
+        self.output_tokens = max(1, output_tokens)
+        self.chunks = max(1, chunks)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        logger.info(f"Fake LLM backend initialized ({latency_ms:.0f}ms median latency, "
+                    f"sigma {self.latency_sigma:g}, {self.error_rate:.1%} errors)")
+
+    def _draw(self):
+        """Draw the latency of the next call and whether it fails"""
+        with self._lock:
+            latency = self.latency * math.exp(self._random.gauss(0, self.latency_sigma)) \
+                if self.latency_sigma else self.latency
+            return latency, self._random.random() < self.error_rate
+
+    def generate(self, prompt, max_tokens, stream=False):
+        """
+        Answer after the simulated latency
+
+        Args:
+            prompt (str): Complete prompt
+            max_tokens (int): Maximum output tokens
+            stream (bool): Return a response that yields chunks spread over the latency
+
+        Returns:
+            FakeResponse: The fake response
+
+        Raises:
+            FakeLLMError: For the injected fraction of calls
+        """
+        latency, fail = self._draw()
+        if fail:
+            # Failures are usually fast (a rejected or dropped request), so take a tenth of the latency
+            time.sleep(latency / 10)
+            raise FakeLLMError("Injected fake LLM error")
+
+        tokens = min(self.output_tokens, max_tokens)
+        text = self._compose(prompt, tokens)
+        usage = _Usage(estimate_tokens(prompt), tokens)
+        if stream:
+            return FakeResponse(text, usage, [latency / self.chunks] * self.chunks)
+        time.sleep(latency)
+        return FakeResponse(text, usage, [0.0])
+
+    @staticmethod
+    def _compose(prompt, tokens):
+        """Build an answer of about ``tokens`` tokens from the prompt's words"""
+        words = prompt.split() or ["answer"]
+        text = "[fake response]"
+        index = 0
+        # estimate_tokens counts about 4 characters per token
+        while len(text) < tokens * 4:
+            text += " " + words[index % len(words)]
+            index += 1
+        return text[:tokens * 4]
+
+
+def create_backend(name=None, **options):
+    """
+    Create an LLM backend
+
+    Args:
+        name (str, optional): "gemini" or "fake"; defaults to LLM_BACKEND or "gemini"
+        **options: Keyword arguments of the backend class
+
+    Returns:
+        GeminiBackend or FakeLLMBackend: The backend
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    name = (name or os.getenv("LLM_BACKEND", "gemini")).lower()
+    if name == "gemini":
+        return GeminiBackend(**options)
+    if name == "fake":
+        return FakeLLMBackend(**options)
+    raise ValueError(f"Unknown LLM backend: {name}")
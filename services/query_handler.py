@@ -1,51 +1,361 @@
+import os
 import logging
+import textwrap
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from services.gemini_service import GeminiService
-from data.storage.document_store import DocumentStore
+from services.admission_control import LLMUnavailableError
+from data.storage.document_store import CDPS, create_document_store
 from data.processors.text_processor import TextProcessor
+from utils.tracing import start_trace, span, current_trace, REQUESTS, DOCS_RETRIEVED
+from utils.query_router import router
+from utils.single_flight import SingleFlight, coalescing_key
+from utils.cache import LRUCache
+from utils.profiling import profiled
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 class QueryHandler:
-    def __init__(self):
-        """Initialize the query handler"""
-        self.gemini_service = GeminiService()
-        self.document_store = DocumentStore()
+    # Retrieval strategies by name, mapped to the method implementing them
+    RETRIEVAL_STRATEGIES = {
+        "keyword": "_retrieve_by_keyword",
+        "phrase": "_retrieve_by_phrase",
+    }
+
+    CDP_NAMES = {"segment": "Segment", "mparticle": "mParticle", "lytics": "Lytics", "zeotap": "Zeotap"}
+
+    def __init__(self, gemini_service=None, document_store=None, retrieval_strategy=None, retrieval_cache_size=None):
+        """
+        Initialize the query handler
+
+        Args:
+            gemini_service (GeminiService, optional): LLM service; created from the environment if omitted
+            document_store (DocumentStore, optional): Document store; the configured backend if omitted
+            retrieval_strategy (str, optional): Name of the retrieval strategy; defaults to RETRIEVAL_STRATEGY or "phrase"
+            retrieval_cache_size (int, optional): Retrieval cache entries (0 disables it); defaults to
+                RETRIEVAL_CACHE_SIZE or 1024
+        """
+        self.gemini_service = gemini_service if gemini_service is not None else GeminiService()
+        self.document_store = document_store if document_store is not None else create_document_store()
         self.text_processor = TextProcessor()
+        self.router = router
+        # Identical questions asked concurrently share one retrieval and LLM call
+        self.query_flights = SingleFlight("handle_query")
+        # Answers are cached per corpus version, so a corpus change invalidates them
+        self.response_cache = LRUCache("response", int(os.getenv("RESPONSE_CACHE_SIZE", 256)))
+        # Ranked doc IDs by normalized keyword set, shared by phrasings and query types that retrieve alike
+        if retrieval_cache_size is None:
+            retrieval_cache_size = int(os.getenv("RETRIEVAL_CACHE_SIZE", 1024))
+        self.retrieval_cache = LRUCache("retrieval", retrieval_cache_size)
+        self.retrieval_strategy = retrieval_strategy or os.getenv("RETRIEVAL_STRATEGY", "phrase")
+        if self.retrieval_strategy not in self.RETRIEVAL_STRATEGIES:
+            raise ValueError(f"Unknown retrieval strategy: {self.retrieval_strategy}")
+
+        # Cross-CDP comparisons retrieve (and optionally answer) per CDP in parallel
+        self.comparison_docs_per_cdp = int(os.getenv("COMPARISON_DOCS_PER_CDP", 2))
+        # Map-reduce costs one extra LLM call per CDP, so it is opt-in
+        self.comparison_map_reduce = os.getenv("COMPARISON_MAP_REDUCE", "0") == "1"
+        self.comparison_map_tokens = int(os.getenv("COMPARISON_MAP_TOKENS", 256))
+        self._comparison_executor = ThreadPoolExecutor(max_workers=int(os.getenv("COMPARISON_WORKERS", 8)),
+                                                       thread_name_prefix="comparison")
         logger.info("Query handler initialized")
 
-    def handle_query(self, query, cdp=None, query_type="How-to Question"):
+    @profiled
+    def handle_query(self, query, cdp=None, query_type=None, history=None):
         """
         Handle user query about CDPs
 
         Args:
             query (str): User query
-            cdp (str, optional): Specific CDP to focus on
-            query_type (str): Type of query (How-to, Comparison, Advanced)
+            cdp (str, optional): Specific CDP to focus on; detected from the query if omitted
+            query_type (str, optional): Type of query (How-to, Comparison, Advanced); detected if omitted
+            history (str, optional): Token-bounded conversation history (see ConversationMemory.history)
 
         Returns:
             str: Response to the query
         """
-        try:
-            # Create a prompt based on query type
-            prompt = self._create_prompt(query, cdp, query_type)
+        with start_trace("handle_query", query=query, cdp=cdp, query_type=query_type) as trace:
+            query_type, key, version = self._cache_key(query, cdp, query_type, history)
+            response = self.response_cache.get(key, version)
+            if response is not None:
+                REQUESTS.inc(status="cached")
+                trace.attributes["cached"] = True
+                return response
+
+            response, shared = self.query_flights.do(key, self._answer_query, query, cdp, query_type, history,
+                                                     key, version)
+            if shared:
+                trace.attributes["coalesced"] = True
+            return response
 
-            # Find relevant documents
-            relevant_docs = self._find_relevant_documents(query, cdp)
+    async def handle_query_async(self, query, cdp=None, query_type=None, history=None, executor=None):
+        """
+        Handle user query about CDPs from asyncio code
 
-            # Create context from relevant documents
-            context = self._create_context(relevant_docs, query)
+        Same as ``handle_query``, but the retrieval and LLM call run in ``executor``
+        and a question coalesced with an identical in-flight one waits without a thread.
 
-            # Generate response
-            response = self.gemini_service.generate_response(prompt, context)
+        Args:
+            query (str): User query
+            cdp (str, optional): Specific CDP to focus on; detected from the query if omitted
+            query_type (str, optional): Type of query (How-to, Comparison, Advanced); detected if omitted
+            history (str, optional): Token-bounded conversation history (see ConversationMemory.history)
+            executor (Executor, optional): Executor running the blocking work; the loop's default if omitted
 
+        Returns:
+            str: Response to the query
+        """
+        with start_trace("handle_query", query=query, cdp=cdp, query_type=query_type) as trace:
+            query_type, key, version = self._cache_key(query, cdp, query_type, history)
+            response = self.response_cache.get(key, version)
+            if response is not None:
+                REQUESTS.inc(status="cached")
+                trace.attributes["cached"] = True
+                return response
+
+            # Imported here like in SingleFlight.do_async; only the HTTP API calls this
+            import asyncio
+
+            # The worker thread records its spans on this trace
+            work = functools.partial(contextvars.copy_context().run, self._answer_query, query, cdp, query_type,
+                                     history, key, version)
+            response, shared = await self.query_flights.do_async(key, asyncio.get_running_loop().run_in_executor,
+                                                                 executor, work)
+            if shared:
+                trace.attributes["coalesced"] = True
+            return response
+
+    def is_cached(self, query, cdp=None, query_type=None, history=None):
+        """
+        Check whether the answer to a query is cached for the current corpus
+
+        Args:
+            query (str): User query
+            cdp (str, optional): Specific CDP to focus on
+            query_type (str, optional): Type of query; detected if omitted
+            history (str, optional): Conversation history
+
+        Returns:
+            bool: True if handle_query would answer from the response cache
+        """
+        _, key, version = self._cache_key(query, cdp, query_type, history)
+        return self.response_cache.contains(key, version)
+
+    def invalidate_caches(self, version):
+        """
+        Drop cached answers and retrieval results of other corpus versions, e.g. after a reload
+
+        Args:
+            version (int): Current store version
+        """
+        self.response_cache.invalidate(version)
+        self.retrieval_cache.invalidate(version)
+
+    def _cache_key(self, query, cdp, query_type, history):
+        """Resolve the query type and build the coalescing/cache key and the corpus version for a query"""
+        if query_type is None:
+            # Detect the type up front so "Auto-detect" shares cache entries with the explicit type
+            _, query_type = self.router.route(query)
+        return query_type, coalescing_key(query, cdp, query_type, history), self.document_store.version
+
+    def _answer_query(self, query, cdp, query_type, history, cache_key, version):
+        """Retrieve context and generate the response for a query, caching successful answers"""
+        try:
+            prompt, context, relevant_docs = self._prepare_query(query, cdp, query_type)
+
+            # Generate response
+            try:
+                with span("llm"):
+                    response = self.gemini_service.generate_response(prompt, context, history=history)
+            except LLMUnavailableError as e:
+                return self._degrade(relevant_docs, query, e)
+
+            REQUESTS.inc(status="ok")
+            self.response_cache.put(cache_key, response, version)
             return response
 
         except Exception as e:
+            REQUESTS.inc(status="error")
             logger.error(f"Error handling query: {str(e)}")
             return f"I'm sorry, I encountered an error while processing your question: {str(e)}"
 
+    def stream_query(self, query, cdp=None, query_type=None, history=None):
+        """
+        Handle user query about CDPs, yielding the response in chunks as it is generated
+
+        Falls back to a single chunk when the LLM service cannot stream.
+
+        Args:
+            query (str): User query
+            cdp (str, optional): Specific CDP to focus on; detected from the query if omitted
+            query_type (str, optional): Type of query (How-to, Comparison, Advanced); detected if omitted
+            history (str, optional): Token-bounded conversation history (see ConversationMemory.history)
+
+        Yields:
+            str: Response text chunks
+        """
+        with start_trace("stream_query", query=query, cdp=cdp, query_type=query_type) as trace:
+            query_type, key, version = self._cache_key(query, cdp, query_type, history)
+            response = self.response_cache.get(key, version)
+            if response is not None:
+                REQUESTS.inc(status="cached")
+                trace.attributes["cached"] = True
+                yield response
+                return
+
+            yield from self.query_flights.stream(key, self._stream_answer, query, cdp, query_type, history,
+                                                 key, version)
+
+    def _stream_answer(self, query, cdp, query_type, history, cache_key, version):
+        """Retrieve context and stream the response for a query, caching successful answers"""
+        try:
+            prompt, context, relevant_docs = self._prepare_query(query, cdp, query_type)
+
+            chunks = []
+            streamed = False
+            try:
+                with span("llm"):
+                    stream_response = getattr(self.gemini_service, "stream_response", None)
+                    if stream_response is None:
+                        chunks.append(self.gemini_service.generate_response(prompt, context, history=history))
+                        yield chunks[-1]
+                    else:
+                        for chunk in stream_response(prompt, context, history=history):
+                            streamed = True
+                            chunks.append(chunk)
+                            yield chunk
+            except LLMUnavailableError as e:
+                if streamed:
+                    raise
+                yield self._degrade(relevant_docs, query, e)
+                return
+
+            REQUESTS.inc(status="ok")
+            self.response_cache.put(cache_key, "".join(chunks), version)
+
+        except Exception as e:
+            REQUESTS.inc(status="error")
+            logger.error(f"Error handling query: {str(e)}")
+            yield f"I'm sorry, I encountered an error while processing your question: {str(e)}"
+
+    def _prepare_query(self, query, cdp, query_type):
+        """Build the prompt, the retrieved context and the retrieved documents for a query"""
+        if query_type is None:
+            _, query_type = self.router.route(query)
+
+        if query_type == "Cross-CDP Comparison" and not cdp:
+            return self._prepare_comparison(query)
+
+        # Create a prompt based on query type
+        with span("prompt"):
+            prompt = self._create_prompt(query, cdp, query_type)
+
+        # Find relevant documents
+        relevant_docs = self._find_relevant_documents(query, cdp)
+        DOCS_RETRIEVED.inc(len(relevant_docs))
+
+        # Create context from relevant documents
+        with span("context", documents=len(relevant_docs)):
+            context = self._create_context(relevant_docs, query)
+
+        return prompt, context, relevant_docs
+
+    def _prepare_comparison(self, query):
+        """
+        Build the prompt and context for a Cross-CDP Comparison
+
+        Documents are retrieved per CDP concurrently with the same k for
+        every CDP, so no single CDP crowds out the others. In map-reduce mode
+        each CDP's documents are first condensed into a short sub-answer
+        (also concurrently), and the final prompt only carries those.
+
+        Args:
+            query (str): User query
+
+        Returns:
+            tuple: (prompt, context, retrieved documents)
+        """
+        cdps, _ = self.router.route(query)
+        if len(cdps) < 2:
+            cdps = list(CDPS)
+
+        with span("prompt"):
+            prompt = self._create_prompt(query, None, "Cross-CDP Comparison")
+
+        with span("comparison_retrieval", cdps=",".join(cdps)):
+            futures = {cdp: self._submit(self._find_relevant_documents, query, cdp, self.comparison_docs_per_cdp)
+                       for cdp in cdps}
+            documents_by_cdp = {cdp: future.result() for cdp, future in futures.items()}
+        documents_by_cdp = {cdp: documents for cdp, documents in documents_by_cdp.items() if documents}
+        relevant_docs = [doc for documents in documents_by_cdp.values() for doc in documents]
+        DOCS_RETRIEVED.inc(len(relevant_docs))
+
+        if self.comparison_map_reduce and len(documents_by_cdp) > 1:
+            with span("comparison_map", branches=len(documents_by_cdp)):
+                futures = {cdp: self._submit(self._answer_for_cdp, query, cdp, documents)
+                           for cdp, documents in documents_by_cdp.items()}
+                findings = {cdp: future.result() for cdp, future in futures.items()}
+            context = "Findings per CDP:\n\n" + "\n\n".join(
+                f"{self.CDP_NAMES.get(cdp, cdp)}:\n{finding}" for cdp, finding in findings.items())
+        else:
+            with span("context", documents=len(relevant_docs)):
+                context = "".join(f"{self.CDP_NAMES.get(cdp, cdp)}:\n{self._create_context(documents, query)}"
+                                  for cdp, documents in documents_by_cdp.items())
+                context = context or self._create_context([], query)
+
+        return prompt, context, relevant_docs
+
+    def _answer_for_cdp(self, query, cdp, documents):
+        """Condense one CDP's documents into a short sub-answer for a comparison"""
+        name = self.CDP_NAMES.get(cdp, cdp)
+        prompt = (f"Using only the documentation provided, summarize in a few sentences how {name} "
+                  f"handles the following: {query}")
+        context = self._create_context(documents, query)
+        try:
+            return self.gemini_service.generate_response(prompt, context, max_tokens=self.comparison_map_tokens)
+        except LLMUnavailableError:
+            # Without the LLM, the documents themselves are the finding
+            return context
+
+    def _submit(self, func, *args):
+        """Run work on the comparison pool within the caller's trace"""
+        return self._comparison_executor.submit(contextvars.copy_context().run, func, *args)
+
+    def _degrade(self, documents, query, error):
+        """Answer from the retrieved documents alone when the LLM is unavailable"""
+        REQUESTS.inc(status="degraded")
+        logger.warning(f"LLM unavailable ({error.reason}); answering from retrieved documents")
+        trace = current_trace()
+        if trace is not None:
+            trace.attributes["degraded"] = error.reason
+        return self._create_retrieval_only_response(documents, query)
+
+    def _create_retrieval_only_response(self, documents, query):
+        """Create a response that lists the relevant documentation without generated text"""
+
+        response = ("The AI assistant is temporarily unavailable, so here is the most relevant "
+                    "documentation for your question:\n\n")
+
+        if not documents:
+            # Fall back to the general CDP overview, as the prompt context does
+            overview = textwrap.dedent(self._create_context(documents, query)).strip()
+            if not overview:
+                return ("The AI assistant is temporarily unavailable and no matching documentation was found. "
+                        "Please try again in a moment.")
+            return response + overview
+
+        for doc in documents:
+            title = doc.get("title", "Untitled Document")
+            url = doc.get("url")
+            content = doc.get("content", "")
+            summary = self.text_processor.summarize_text(content, max_sentences=2) if content else ""
+            heading = f"[{title}]({url})" if url else title
+            response += f"**{heading}** ({doc.get('source', 'Unknown')})\n{summary}\n\n"
+
+        return response.rstrip()
+
     def _create_prompt(self, query, cdp, query_type):
         """Create a prompt based on the query type"""
 
@@ -65,11 +375,70 @@ class QueryHandler:
 
         return base_prompt
 
-    def _find_relevant_documents(self, query, cdp=None, limit=5):
-        """Find documents relevant to the query"""
+    def _find_relevant_documents(self, query, cdp=None, limit=5, strategy=None):
+        """
+        Find documents relevant to the query
+
+        Args:
+            query (str): User query
+            cdp (str, optional): CDP name to limit search; routed from the query if omitted
+            limit (int, optional): Maximum documents to return
+            strategy (str, optional): Retrieval strategy name; defaults to the handler's strategy
+
+        Returns:
+            list: List of document dictionaries
+        """
+        strategy = strategy or self.retrieval_strategy
+        retrieve = getattr(self, self.RETRIEVAL_STRATEGIES[strategy])
+
+        # Search only the CDPs the query is about (all of them if none is detected)
+        if not cdp:
+            with span("route") as attributes:
+                cdp = self.router.select_cdps(query)
+                attributes["cdps"] = ",".join(cdp) if cdp else "all"
 
         # Extract keywords to improve search
-        keywords = self.text_processor.extract_keywords(query)
+        with span("keywords"):
+            keywords = self.text_processor.extract_keywords(query)
+
+        with span("retrieval", strategy=strategy, keywords=len(keywords)) as attributes:
+            key = self._retrieval_key(query, keywords, cdp, strategy, limit)
+            version = self.document_store.version
+            documents = self._get_cached_documents(key, version)
+            if documents is None:
+                documents = retrieve(query, keywords, cdp, limit)
+                self.retrieval_cache.put(key, tuple(doc.doc_id for doc in documents), version)
+            else:
+                attributes["cached"] = True
+            attributes["documents"] = len(documents)
+
+        return documents
+
+    def _retrieval_key(self, query, keywords, cdp, strategy, limit):
+        """
+        Build the retrieval cache key of a query
+
+        Queries with the same keyword set share an entry. The phrase strategy
+        also searches the query's keyphrases, so they are part of its key.
+        """
+        cdps = tuple(sorted(cdp)) if isinstance(cdp, (list, tuple)) else cdp
+        key = (tuple(sorted(set(keywords))), cdps, strategy, limit)
+        if strategy == "phrase":
+            key += (tuple(sorted(self.text_processor.extract_keyphrases(query))),)
+        return key
+
+    def _get_cached_documents(self, key, version):
+        """Look up cached doc IDs and load their documents; None on a miss or if the corpus changed meanwhile"""
+        doc_ids = self.retrieval_cache.get(key, version)
+        if doc_ids is None:
+            return None
+        documents = [self.document_store.get_document(doc_id) for doc_id in doc_ids]
+        if None in documents or self.document_store.version != version:
+            return None
+        return documents
+
+    def _retrieve_by_keyword(self, query, keywords, cdp, limit):
+        """Search each keyword separately and keep the first hit for every URL"""
 
         # Search for each keyword
         all_results = []
@@ -90,6 +459,23 @@ class QueryHandler:
         # Return top results
         return unique_results[:limit]
 
+    def _retrieve_by_phrase(self, query, keywords, cdp, limit):
+        """Rank documents matching the query's keyphrases first, then fill up with keyword hits"""
+
+        results = []
+        seen_urls = set()
+        queries = [f'"{phrase}"' for phrase in self.text_processor.extract_keyphrases(query)]
+        for search_query in queries + list(keywords):
+            for doc in self.document_store.search_documents(search_query, cdp, limit):
+                url = doc.get("url", "")
+                if url not in seen_urls:
+                    seen_urls.add(url)
+                    results.append(doc)
+            if len(results) >= limit:
+                break
+
+        return results[:limit]
+
     def _create_context(self, documents, query):
         """Create context from relevant documents"""
 
@@ -113,9 +499,9 @@ class QueryHandler:
             content = doc.get("content", "")
             source = doc.get("source", "Unknown")
 
-            # Summarize long content
+            # Summarize long content (prebuilt indexes carry the summary already)
             if len(content) > 1000:
-                content = self.text_processor.summarize_text(content)
+                content = getattr(doc, "summary", None) or self.text_processor.summarize_text(content)
 
             context += f"Document {i} - {title} (Source: {source}):\n{content}\n\n"
 
@@ -0,0 +1,95 @@
+import logging
+import threading
+from collections import OrderedDict
+from utils.tracing import CACHE_HITS, CACHE_MISSES
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with versioned entries
+
+    Every entry is stored with the corpus version it was computed from. A
+    lookup with a different version is a miss, so a corpus change
+    invalidates all entries at once without clearing the cache; the stale
+    entries are overwritten or evicted as new ones come in.
+    """
+
+    def __init__(self, name, max_entries=256):
+        """
+        Initialize the cache
+
+        Args:
+            name (str): Name used in the cache hit/miss counters
+            max_entries (int): Entries kept before the least recently used one is evicted (0 disables caching)
+        """
+        self.name = name
+        self.max_entries = max(0, max_entries)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        """
+        Look up an entry
+
+        Args:
+            key (hashable): Cache key
+            version (hashable, optional): Corpus version the entry must have been computed from
+
+        Returns:
+            The cached value, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                CACHE_MISSES.inc(cache=self.name)
+                return None
+            self._entries.move_to_end(key)
+        CACHE_HITS.inc(cache=self.name)
+        return entry[1]
+
+    def contains(self, key, version=None):
+        """True if a current entry exists (without counting a lookup or refreshing its recency)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] == version
+
+    def put(self, key, value, version=None):
+        """
+        Store an entry, evicting the least recently used one if the cache is full
+
+        Args:
+            key (hashable): Cache key
+            value: Value to cache
+            version (hashable, optional): Corpus version the value was computed from
+        """
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version):
+        """
+        Remove the entries computed from any other version, e.g. after the corpus was reloaded
+
+        Args:
+            version (hashable): Current corpus version
+        """
+        with self._lock:
+            stale = [key for key, (entry_version, _) in self._entries.items() if entry_version != version]
+            for key in stale:
+                del self._entries[key]
+        if stale:
+            logger.info(f"Dropped {len(stale)} stale entries from the {self.name} cache")
+
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
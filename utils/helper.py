@@ -1,11 +1,35 @@
 import re
 import logging
 import time
+import functools
 from datetime import datetime
+from utils.tracing import span
+from utils.query_router import router
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Example questions shown in the sidebar, by query type
+EXAMPLE_QUESTIONS = {
+    "How-to Question": [
+        "How do I set up a new source in Segment?",
+        "How can I create a user profile in mParticle?",
+        "How do I build an audience segment in Lytics?",
+        "How can I integrate my data with Zeotap?"
+    ],
+    "Cross-CDP Comparison": [
+        "How does Segment's audience creation process compare to Lytics'?",
+        "What are the differences between mParticle and Zeotap data collection?",
+        "Compare user identification methods across all CDPs",
+        "Which CDP has better data export capabilities?"
+    ],
+    "Advanced Configuration": [
+        "How to implement server-side tracking in Segment?",
+        "Advanced custom attribute mapping in mParticle?",
+        "Setting up real-time personalization with Lytics?",
+        "Configure multi-channel identity resolution in Zeotap?"
+    ]
+}
+
 
 def format_time(seconds):
     """
@@ -31,6 +55,8 @@ def log_execution_time(func):
     """
     Decorator to log function execution time
 
+    The call is also recorded as a tracing span named after the function.
+
     Args:
         func: Function to decorate
 
@@ -38,9 +64,11 @@ def log_execution_time(func):
         wrapper: Decorated function
     """
 
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         start_time = time.time()
-        result = func(*args, **kwargs)
+        with span(func.__name__):
+            result = func(*args, **kwargs)
         end_time = time.time()
         elapsed_time = end_time - start_time
         logger.info(f"{func.__name__} executed in {format_time(elapsed_time)}")
@@ -72,22 +100,10 @@ def extract_cdp_name(query):
         query (str): User query
 
     Returns:
-        str or None: Extracted CDP name or None
+        str or None: First CDP mentioned in the query or None
     """
-    query = query.lower()
-    cdps = {
-        "segment": ["segment", "segments"],
-        "mparticle": ["mparticle", "m particle", "m-particle"],
-        "lytics": ["lytics", "lytic"],
-        "zeotap": ["zeotap", "zeo tap", "zeo-tap"]
-    }
-
-    for cdp, aliases in cdps.items():
-        for alias in aliases:
-            if alias in query:
-                return cdp
-
-    return None
+    cdps, _ = router.route(query)
+    return cdps[0] if cdps else None
 
 
 def determine_query_type(query):
@@ -100,24 +116,8 @@ def determine_query_type(query):
     Returns:
         str: Query type
     """
-    query = query.lower()
-
-    # Check for comparison keywords
-    comparison_keywords = ["compare", "comparison", "difference", "differences",
-                           "versus", "vs", "better", "best"]
-    for keyword in comparison_keywords:
-        if keyword in query:
-            return "Cross-CDP Comparison"
-
-    # Check for advanced configuration keywords
-    advanced_keywords = ["advanced", "configuration", "complex", "custom", "integrate",
-                         "integration", "setup", "implement", "implementation"]
-    for keyword in advanced_keywords:
-        if keyword in query:
-            return "Advanced Configuration"
-
-    # Default to how-to
-    return "How-to Question"
+    _, query_type = router.route(query)
+    return query_type
 
 
 def generate_example_questions(cdp=None):
@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import copy
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from datetime import datetime, timezone
+from utils.tracing import metrics, current_trace
+
+logger = logging.getLogger(__name__)
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# reason: queue_full, rate_limited
+DROPPED = metrics.counter("cdp_log_records_dropped_total", "Log records not written", ["reason"])
+
+# Attributes every LogRecord has; anything else was passed with ``extra=`` and is kept in JSON output
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id",
+                                                                                    "suppressed"}
+
+_lock = threading.Lock()
+_state = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for name in ("trace_id", "suppressed"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value if isinstance(value, (str, int, float, bool)) or value is None else repr(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let through at most ``burst`` records per call site every ``interval`` seconds
+
+    Applies to records at ``level`` and above, so a failing dependency logging
+    the same error for every request does not flood the output. The first
+    record let through after a suppressed run carries the number of records
+    suppressed in between.
+    """
+
+    def __init__(self, burst=5, interval=60.0, level=logging.ERROR):
+        """
+        Initialize the filter
+
+        Args:
+            burst (int): Records let through per call site and interval
+            interval (float): Window length in seconds
+            level (int): Lowest level rate-limited
+        """
+        super().__init__()
+        self.burst = max(1, burst)
+        self.interval = interval
+        self.level = level
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno < self.level:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        with self._lock:
+            start, count, suppressed = self._windows.get(key, (record.created, 0, 0))
+            if record.created - start >= self.interval:
+                start, count = record.created, 0
+            if count >= self.burst:
+                self._windows[key] = (start, count, suppressed + 1)
+                DROPPED.inc(reason="rate_limited")
+                return False
+            self._windows[key] = (start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the logging thread
+
+    Records are rendered to their final message here (so arguments are not
+    read later from another thread) and tagged with the active trace ID; a
+    full queue drops the record instead of waiting.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        if getattr(record, "suppressed", None):
+            record.msg = f"{record.message} ({record.suppressed} similar messages suppressed)"
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        trace = current_trace()
+        if trace is not None:
+            record.trace_id = trace.trace_id
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc(reason="queue_full")
+
+
+def parse_levels(spec):
+    """
+    Parse per-logger levels
+
+    Args:
+        spec (str): Comma-separated ``logger=LEVEL`` pairs, e.g. ``data.processors=WARNING,services=DEBUG``
+
+    Returns:
+        dict: Logger name to level name
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level=None, log_format=None, module_levels=None, log_file=None):
+    """
+    Configure logging for the process (once; later calls only adjust levels)
+
+    Records are put on a bounded in-memory queue by the logging thread and
+    written by a background listener thread, so writing a log line never adds
+    I/O latency to queries or crawls. Forked worker processes write directly,
+    as the listener does not run in them.
+
+    Args:
+        level (str, optional): Root level; defaults to LOG_LEVEL or INFO
+        log_format (str, optional): "text" or "json"; defaults to LOG_FORMAT or text
+        module_levels (dict, optional): Logger name to level; defaults to parsing LOG_LEVELS
+        log_file (str, optional): Also write to this file; defaults to LOG_FILE
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    if module_levels is None:
+        module_levels = parse_levels(os.getenv("LOG_LEVELS"))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    with _lock:
+        if _state:
+            return
+        log_format = (log_format or os.getenv("LOG_FORMAT", "text")).lower()
+        log_file = log_file or os.getenv("LOG_FILE")
+        formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+
+        handlers = [logging.StreamHandler(sys.stderr)]
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        rate_limit = RateLimitFilter(burst=int(os.getenv("LOG_ERROR_BURST", 5)),
+                                     interval=float(os.getenv("LOG_ERROR_INTERVAL_SECONDS", 60)))
+        queue_handler = NonBlockingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", 10000))))
+        queue_handler.addFilter(rate_limit)
+        listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        listener.start()
+        atexit.register(listener.stop)
+        _state.update(handlers=handlers, queue_handler=queue_handler, rate_limit=rate_limit, listener=listener)
+        logger.debug(f"Logging configured ({log_format}, level {level})")
+
+
+def _after_fork_in_child():
+    """Write directly in forked workers, whose copy of the queue has no listener"""
+    queue_handler = _state.get("queue_handler")
+    if queue_handler is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(queue_handler)
+    for handler in _state["handlers"]:
+        handler.addFilter(_state["rate_limit"])
+        root.addHandler(handler)
+    _state.clear()
+    # Marks the process as configured so setup_logging does not install another queue
+    _state["forked"] = True
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
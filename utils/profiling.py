@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import random
+import shutil
+import logging
+import functools
+import threading
+from datetime import datetime
+from utils.tracing import metrics, start_trace
+
+logger = logging.getLogger(__name__)
+
+# outcome: written, discarded (faster than the threshold), skipped (another profile was running)
+PROFILES = metrics.counter("cdp_profiles_total", "Profiled calls", ["name", "outcome"])
+
+PROFILE_MODES = {"cpu": ("cpu",), "memory": ("memory",), "all": ("cpu", "memory")}
+
+# Deepest call stack written to the collapsed-stack file
+MAX_STACK_DEPTH = 64
+
+# Allocation sites listed in the memory report
+TOP_ALLOCATIONS = 25
+
+
+def _function_label(func):
+    """Name a pstats function key as ``module.py:line(name)``"""
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def collapsed_stacks(stats):
+    """
+    Convert cProfile statistics into collapsed stacks for flame graphs
+
+    cProfile records caller/callee edges rather than full stacks, so each
+    function's time is split between its callers in proportion to the time
+    spent under each caller edge (as gprof-style tools do). The result is
+    exact for functions with a single caller and an approximation otherwise.
+
+    Args:
+        stats (pstats.Stats): Profile statistics
+
+    Returns:
+        list: ``"root;caller;function microseconds"`` lines, as read by flamegraph.pl and speedscope
+    """
+    children = {}
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    samples = {}
+
+    def walk(func, path, share):
+        own, total = stats.stats[func][2], stats.stats[func][3]
+        stack = path + (_function_label(func),)
+        if own * share > 0:
+            key = ";".join(stack)
+            samples[key] = samples.get(key, 0.0) + own * share
+        if len(stack) >= MAX_STACK_DEPTH or total <= 0:
+            return
+        for child, edge_time in children.get(func, ()):
+            # Recursive calls are folded into the frame already on the stack
+            if _function_label(child) in stack:
+                continue
+            child_total = stats.stats[child][3]
+            if child_total > 0 and edge_time > 0:
+                walk(child, stack, share * min(1.0, edge_time / child_total))
+
+    for root in roots:
+        walk(root, (), 1.0)
+    return [f"{stack} {int(seconds * 1e6)}" for stack, seconds in sorted(samples.items()) if seconds * 1e6 >= 1]
+
+
+class Profiler:
+    """
+    Opt-in per-call profiling with cProfile and tracemalloc
+
+    A sampled call runs under cProfile and/or tracemalloc inside a trace, so
+    the stage timings of the pipeline are recorded with it. Each profile is
+    written to its own directory under ``directory``: ``profile.pstats``
+    (load with ``pstats`` or snakeviz), ``profile.collapsed`` (flame graphs),
+    ``memory.txt`` (top allocation sites and peak) and ``meta.json`` (call
+    arguments, trace attributes and stage timings). Only the newest ``keep``
+    profiles are kept.
+
+    cProfile and tracemalloc are process-wide, so one call is profiled at a
+    time and calls arriving meanwhile run unprofiled. The memory report also
+    counts allocations made by other threads during the call.
+    """
+
+    def __init__(self, modes=("cpu",), sample_rate=1.0, directory="profiles", keep=100, min_ms=0.0):
+        """
+        Initialize the profiler
+
+        Args:
+            modes (tuple): "cpu" and/or "memory"
+            sample_rate (float): Fraction of calls profiled
+            directory (str): Directory the profiles are written to
+            keep (int): Profiles kept before the oldest are deleted
+            min_ms (float): Discard profiles of calls faster than this
+        """
+        self.cpu = "cpu" in modes
+        self.memory = "memory" in modes
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.keep = max(1, keep)
+        self.min_ms = min_ms
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    @classmethod
+    def from_env(cls):
+        """
+        Build a profiler from PROFILE_MODE ("cpu", "memory" or "all"), PROFILE_SAMPLE_RATE (default 1),
+        PROFILE_DIR (default "profiles"), PROFILE_KEEP (default 100) and PROFILE_MIN_MS (default 0)
+
+        Returns:
+            Profiler or None: None if PROFILE_MODE is unset or off
+        """
+        mode = os.getenv("PROFILE_MODE", "").lower()
+        if mode in ("", "0", "off", "none"):
+            return None
+        if mode not in PROFILE_MODES:
+            logger.warning(f"Unknown PROFILE_MODE '{mode}'; profiling disabled")
+            return None
+        return cls(modes=PROFILE_MODES[mode],
+                   sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", 1.0)),
+                   directory=os.getenv("PROFILE_DIR", "profiles"),
+                   keep=int(os.getenv("PROFILE_KEEP", 100)),
+                   min_ms=float(os.getenv("PROFILE_MIN_MS", 0)))
+
+    def sampled(self):
+        """Decide whether to profile the next call"""
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def run(self, name, func, arguments, args, kwargs):
+        """
+        Call a function under the profiler
+
+        Args:
+            name (str): Name of the profiled call
+            func (callable): Function to call
+            arguments (dict): Call arguments to record with the profile
+            args (tuple): Positional arguments
+            kwargs (dict): Keyword arguments
+
+        Returns:
+            The function's result
+        """
+        if not self._lock.acquire(blocking=False):
+            PROFILES.inc(name=name, outcome="skipped")
+            return func(*args, **kwargs)
+        # Loaded on the first profiled call, so processes that never profile do not import them
+        import cProfile
+        import tracemalloc
+
+        try:
+            # Tracing started elsewhere (e.g. PYTHONTRACEMALLOC) is left running afterwards
+            started_tracing = self.memory and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            elif self.memory:
+                tracemalloc.reset_peak()
+            with start_trace(name) as trace:
+                profile = cProfile.Profile() if self.cpu else None
+                if profile is not None:
+                    try:
+                        profile.enable()
+                    except ValueError as e:
+                        # Another profiler (e.g. a debugger) is active
+                        logger.warning(f"Could not start cProfile: {str(e)}")
+                        profile = None
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    if profile is not None:
+                        profile.disable()
+                    memory = None
+                    if self.memory:
+                        memory = (tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[1])
+                        if started_tracing:
+                            tracemalloc.stop()
+                    if elapsed_ms < self.min_ms:
+                        PROFILES.inc(name=name, outcome="discarded")
+                    else:
+                        self._write(name, elapsed_ms, arguments, trace, profile, memory)
+        finally:
+            self._lock.release()
+
+    def _write(self, name, elapsed_ms, arguments, trace, profile, memory):
+        """Write one profile directory and rotate old ones"""
+        import pstats
+        import tracemalloc
+
+        self._sequence += 1
+        path = os.path.join(self.directory,
+                            f"{datetime.now():%Y%m%d-%H%M%S}-{self._sequence:04d}-{name}-{trace.trace_id}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            meta = {
+                "name": name,
+                "elapsed_ms": elapsed_ms,
+                "arguments": arguments,
+                "trace_id": trace.trace_id,
+                "attributes": {key: value if isinstance(value, (str, int, float, bool)) or value is None
+                               else repr(value) for key, value in trace.attributes.items()},
+                "stage_timings_ms": trace.stage_timings(),
+            }
+            if profile is not None:
+                profile.dump_stats(os.path.join(path, "profile.pstats"))
+                stats = pstats.Stats(profile)
+                with open(os.path.join(path, "profile.collapsed"), "w", encoding="utf-8") as f:
+                    f.write("\n".join(collapsed_stacks(stats)) + "\n")
+            if memory is not None:
+                snapshot, peak = memory
+                meta["peak_memory_bytes"] = peak
+                snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+                with open(os.path.join(path, "memory.txt"), "w", encoding="utf-8") as f:
+                    f.write(f"Peak traced memory: {peak / 1024:.1f} KiB\n\n")
+                    for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                        f.write(f"{stat}\n")
+            with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            PROFILES.inc(name=name, outcome="written")
+            logger.info(f"Wrote {name} profile ({elapsed_ms:.0f}ms) to {path}")
+        except Exception as e:
+            # A failed dump must not fail the profiled call
+            logger.error(f"Error writing profile to {path}: {str(e)}")
+            return
+        self._rotate()
+
+    def _rotate(self):
+        """Delete the oldest profile directories beyond ``keep``"""
+        try:
+            entries = sorted(entry for entry in os.listdir(self.directory)
+                             if os.path.isdir(os.path.join(self.directory, entry)))
+        except OSError:
+            return
+        for entry in entries[:-self.keep]:
+            shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
+
+
+_profiler = Profiler.from_env()
+
+
+def configure(profiler):
+    """
+    Replace the active profiler
+
+    Args:
+        profiler (Profiler or None): New profiler; None disables profiling
+    """
+    global _profiler
+    _profiler = profiler
+
+
+def _describe(value):
+    """Short JSON-safe form of a call argument"""
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = value if isinstance(value, str) else repr(value)
+    return text if len(text) <= 200 else text[:200] + "..."
+
+
+def profiled(func):
+    """
+    Decorator to profile sampled calls when profiling is enabled (see ``Profiler.from_env``)
+
+    When disabled, the only cost is one check of the active profiler per call.
+
+    Args:
+        func: Function to decorate
+
+    Returns:
+        wrapper: Decorated function
+    """
+    signature = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal signature
+        profiler = _profiler
+        if profiler is None or not profiler.sampled():
+            return func(*args, **kwargs)
+        if signature is None:
+            import inspect
+            signature = inspect.signature(func)
+        bound = signature.bind_partial(*args, **kwargs)
+        arguments = {key: _describe(value) for key, value in bound.arguments.items() if key != "self"}
+        return profiler.run(func.__name__, func, arguments, args, kwargs)
+
+    return wrapper
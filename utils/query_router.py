@@ -0,0 +1,167 @@
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Aliases by CDP. Aliases in CASE_SENSITIVE_ALIASES only count with their
+# capitalization, so "audience segment" does not route to Segment.
+CDP_ALIASES = {
+    "segment": ["Segment", "Segments", "segment.com", "segment.io", "twilio segment"],
+    "mparticle": ["mparticle", "m particle", "m-particle"],
+    "lytics": ["lytics", "lytic"],
+    "zeotap": ["zeotap", "zeo tap", "zeo-tap"],
+}
+CASE_SENSITIVE_ALIASES = {"Segment", "Segments"}
+
+# Keywords by query type, in priority order
+QUERY_TYPE_KEYWORDS = {
+    "Cross-CDP Comparison": ["compare", "compared", "comparing", "comparison", "difference", "differences",
+                             "differ", "versus", "vs", "better", "best", "similarities"],
+    "Advanced Configuration": ["advanced", "configuration", "configure", "complex", "custom", "integrate",
+                               "integration", "setup", "implement", "implementation", "server-side",
+                               "api", "webhook", "webhooks"],
+}
+DEFAULT_QUERY_TYPE = "How-to Question"
+
+
+class AhoCorasick:
+    """
+    Multi-pattern matcher that finds every pattern in a single pass over the text
+
+    Patterns are compiled once into a trie with failure links; matching
+    is linear in the text length regardless of the number of patterns.
+    Matching is case-insensitive and only whole words are reported.
+    """
+
+    def __init__(self, patterns):
+        """
+        Compile the automaton
+
+        Args:
+            patterns (dict): Value reported for each pattern string
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+
+        for pattern, value in patterns.items():
+            state = 0
+            for char in pattern.lower():
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append((len(pattern), pattern, value))
+
+        # Breadth-first pass to set failure links and merge outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text):
+        """
+        Find whole-word pattern occurrences
+
+        Args:
+            text (str): Text to search
+
+        Returns:
+            list: ``(start, pattern, value)`` for every match, in order of their end position
+        """
+        lowered = text.lower()
+        matches = []
+        state = 0
+        for end, char in enumerate(lowered, 1):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, pattern, value in self._output[state]:
+                start = end - length
+                if start > 0 and (lowered[start - 1].isalnum() or lowered[start - 1] == "_"):
+                    continue
+                if end < len(lowered) and (lowered[end].isalnum() or lowered[end] == "_"):
+                    continue
+                matches.append((start, pattern, value))
+        return matches
+
+
+class QueryRouter:
+    """Detect the CDPs and the query type a question is about"""
+
+    def __init__(self, cdp_aliases=None, query_type_keywords=None):
+        """
+        Initialize the router
+
+        Args:
+            cdp_aliases (dict, optional): Aliases by CDP name; defaults to CDP_ALIASES
+            query_type_keywords (dict, optional): Keywords by query type; defaults to QUERY_TYPE_KEYWORDS
+        """
+        cdp_aliases = cdp_aliases or CDP_ALIASES
+        query_type_keywords = query_type_keywords or QUERY_TYPE_KEYWORDS
+        self.query_types = list(query_type_keywords)
+
+        patterns = {}
+        for cdp, aliases in cdp_aliases.items():
+            for alias in aliases:
+                patterns[alias] = ("cdp", cdp)
+        for query_type, keywords in query_type_keywords.items():
+            for keyword in keywords:
+                patterns.setdefault(keyword, ("type", query_type))
+        self._matcher = AhoCorasick(patterns)
+
+    def route(self, query):
+        """
+        Detect the CDPs and query type of a query
+
+        Args:
+            query (str): User query
+
+        Returns:
+            tuple: (list of CDP names in order of mention, query type)
+        """
+        cdps = []
+        query_types = set()
+        for start, pattern, (kind, value) in self._matcher.find(query or ""):
+            if kind == "cdp":
+                if pattern in CASE_SENSITIVE_ALIASES and query[start:start + len(pattern)] != pattern:
+                    continue
+                if value not in cdps:
+                    cdps.append(value)
+            else:
+                query_types.add(value)
+
+        query_type = next((name for name in self.query_types if name in query_types), DEFAULT_QUERY_TYPE)
+        return cdps, query_type
+
+    def select_cdps(self, query):
+        """
+        Choose the CDP partitions to search for a query
+
+        Comparisons that name a single CDP still need the others, so they
+        search everything, as do queries that name no CDP.
+
+        Args:
+            query (str): User query
+
+        Returns:
+            list or None: CDP names to search, or None for all
+        """
+        cdps, query_type = self.route(query)
+        if not cdps or (query_type == "Cross-CDP Comparison" and len(cdps) < 2):
+            return None
+        return cdps
+
+
+# Shared router with the default aliases and keywords
+router = QueryRouter()
@@ -0,0 +1,243 @@
+import logging
+import threading
+from concurrent.futures import Future
+from utils.tracing import metrics
+
+logger = logging.getLogger(__name__)
+
+# role is "leader" for calls that ran the work and "follower" for calls that shared it
+COALESCED_CALLS = metrics.counter("cdp_coalesced_calls_total", "Calls by single-flight group and role",
+                                  ["group", "role"])
+
+
+def coalescing_key(*parts):
+    """
+    Build a key under which equivalent calls are coalesced
+
+    Text parts are lowercased with whitespace collapsed and trailing
+    punctuation removed, so "How do I track events?" and
+    "how do i  track events" share one key.
+
+    Args:
+        *parts: Strings (or None) identifying the call
+
+    Returns:
+        tuple: Normalized key
+    """
+    return tuple(" ".join(part.lower().split()).rstrip("?!. ") if isinstance(part, str) else part
+                 for part in parts)
+
+
+class _Call:
+    """An in-flight call whose result is shared"""
+
+    def __init__(self):
+        self.future = Future()
+        # A running future cannot be cancelled, so an abandoned waiter never cancels it for the others
+        self.future.set_running_or_notify_cancel()
+
+
+class _StreamCall:
+    """An in-flight stream whose chunks are replayed to every follower"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.finished = False
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into one execution
+
+    While a call for a key is in flight, further calls with the same key
+    wait for it and receive its result (or exception) instead of running
+    the work again. Completed results are not cached; the next call after
+    completion runs again. Callers are threads (``do``, ``stream``) or
+    asyncio tasks (``do_async``); threads and tasks asking for the same key
+    share one call, and waiting tasks do not hold a thread.
+    """
+
+    def __init__(self, group):
+        """
+        Initialize the group
+
+        Args:
+            group (str): Name used in the coalescing counters
+        """
+        self.group = group
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._streams = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Run ``func`` once for all concurrent callers with the same key
+
+        Args:
+            key (hashable): Coalescing key
+            func (callable): Work to run
+            *args: Positional arguments for ``func``
+            **kwargs: Keyword arguments for ``func``
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from another caller's call
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_CALLS.inc(group=self.group, role="follower")
+            return call.future.result(), True
+
+        COALESCED_CALLS.inc(group=self.group, role="leader")
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+        self._finish(key, call, result=result)
+        return result, False
+
+    async def do_async(self, key, func, *args, **kwargs):
+        """
+        Await ``func`` once for all concurrent callers with the same key
+
+        Waiting for an in-flight call awaits its future instead of blocking a
+        thread. The work runs in its own task, so a cancelled caller does not
+        cancel it for the others.
+
+        Args:
+            key (hashable): Coalescing key, shared with ``do``
+            func (callable): Function returning an awaitable (e.g. ``loop.run_in_executor``)
+            *args: Positional arguments for ``func``
+            **kwargs: Keyword arguments for ``func``
+
+        Returns:
+            tuple: (result, shared) where shared is True if the result came from another caller's call
+        """
+        # Only the HTTP API awaits calls; everything else imports this module without asyncio
+        import asyncio
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_CALLS.inc(group=self.group, role="follower")
+            return await asyncio.wrap_future(call.future), True
+
+        COALESCED_CALLS.inc(group=self.group, role="leader")
+        try:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+        except BaseException as e:
+            self._finish(key, call, error=e)
+            raise
+
+        def finish(task):
+            if task.cancelled():
+                self._finish(key, call, error=asyncio.CancelledError())
+            elif task.exception() is not None:
+                self._finish(key, call, error=task.exception())
+            else:
+                self._finish(key, call, result=task.result())
+
+        task.add_done_callback(finish)
+        return await asyncio.shield(task), False
+
+    def _finish(self, key, call, result=None, error=None):
+        """Publish the outcome of a call to its waiters and let the next call for the key run again"""
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            call.future.set_exception(error)
+        else:
+            call.future.set_result(result)
+
+    def stream(self, key, func, *args, **kwargs):
+        """
+        Run the generator ``func`` once for all concurrent callers with the same key
+
+        Followers receive every chunk from the start, including chunks
+        produced before they joined. If the leader stops consuming early
+        while followers are attached, it keeps draining the generator for them.
+
+        Args:
+            key (hashable): Coalescing key
+            func (callable): Generator function producing the chunks
+            *args: Positional arguments for ``func``
+            **kwargs: Keyword arguments for ``func``
+
+        Yields:
+            Chunks produced by the generator
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None
+            if leader:
+                call = self._streams[key] = _StreamCall()
+            else:
+                with call.condition:
+                    call.followers += 1
+
+        if leader:
+            COALESCED_CALLS.inc(group=self.group, role="leader")
+            yield from self._lead_stream(key, call, func(*args, **kwargs))
+            return
+
+        COALESCED_CALLS.inc(group=self.group, role="follower")
+        index = 0
+        while True:
+            with call.condition:
+                while index >= len(call.chunks) and not call.finished:
+                    call.condition.wait()
+                if index < len(call.chunks):
+                    chunk = call.chunks[index]
+                    index += 1
+                elif call.error is not None:
+                    raise call.error
+                else:
+                    return
+            yield chunk
+
+    def _lead_stream(self, key, call, generator):
+        """Produce the chunks of a stream, publishing each one to the followers"""
+        def publish(chunk):
+            with call.condition:
+                call.chunks.append(chunk)
+                call.condition.notify_all()
+
+        try:
+            for chunk in generator:
+                publish(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The leader's consumer went away; finish the stream for the followers
+            with call.condition:
+                has_followers = call.followers > 0
+            if has_followers:
+                try:
+                    for chunk in generator:
+                        publish(chunk)
+                except BaseException as e:
+                    # Followers must see the failure rather than a stream that just ends
+                    call.error = e
+                    logger.error(f"Error finishing stream for {self.group} followers: {str(e)}")
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            generator.close()
+            with self._lock:
+                self._streams.pop(key, None)
+            with call.condition:
+                call.finished = True
+                call.condition.notify_all()
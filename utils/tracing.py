@@ -0,0 +1,312 @@
+import time
+import uuid
+import bisect
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from sub-millisecond retrieval up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label_value(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names, label_values, extra=None):
+    """Render a Prometheus label set"""
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing counter with optional labels"""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Increment the counter
+
+        Args:
+            amount (float): Amount to add
+            **labels: Label values, keyed by label name
+        """
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """Return the current value for a label set"""
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        return self._values.get(key, 0)
+
+    def snapshot(self):
+        """Return a copy of all label sets and values"""
+        with self._lock:
+            return dict(self._values)
+
+    def export(self):
+        """Render the counter in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.snapshot().items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram with optional labels"""
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record an observation
+
+        Args:
+            value (float): Observed value (seconds for latencies)
+            **labels: Label values, keyed by label name
+        """
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self):
+        """Return a copy of all series"""
+        with self._lock:
+            return {key: {"counts": list(s["counts"]), "sum": s["sum"], "count": s["count"]}
+                    for key, s in self._series.items()}
+
+    def quantile(self, q, **labels):
+        """
+        Estimate a quantile from the bucket counts
+
+        Args:
+            q (float): Quantile between 0 and 1
+            **labels: Label values, keyed by label name
+
+        Returns:
+            float or None: Upper bound of the bucket holding the quantile
+        """
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        series = self.snapshot().get(key)
+        if not series or not series["count"]:
+            return None
+        target = q * series["count"]
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+    def export(self):
+        """Render the histogram in Prometheus text format"""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.snapshot().items()):
+            running = 0
+            for bound, count in zip(self.buckets, series["counts"]):
+                running += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', bound))} {running}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process registry of counters and histograms"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description="", label_names=()):
+        """Get or create a counter"""
+        return self._get_or_create(Counter, name, description, label_names)
+
+    def histogram(self, name, description="", label_names=(), buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram"""
+        return self._get_or_create(Histogram, name, description, label_names, buckets=buckets)
+
+    def _get_or_create(self, cls, name, description, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, label_names, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as {type(metric).__name__}")
+            return metric
+
+    def export_prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str: Metrics text
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in sorted(metrics, key=lambda m: m.name):
+            lines.extend(metric.export())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_LATENCY = metrics.histogram("cdp_stage_duration_seconds", "Latency of query pipeline stages", ["stage"])
+REQUESTS = metrics.counter("cdp_requests_total", "Queries handled", ["status"])
+CACHE_HITS = metrics.counter("cdp_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = metrics.counter("cdp_cache_misses_total", "Cache misses", ["cache"])
+TOKENS_IN = metrics.counter("cdp_llm_tokens_in_total", "Prompt tokens sent to the LLM")
+TOKENS_OUT = metrics.counter("cdp_llm_tokens_out_total", "Completion tokens received from the LLM")
+DOCS_RETRIEVED = metrics.counter("cdp_docs_retrieved_total", "Documents retrieved for queries")
+
+
+class Trace:
+    """Spans recorded for a single request"""
+
+    def __init__(self, name, **attributes):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = dict(attributes)
+        self.spans = []
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def add_span(self, name, start, duration, **attributes):
+        """Record a finished span (start is a perf_counter timestamp)"""
+        self.spans.append({
+            "name": name,
+            "offset_ms": (start - self._start) * 1000,
+            "duration_ms": duration * 1000,
+            "attributes": attributes,
+        })
+
+    def stage_timings(self):
+        """Return total milliseconds per span name"""
+        timings = {}
+        for s in self.spans:
+            timings[s["name"]] = timings.get(s["name"], 0.0) + s["duration_ms"]
+        return timings
+
+    def to_dict(self):
+        """Return the trace as a JSON-serializable dictionary"""
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration * 1000 if self.duration is not None else None,
+            "attributes": self.attributes,
+            "spans": list(self.spans),
+        }
+
+
+_current_trace = contextvars.ContextVar("cdp_current_trace", default=None)
+_recent_traces = deque(maxlen=50)
+
+
+def current_trace():
+    """Return the trace active in this context, if any"""
+    return _current_trace.get()
+
+
+def recent_traces():
+    """Return recently finished traces, newest last"""
+    return list(_recent_traces)
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    """
+    Start a request trace, or join the one already active in this context
+
+    Args:
+        name (str): Trace name
+        **attributes: Attributes attached to the trace
+
+    Yields:
+        Trace: The active trace
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.attributes.update(attributes)
+        yield trace
+        return
+
+    trace = Trace(name, **attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace._start
+        _recent_traces.append(trace)
+        logger.debug(f"Trace {trace.trace_id} {name}: {trace.stage_timings()}")
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a pipeline stage
+
+    The duration is always recorded in the stage latency histogram and, when a
+    trace is active, appended to it as a span.
+
+    Args:
+        name (str): Stage name
+        **attributes: Attributes attached to the span
+
+    Yields:
+        dict: Mutable span attributes, for values only known at the end of the stage
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_LATENCY.observe(duration, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, **attributes)
+
+
+def estimate_tokens(text):
+    """
+    Roughly estimate the token count of a text (about 4 characters per token)
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        int: Estimated token count
+    """
+    return (len(text) + 3) // 4 if text else 0